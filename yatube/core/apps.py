@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     """Создание приложения core."""
     name = 'core'
+
+    def ready(self):
+        from django.utils.module_loading import autodiscover_modules
+
+        from . import auth, mail  # noqa: F401
+        from .cache.queryset import connect_invalidation
+        connect_invalidation()
+        # Регистрирует задачи из tasks.py всех приложений.
+        autodiscover_modules('tasks')
@@ -0,0 +1,146 @@
+import hashlib
+
+from core.cache.tiered import tiered_cache
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+User = get_user_model()
+
+# Поля пользователя, которые лежат в кеше. Хеш пароля и права сюда
+# не входят: остальные поля модели подгрузятся из базы при обращении.
+USER_CACHE_FIELDS = (
+    'id', 'username', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser',
+)
+
+
+def session_key_hash(session_key):
+    # Сам ключ сессии в кеш не кладем: он равносилен паролю.
+    return hashlib.sha256(session_key.encode()).hexdigest()
+
+
+def session_cache_key(session_key):
+    return f'auth:session:{session_key_hash(session_key)}'
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_session(session_key):
+    cache.delete(session_cache_key(session_key))
+
+
+def user_record(user):
+    """Компактная запись пользователя для кеша.
+
+    Вместо хеша пароля хранится только хеш для проверки сессии.
+    """
+    fields = {name: getattr(user, name) for name in USER_CACHE_FIELDS}
+    return fields, user.get_session_auth_hash()
+
+
+def cache_user(user):
+    record = user_record(user)
+    tiered_cache.set(
+        user_cache_key(user.pk), record, settings.AUTH_USER_CACHE_TIMEOUT
+    )
+    return record
+
+
+def load_user(user_id, backend_path):
+    """Пользователь из двухуровневого кеша или через бэкенд.
+
+    Возвращает пару: пользователя, собранного из записи кеша
+    (остальные поля отложены), и хеш для проверки сессии.
+    """
+    record = tiered_cache.get(user_cache_key(user_id))
+    if record is None:
+        user = auth.load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return None, None
+        record = cache_user(user)
+    fields, session_hash = record
+    user = User.from_db(DEFAULT_DB_ALIAS, list(fields), [
+        fields.get(field.attname, DEFERRED)
+        for field in User._meta.concrete_fields
+    ])
+    user.backend = backend_path
+    return user, session_hash
+
+
+def session_timeout(session):
+    """Сколько держать привязку сессии: не дольше жизни ее строки."""
+    expire_date = session.model.objects.filter(
+        session_key=session.session_key
+    ).values_list('expire_date', flat=True).first()
+    if expire_date is None:
+        return 0
+    left = int((expire_date - timezone.now()).total_seconds())
+    return min(settings.AUTH_SESSION_CACHE_TIMEOUT, left)
+
+
+def get_user(request):
+    """Возвращает пользователя запроса, по возможности не читая сессию.
+
+    Для ключа сессии из cookie в кеше лежат id пользователя, бэкенд
+    и хеш пароля на момент входа, поэтому ни сессия, ни пользователь
+    из базы не читаются. Запись живет не дольше строки сессии в базе.
+    Если хеш пароля разошелся, решение принимает
+    обычный django.contrib.auth.get_user: он и разлогинит сессию.
+    """
+    session_key = request.session.session_key
+    if session_key:
+        key = session_cache_key(session_key)
+        entry = cache.get(key)
+        if entry is not None:
+            user_id, backend_path, session_hash = entry
+            if backend_path in settings.AUTHENTICATION_BACKENDS:
+                user, user_hash = load_user(user_id, backend_path)
+                if user is not None and constant_time_compare(
+                    session_hash, user_hash
+                ):
+                    return user
+            cache.delete(key)
+    user = auth.get_user(request)
+    session_key = request.session.session_key
+    if user.is_authenticated and session_key:
+        timeout = session_timeout(request.session)
+        if timeout > 0:
+            cache.set(
+                session_cache_key(session_key),
+                (
+                    user.pk,
+                    request.session[auth.BACKEND_SESSION_KEY],
+                    user.get_session_auth_hash(),
+                ),
+                timeout,
+            )
+            cache_user(user)
+    return user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Сбрасывает закешированного пользователя во всех процессах.
+
+    После смены пароля хеш в записях сессий перестает совпадать,
+    и чужие сессии пользователя проверяются заново.
+    """
+    tiered_cache.delete(user_cache_key(instance.pk))
+
+
+@receiver(post_delete, sender=Session)
+def forget_deleted_session(sender, instance, **kwargs):
+    """Удаленная строка сессии больше не аутентифицирует."""
+    forget_session(instance.session_key)
@@ -0,0 +1,116 @@
+import hashlib
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+
+VERSION_KEY = 'qc:ver:{}'
+DEFAULT = object()
+
+
+def table_versions(tables):
+    """Возвращает текущие версии таблиц, заводя недостающие."""
+    keys = {VERSION_KEY.format(table): table for table in tables}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        # Версия, вытесненная из кеша, не должна вернуться к старому
+        # значению, поэтому новая начинается с текущего времени.
+        cache.add(key, int(time.time() * 1000), None)
+        versions[key] = cache.get(key)
+    return [versions[key] for key in sorted(versions)]
+
+
+def bump_table_version(table):
+    key = VERSION_KEY.format(table)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), None)
+
+
+def invalidate_model(sender, **kwargs):
+    """Инвалидирует закешированные запросы к таблице модели."""
+    table = sender._meta.db_table
+    bump_table_version(table)
+    # Повторно — после коммита: иначе запрос, выполненный до коммита,
+    # мог закешировать старые строки уже под новой версией.
+    transaction.on_commit(lambda: bump_table_version(table))
+
+
+def connect_invalidation():
+    """Подключает инвалидацию для моделей из QUERY_CACHE_MODELS."""
+    for label in settings.QUERY_CACHE_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(invalidate_model, sender=model,
+                          dispatch_uid=f'query_cache_save_{label}')
+        post_delete.connect(invalidate_model, sender=model,
+                            dispatch_uid=f'query_cache_delete_{label}')
+
+
+class CachingQuerySet(models.QuerySet):
+    """QuerySet, результаты которого можно закешировать вызовом cache().
+
+    Ключ строится по SQL-запросу, его параметрам и версиям всех таблиц
+    запроса; любое сохранение или удаление строки такой таблицы меняет
+    версию, и старые результаты больше не находятся. Массовые update()
+    и delete() сигналов не шлют — после них нужно вызвать
+    bump_table_version().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache_timeout = None
+
+    def cache(self, timeout=DEFAULT):
+        """Включает кеширование; timeout по умолчанию QUERY_CACHE_TIMEOUT."""
+        clone = self._chain()
+        clone._cache_timeout = (
+            settings.QUERY_CACHE_TIMEOUT if timeout is DEFAULT else timeout
+        )
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._cache_timeout = self._cache_timeout
+        return clone
+
+    def _cache_key(self, kind):
+        try:
+            sql, params = self.query.get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return None
+        tables = {alias.table_name for alias in self.query.alias_map.values()}
+        raw = repr((
+            kind, self.db, self._iterable_class.__name__, sql, params,
+            table_versions(tables),
+        ))
+        return 'qc:' + hashlib.md5(raw.encode()).hexdigest()
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._cache_timeout is not None:
+            key = self._cache_key('rows')
+            cached = cache.get(key) if key else None
+            if cached is not None:
+                self._result_cache = cached
+                self._prefetch_done = True
+                return
+            super()._fetch_all()
+            if key:
+                cache.set(key, self._result_cache, self._cache_timeout)
+            return
+        super()._fetch_all()
+
+    def count(self):
+        if self._result_cache is not None or self._cache_timeout is None:
+            return super().count()
+        key = self._cache_key('count')
+        count = cache.get(key) if key else None
+        if count is None:
+            count = super().count()
+            if key:
+                cache.set(key, count, self._cache_timeout)
+        return count
@@ -0,0 +1,261 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+# Время последнего чтения копится в памяти процесса и пишется в базу
+# только при вытеснении, чтобы чтения не превращались в запись. В базе
+# оно обновляется, если сдвинулось хотя бы на секунду.
+ACCESS_RESOLUTION = 1
+# Сколько прочитанных ключей помнить до следующего вытеснения.
+MAX_TOUCHED = 4096
+# Проверять переполнение раз в столько записей.
+CULL_EVERY = 64
+# SQLite ограничивает число параметров в одном запросе.
+MAX_VARIABLES = 900
+
+
+@contextmanager
+def immediate(connection):
+    """Транзакция, которая сразу берет блокировку на запись."""
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    else:
+        connection.execute('COMMIT')
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite в режиме WAL, общий для всех процессов сервера.
+
+    В отличие от LocMemCache, запись или удаление ключа в одном воркере
+    сразу видны остальным, а память не дублируется. Целые числа хранятся
+    как INTEGER, поэтому incr() атомарен. Размер ограничивается
+    MAX_ENTRIES и MAX_SIZE (в байтах): первыми вытесняются давно
+    не читавшиеся ключи. Сами чтения в файл не пишут.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 0))
+        self._busy_timeout = int(options.get('BUSY_TIMEOUT', 5000))
+        self._local = threading.local()
+        self._writes = 0
+        self._touched = {}
+
+    @property
+    def _connection(self):
+        # После fork соединение родителя использовать нельзя.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=self._busy_timeout / 1000,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA busy_timeout={self._busy_timeout}')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    @staticmethod
+    def _encode(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fetch(self, keys):
+        """Читает живые значения и запоминает чтение для LRU."""
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), MAX_VARIABLES):
+            chunk = keys[start:start + MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._connection.execute(
+                f'SELECT key, value FROM cache WHERE key IN ({placeholders})'
+                ' AND (expires IS NULL OR expires > ?)',
+                (*chunk, now),
+            )
+            found.update(
+                (key, self._decode(value)) for key, value in rows
+            )
+        for key in found:
+            if key in self._touched or len(self._touched) < MAX_TOUCHED:
+                self._touched[key] = now
+        return found
+
+    def _flush_accessed(self, connection):
+        """Записывает накопленные времена чтения перед вытеснением."""
+        touched, self._touched = self._touched, {}
+        connection.executemany(
+            'UPDATE cache SET accessed = ? WHERE key = ? AND accessed < ?',
+            [
+                (accessed, key, accessed - ACCESS_RESOLUTION)
+                for key, accessed in touched.items()
+            ],
+        )
+
+    def _store(self, connection, key, value, timeout, mode='REPLACE'):
+        encoded = self._encode(value)
+        size = len(encoded) if isinstance(encoded, bytes) else 8
+        cursor = connection.execute(
+            f'INSERT OR {mode} INTO cache'
+            ' (key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+            (key, encoded, self.get_backend_timeout(timeout), time.time(),
+             size),
+        )
+        return cursor.rowcount
+
+    def _after_write(self, count=1):
+        self._writes += count
+        if self._writes >= CULL_EVERY:
+            self._writes = 0
+            self._cull()
+
+    def _cull(self):
+        """Удаляет просроченные ключи, затем вытесняет самые старые."""
+        with immediate(self._connection) as connection:
+            self._flush_accessed(connection)
+            connection.execute(
+                'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+            )
+            count, size = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache'
+            ).fetchone()
+            excess = 0
+            if count > self._max_entries:
+                # Как и в LocMemCache, CULL_FREQUENCY = 0 очищает весь кеш,
+                # а N — вытесняет еще каждый N-й ключ сверх лимита.
+                excess = count - self._max_entries + (
+                    self._max_entries // self._cull_frequency
+                    if self._cull_frequency else self._max_entries
+                )
+            if excess:
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache'
+                    ' ORDER BY accessed LIMIT ?)', (excess,),
+                )
+            if self._max_size and size > self._max_size:
+                # Вытесняем старые ключи, пока не уложимся в лимит
+                # с запасом в четверть, чтобы не чистить на каждой записи.
+                target = size - self._max_size * 3 // 4
+                connection.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    ' SELECT key FROM (SELECT key, size, SUM(size) OVER'
+                    ' (ORDER BY accessed, key) AS total FROM cache)'
+                    ' WHERE total - size < ?)',
+                    (target,),
+                )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with immediate(self._connection) as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = self._store(connection, key, value, timeout, 'IGNORE')
+        if added:
+            self._after_write()
+        return bool(added)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._store(self._connection, key, value, timeout)
+        self._after_write()
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        )
+        return bool(cursor.rowcount)
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        found = self._fetch(list(made))
+        return {made[key]: value for key, value in found.items()}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with immediate(self._connection) as connection:
+            for key, value in data.items():
+                self._store(
+                    connection, self._key(key, version), value, timeout
+                )
+        self._after_write(len(data))
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with immediate(self._connection) as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with immediate(self._connection) as connection:
+            updated = connection.execute(
+                'UPDATE cache SET value = value + ? WHERE key = ?'
+                " AND typeof(value) = 'integer'"
+                ' AND (expires IS NULL OR expires > ?)',
+                (delta, key, time.time()),
+            ).rowcount
+            if not updated:
+                raise ValueError("Key '%s' not found" % key)
+            return connection.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)
+            ).fetchone()[0]
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
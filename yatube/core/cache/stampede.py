@@ -0,0 +1,124 @@
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+METRICS_PREFIX = 'stampede:'
+# hit — значение свежее; recompute — пересчитано после промаха или
+# истечения; early_refresh — пересчитано заранее (вероятностно);
+# stale_served — отдано устаревшее значение, пока его пересчитывает
+# другой запрос; waited — дождались значения, посчитанного другим.
+EVENTS = ('hit', 'recompute', 'early_refresh', 'stale_served', 'waited')
+WAIT_STEP = 0.05
+
+
+class Metrics:
+    """Счетчики событий, которые копятся в процессе и сбрасываются в кеш.
+
+    Писать в общий кеш на каждое попадание слишком дорого, поэтому
+    счетчики увеличиваются атомарно через incr() раз в несколько секунд.
+    """
+
+    def __init__(self):
+        self.counter = Counter()
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def add(self, event, cache):
+        with self.lock:
+            self.counter[event] += 1
+            if (time.monotonic() - self.flushed_at
+                    < settings.STAMPEDE_METRICS_INTERVAL):
+                return
+            counter, self.counter = self.counter, Counter()
+            self.flushed_at = time.monotonic()
+        self.flush(cache, counter)
+
+    @staticmethod
+    def flush(cache, counter):
+        for event, count in counter.items():
+            key = METRICS_PREFIX + event
+            cache.add(key, 0, None)
+            cache.incr(key, count)
+
+    def totals(self, cache):
+        """Возвращает накопленные во всех процессах значения счетчиков."""
+        with self.lock:
+            counter, self.counter = self.counter, Counter()
+        self.flush(cache, counter)
+        stored = cache.get_many([METRICS_PREFIX + event for event in EVENTS])
+        totals = {
+            event: stored.get(METRICS_PREFIX + event, 0) for event in EVENTS
+        }
+        totals['avoided'] = totals['stale_served'] + totals['waited']
+        return totals
+
+
+metrics = Metrics()
+
+
+def get_or_recompute(key, recompute, timeout, cache=default_cache,
+                     beta=1.0):
+    """Возвращает значение из кеша, защищая его пересчет от лавины.
+
+    * Пересчет выполняет только запрос, захвативший блокировку
+      (cache.add), остальные получают устаревшее значение или немного
+      ждут, если значения нет совсем.
+    * Свежее значение может быть пересчитано заранее с вероятностью,
+      растущей к концу его жизни и пропорциональной времени пересчета
+      (алгоритм XFetch), так что к истечению оно уже обновлено.
+    * После истечения timeout значение хранится еще
+      STAMPEDE_STALE_TIMEOUT секунд и отдается, пока идет пересчет.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        value, expires, delta = entry
+        if expires is None or (
+            now - delta * beta * math.log(1 - random.random()) < expires
+        ):
+            metrics.add('hit', cache)
+            return value
+        event = 'recompute' if now >= expires else 'early_refresh'
+        if not _acquire(key, cache):
+            metrics.add('stale_served', cache)
+            return value
+        return _recompute(key, recompute, timeout, cache, event)
+    if _acquire(key, cache):
+        return _recompute(key, recompute, timeout, cache, 'recompute')
+    # Значение считает другой запрос: ждем его, но недолго.
+    deadline = time.monotonic() + settings.STAMPEDE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None:
+            metrics.add('waited', cache)
+            return entry[0]
+    metrics.add('recompute', cache)
+    return recompute()
+
+
+def _acquire(key, cache):
+    return cache.add(f'{key}:lock', 1, settings.STAMPEDE_LOCK_TIMEOUT)
+
+
+def _recompute(key, recompute, timeout, cache, event):
+    try:
+        started = time.time()
+        value = recompute()
+        now = time.time()
+        expires = None if timeout is None else now + timeout
+        cache.set(
+            key,
+            (value, expires, now - started),
+            None if timeout is None
+            else timeout + settings.STAMPEDE_STALE_TIMEOUT,
+        )
+    finally:
+        cache.delete(f'{key}:lock')
+    metrics.add(event, cache)
+    return value
@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+SEQUENCE_KEY = 'tiered:seq'
+LOG_KEY = 'tiered:log:{}'
+MISSING = object()
+
+
+class TieredCache:
+    """Двухуровневый кеш: LRU в памяти процесса (L1) перед общим кешем (L2).
+
+    Горячие ключи читаются из L1 без обращения к L2. Удаление ключа
+    записывается в журнал инвалидаций в L2: номер последней записи лежит
+    в SEQUENCE_KEY, сами записи — в LOG_KEY. Каждый процесс не чаще раза
+    в TIERED_SYNC_INTERVAL секунд сверяет номер и выбрасывает из своего
+    L1 перечисленные ключи, а если пропустил часть журнала — очищает L1
+    целиком. TIERED_L1_TIMEOUT ограничивает жизнь ключа в L1 на случай
+    потерянной инвалидации.
+    """
+
+    def __init__(self, l2=default_cache):
+        self.l2 = l2
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.sequence = None
+        self.synced_at = float('-inf')
+
+    def sync(self):
+        """Применяет инвалидации, сделанные другими процессами."""
+        now = time.monotonic()
+        if now - self.synced_at < settings.TIERED_SYNC_INTERVAL:
+            return
+        self.synced_at = now
+        sequence = self.l2.get(SEQUENCE_KEY)
+        if sequence is None:
+            self._create_sequence()
+            sequence = self.l2.get(SEQUENCE_KEY, 0)
+        if sequence == self.sequence:
+            return
+        previous, self.sequence = self.sequence, sequence
+        if previous is None:
+            # Первая сверка: не знаем, что пропустили до нее.
+            self.clear_local()
+            return
+        missed = range(previous + 1, sequence + 1)
+        if not 0 < len(missed) <= settings.TIERED_LOG_SIZE:
+            self.clear_local()
+            return
+        log = self.l2.get_many([LOG_KEY.format(number) for number in missed])
+        if len(log) < len(missed):
+            self.clear_local()
+            return
+        with self.lock:
+            for keys in log.values():
+                for key in keys:
+                    self.entries.pop(key, None)
+
+    def _create_sequence(self):
+        # Счетчик начинается со случайного числа, чтобы после очистки L2
+        # он не вернулся к значению, которое процессы уже видели.
+        self.l2.add(SEQUENCE_KEY, random.randrange(1, 2 ** 31), None)
+
+    def clear_local(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _get_local(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def _set_local(self, key, value):
+        with self.lock:
+            self.entries[key] = (
+                value, time.monotonic() + settings.TIERED_L1_TIMEOUT
+            )
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.TIERED_L1_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        self.sync()
+        value = self._get_local(key)
+        if value is not MISSING:
+            return value
+        value = self.l2.get(key, MISSING)
+        if value is MISSING:
+            return default
+        self._set_local(key, value)
+        return value
+
+    def set(self, key, value, timeout=None):
+        """Кладет значение в оба уровня без рассылки инвалидации.
+
+        Изменять уже закешированные значения нужно через delete(),
+        иначе другие процессы до TIERED_L1_TIMEOUT видят старое.
+        """
+        self.l2.set(key, value, timeout)
+        self._set_local(key, value)
+
+    def get_or_set(self, key, default, timeout=None):
+        """Возвращает значение, вычисляя default() при промахе."""
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = default()
+            self.set(key, value, timeout)
+        return value
+
+    def delete_many(self, keys):
+        """Удаляет ключи везде и рассылает инвалидацию другим процессам."""
+        keys = list(keys)
+        self.l2.delete_many(keys)
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        self._create_sequence()
+        sequence = self.l2.incr(SEQUENCE_KEY)
+        self.l2.set(
+            LOG_KEY.format(sequence), keys, settings.TIERED_LOG_TIMEOUT
+        )
+
+    def delete(self, key):
+        self.delete_many([key])
+
+
+tiered_cache = TieredCache()
@@ -0,0 +1,18 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def write_atomic(using=None):
+    """transaction.atomic(), который сразу берет блокировку записи.
+
+    Для блоков, которые читают и по прочитанному пишут: в SQLite
+    транзакция начинается с BEGIN IMMEDIATE, и запись не упадет из-за
+    того, что базу изменили между чтением и записью.
+    """
+    with transaction.atomic(using=using):
+        connection = transaction.get_connection(using)
+        if hasattr(connection, 'lock_for_write'):
+            connection.lock_for_write()
+        yield
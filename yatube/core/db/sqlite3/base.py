@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+
+from django.db.backends.sqlite3 import base
+from django.db.utils import OperationalError
+
+# Настройки соединения по умолчанию; переопределяются ключом 'PRAGMAS'
+# в OPTIONS базы.
+PRAGMAS = {
+    # Читатели не ждут писателя, а писатель — читателей.
+    'journal_mode': 'WAL',
+    # В режиме WAL fsync нужен только при checkpoint.
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — размер страничного кеша в КиБ.
+    'cache_size': -20000,
+    'busy_timeout': 5000,
+}
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+RETRIES = 5
+BACKOFF = 0.05
+
+# Блокировки записи общие для всех соединений процесса с одним файлом.
+write_locks = {}
+write_locks_guard = threading.Lock()
+
+
+def is_write(query):
+    return query.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+
+
+def is_locked_error(error):
+    return 'database is locked' in str(error)
+
+
+class SerializedCursorWrapper(base.SQLiteCursorWrapper):
+    """Курсор, который выполняет записи под блокировкой записи."""
+
+    def execute(self, query, params=None):
+        self.db.begin_pending(query)
+        if self.db.needs_write_lock(query):
+            return self.db.serialized(
+                lambda: super(SerializedCursorWrapper, self).execute(
+                    query, params
+                )
+            )
+        return super().execute(query, params)
+
+    def executemany(self, query, param_list):
+        self.db.begin_pending(query)
+        if self.db.needs_write_lock(query):
+            return self.db.serialized(
+                lambda: super(SerializedCursorWrapper, self).executemany(
+                    query, param_list
+                )
+            )
+        return super().executemany(query, param_list)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite в режиме WAL с очередью на запись.
+
+    SQLite допускает одного писателя. Чтобы конкурирующие запросы
+    не получали «database is locked», записи одного процесса выстраиваются
+    в очередь на блокировке процесса, а занятость базы другим процессом
+    пережидается повторами с экспоненциальной паузой.
+
+    BEGIN откладывается до первого запроса транзакции. Если это запись,
+    транзакция сразу берет блокировку базы (BEGIN IMMEDIATE), и ее ждут
+    в busy_timeout; если чтение — блокировка берется на первой записи,
+    а транзакции только для чтения не мешают друг другу. Переход
+    от чтения к записи может упасть, если базу успели изменить; блоки,
+    которые читают и затем пишут, открываются через core.db.write_atomic.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.holds_write_lock = False
+        self.transaction_pending = False
+        self.pragmas = {
+            **PRAGMAS, **self.settings_dict['OPTIONS'].get('PRAGMAS', {})
+        }
+
+    @property
+    def write_lock(self):
+        name = self.settings_dict['NAME']
+        with write_locks_guard:
+            return write_locks.setdefault(name, threading.Lock())
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('PRAGMAS', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {pragma} = {value}')
+        return connection
+
+    def enable_constraint_checking(self):
+        # Миграции снова включают внешние ключи; если они выключены
+        # в PRAGMAS (например, в шардах), оставляем их выключенными.
+        if str(self.pragmas.get('foreign_keys', 'ON')).upper() != 'OFF':
+            super().enable_constraint_checking()
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SerializedCursorWrapper)
+        cursor.db = self
+        return cursor
+
+    def needs_write_lock(self, query):
+        return not self.holds_write_lock and is_write(query)
+
+    def begin_pending(self, query):
+        """Начинает отложенную транзакцию перед ее первым запросом."""
+        if self.transaction_pending:
+            self.transaction_pending = False
+            if is_write(query):
+                self.begin_immediate()
+            else:
+                self.connection.execute('BEGIN')
+
+    def begin_immediate(self):
+        self.acquire_write_lock()
+        try:
+            self.retry(lambda: self.connection.execute('BEGIN IMMEDIATE'))
+        except BaseException:
+            self.release_write_lock()
+            raise
+
+    def lock_for_write(self):
+        """Сразу берет блокировку записи для текущей транзакции."""
+        if self.transaction_pending:
+            self.transaction_pending = False
+            self.begin_immediate()
+        elif not self.holds_write_lock:
+            self.acquire_write_lock()
+
+    def acquire_write_lock(self):
+        timeout = self.pragmas['busy_timeout'] / 1000
+        if not self.write_lock.acquire(timeout=timeout):
+            raise OperationalError('database is locked')
+        self.holds_write_lock = True
+
+    def release_write_lock(self):
+        if self.holds_write_lock:
+            self.holds_write_lock = False
+            self.write_lock.release()
+
+    def retry(self, operation):
+        """Повторяет операцию, пока база занята другим процессом."""
+        for attempt in range(RETRIES):
+            try:
+                return operation()
+            except OperationalError as error:
+                if attempt == RETRIES - 1 or not is_locked_error(error):
+                    raise
+            time.sleep(BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def serialized(self, operation):
+        self.acquire_write_lock()
+        if not self.get_autocommit():
+            # Первая запись транзакции: блокировка держится до ее конца.
+            return self.retry(operation)
+        try:
+            return self.retry(operation)
+        finally:
+            self.release_write_lock()
+
+    def _start_transaction_under_autocommit(self):
+        self.transaction_pending = True
+
+    def _commit(self):
+        self.transaction_pending = False
+        try:
+            super()._commit()
+        finally:
+            self.release_write_lock()
+
+    def _rollback(self):
+        self.transaction_pending = False
+        try:
+            super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def _close(self):
+        self.transaction_pending = False
+        try:
+            super()._close()
+        finally:
+            self.release_write_lock()
@@ -0,0 +1,131 @@
+import pickle
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.utils import timezone
+
+from .db import write_atomic
+from .models import OutgoingEmail
+from .tasks import task
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """EMAIL_BACKEND, который только сохраняет письма в очередь.
+
+    Запрос (например, сброс пароля) не ждет SMTP-сервера: письмо
+    ложится в таблицу core.OutgoingEmail, а отправляет его воркер
+    задачей core.send_emails через QUEUED_EMAIL_BACKEND.
+    """
+
+    def send_messages(self, email_messages):
+        emails = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            # Соединение не сериализуется, воркер откроет свое.
+            message.connection = None
+            emails.append(OutgoingEmail(
+                subject=message.subject,
+                recipients=', '.join(message.recipients()),
+                message=pickle.dumps(message),
+            ))
+        if emails:
+            OutgoingEmail.objects.using(DEFAULT_DB_ALIAS).bulk_create(emails)
+            send_emails.delay()
+        return len(emails)
+
+
+def claim(limit):
+    """Забирает до limit писем; как core.tasks.claim, но для писем."""
+    now = timezone.now()
+    lease = timedelta(seconds=settings.EMAIL_LEASE_SECONDS)
+    emails = OutgoingEmail.objects.using(DEFAULT_DB_ALIAS)
+    with write_atomic(using=DEFAULT_DB_ALIAS):
+        claimed = list(
+            emails.filter(
+                Q(status=OutgoingEmail.QUEUED, send_after__lte=now)
+                | Q(status=OutgoingEmail.SENDING, locked_until__lt=now)
+            ).order_by('pk')[:limit]
+        )
+        emails.filter(pk__in=[email.pk for email in claimed]).update(
+            status=OutgoingEmail.SENDING, locked_until=now + lease,
+        )
+    return claimed
+
+
+def send_queued(limit=None):
+    """Отправляет письма из очереди через одно соединение.
+
+    Между письмами выдерживается пауза, чтобы не превышать
+    EMAIL_RATE писем в секунду. Письмо, которое сервер не принял,
+    откладывается с растущей задержкой, всего до EMAIL_MAX_ATTEMPTS
+    попыток. Возвращает число отправленных писем и писем, у которых
+    попытки кончились.
+    """
+    limit = limit or settings.EMAIL_BATCH_SIZE
+    interval = 1 / settings.EMAIL_RATE if settings.EMAIL_RATE else 0
+    emails = OutgoingEmail.objects.using(DEFAULT_DB_ALIAS)
+    sent = failed = 0
+    next_at = time.monotonic()
+    with get_connection(settings.QUEUED_EMAIL_BACKEND) as connection:
+        while True:
+            batch = claim(limit)
+            if not batch:
+                return sent, failed
+            delivered = []
+            for email in batch:
+                time.sleep(max(0, next_at - time.monotonic()))
+                next_at = time.monotonic() + interval
+                try:
+                    connection.send_messages([pickle.loads(email.message)])
+                except Exception as error:
+                    failed += postpone(email, error)
+                else:
+                    delivered.append(email.pk)
+            # Само письмо (в нем бывают ссылки сброса пароля) после
+            # отправки не храним, остается только запись о нем.
+            emails.filter(pk__in=delivered).update(
+                status=OutgoingEmail.SENT,
+                sent=timezone.now(),
+                locked_until=None,
+                message=b'',
+            )
+            sent += len(delivered)
+
+
+def postpone(email, error):
+    """Откладывает неотправленное письмо; True, если попытки кончились."""
+    attempts = email.attempts + 1
+    final = attempts >= settings.EMAIL_MAX_ATTEMPTS
+    delay = settings.EMAIL_RETRY_DELAY * 2 ** (attempts - 1)
+    OutgoingEmail.objects.using(DEFAULT_DB_ALIAS).filter(pk=email.pk).update(
+        status=OutgoingEmail.FAILED if final else OutgoingEmail.QUEUED,
+        attempts=attempts,
+        error=repr(error),
+        send_after=timezone.now() + timedelta(seconds=delay),
+        locked_until=None,
+    )
+    if not final:
+        send_emails.delay(countdown=delay)
+    return final
+
+
+def prune(days=None):
+    """Удаляет отправленные и брошенные письма старше days дней."""
+    days = settings.EMAIL_KEEP_DAYS if days is None else days
+    border = timezone.now() - timedelta(days=days)
+    return OutgoingEmail.objects.using(DEFAULT_DB_ALIAS).filter(
+        status__in=(OutgoingEmail.SENT, OutgoingEmail.FAILED),
+        created__lt=border,
+    ).delete()[0]
+
+
+@task('core.send_emails', batch=True)
+def send_emails(payloads):
+    """Сколько бы писем ни поставили, очередь разбирает один вызов."""
+    send_queued()
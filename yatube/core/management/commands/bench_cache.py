@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from core.cache.sqlite import SQLiteCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+
+def timed(operation, iterations):
+    """Возвращает число операций в секунду."""
+    started = time.perf_counter()
+    for i in range(iterations):
+        operation(i)
+    return iterations / (time.perf_counter() - started)
+
+
+def worker(cache, keys, requests, seed, results):
+    """Имитирует воркер: читает ключи и пересчитывает их при промахе."""
+    rng = random.Random(seed)
+    # Популярность ключей распределена по закону Ципфа, как у страниц ленты.
+    weights = [1 / (rank + 1) for rank in range(keys)]
+    hits = 0
+    for rank in rng.choices(range(keys), weights, k=requests):
+        key = f'page:{rank}'
+        if cache.get(key) is None:
+            cache.set(key, 'x' * 2048, 60)
+        else:
+            hits += 1
+    results.put(hits)
+
+
+class Command(BaseCommand):
+    """Сравнивает SQLiteCache с LocMemCache."""
+
+    help = ('Замеряет скорость операций SQLiteCache и LocMemCache и долю '
+            'попаданий, когда кеш читают несколько процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--keys', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            params = {'OPTIONS': {'MAX_ENTRIES': 100000}}
+            backends = {
+                'LocMemCache': LocMemCache('bench', params),
+                'SQLiteCache': SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'), params
+                ),
+            }
+            for name, cache in backends.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.report(cache, options)
+
+    def report(self, cache, options):
+        iterations = options['iterations']
+        cache.clear()
+        value = {'text': 'x' * 512, 'id': 1}
+        cache.set('counter', 0)
+        many = [f'key:{i}' for i in range(10)]
+        operations = {
+            'set': lambda i: cache.set(f'key:{i}', value),
+            'get': lambda i: cache.get(f'key:{i}'),
+            'get_many(10)': lambda i: cache.get_many(many),
+            'set_many(10)': lambda i: cache.set_many(
+                dict.fromkeys(many, value)
+            ),
+            'incr': lambda i: cache.incr('counter'),
+        }
+        for operation_name, operation in operations.items():
+            rate = timed(operation, iterations)
+            self.stdout.write(f'  {operation_name:<14}{rate:>12,.0f} оп/с')
+        cache.clear()
+        self.stdout.write(f'  попадания при {options["workers"]} воркерах: '
+                          f'{self.hit_ratio(cache, options):.1%}')
+
+    def hit_ratio(self, cache, options):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker, args=(
+                cache, options['keys'], options['requests'], seed, results,
+            ))
+            for seed in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        hits = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return hits / (options['requests'] * options['workers'])
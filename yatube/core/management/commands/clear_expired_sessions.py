@@ -0,0 +1,41 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    """Удаляет истекшие сессии небольшими пачками."""
+
+    help = ('Удаляет истекшие сессии пачками, каждая в своей короткой '
+            'транзакции, чтобы не блокировать базу надолго.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько сессий удалять за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Пауза между пачками в секундах.',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)
+                [:options['batch_size']]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+            if len(keys) < options['batch_size']:
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено истекших сессий: {deleted}'
+        ))
@@ -0,0 +1,53 @@
+import time
+
+from core import mail, tasks
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Как часто (в секундах) удалять старые выполненные задачи и письма.
+PRUNE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    """Воркер очереди задач core.tasks."""
+
+    help = ('Выполняет задачи из очереди в базе. По умолчанию работает '
+            'постоянно и опрашивает очередь; с --once выполняет готовые '
+            'задачи и завершается (удобно для cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и выйти.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.TASKS_BATCH_SIZE,
+            help='Сколько задач забирать за раз.',
+        )
+        parser.add_argument(
+            '--name', action='append', dest='names',
+            help='Выполнять только задачи с этим именем (можно повторять).',
+        )
+
+    def handle(self, *args, **options):
+        pruned_at = 0
+        while True:
+            done, failed = tasks.run_pending(
+                options['batch_size'], options['names']
+            )
+            if done or failed:
+                self.stdout.write(
+                    f'Выполнено задач: {done}, с ошибками: {failed}'
+                )
+            if options['once']:
+                break
+            if time.monotonic() - pruned_at > PRUNE_INTERVAL:
+                pruned_at = time.monotonic()
+                pruned = tasks.prune()
+                if pruned and options['verbosity'] > 1:
+                    self.stdout.write(f'Удалено старых задач: {pruned}')
+                pruned = mail.prune()
+                if pruned and options['verbosity'] > 1:
+                    self.stdout.write(f'Удалено старых писем: {pruned}')
+            time.sleep(settings.TASKS_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS('Очередь пуста'))
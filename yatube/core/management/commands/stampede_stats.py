@@ -0,0 +1,24 @@
+from core.cache.stampede import metrics
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """Показывает, сколько пересчетов кеша удалось избежать."""
+
+    help = 'Выводит счетчики защиты кеша от лавинного пересчета.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики после вывода.',
+        )
+
+    def handle(self, *args, **options):
+        totals = metrics.totals(cache)
+        for event, count in totals.items():
+            self.stdout.write(f'{event:<15}{count:>10}')
+        if options['reset']:
+            cache.delete_many(
+                [f'stampede:{event}' for event in totals]
+            )
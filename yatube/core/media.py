@@ -0,0 +1,154 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .storage import name_digest
+
+RANGE_RE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+CHUNK_SIZE = 64 * 1024
+
+
+def media_path(request, path):
+    """Возвращает относительный и абсолютный пути к файлу и его доступность.
+
+    Файлы вне MEDIA_PUBLIC_PREFIXES доступны только персоналу. Права
+    проверяются до поиска файла, чтобы по 404 и 403 нельзя было понять,
+    есть ли закрытый файл.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    path = os.path.relpath(full_path, settings.MEDIA_ROOT).replace('\\', '/')
+    public = path.startswith(settings.MEDIA_PUBLIC_PREFIXES)
+    if not public and not request.user.is_staff:
+        raise PermissionDenied
+    if not os.path.isfile(full_path):
+        raise Http404
+    return path, full_path, public
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range с одним диапазоном.
+
+    Возвращает пару (начало, длина), None, если заголовок нужно
+    проигнорировать, или False, если диапазон невыполним.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or not (match.group('start') or match.group('end')):
+        return None
+    start, end = match.group('start'), match.group('end')
+    if not start:
+        # bytes=-N — последние N байт файла.
+        length = min(int(end), size)
+        return (size - length, length) if length else False
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        return False
+    return start, end - start + 1
+
+
+def read_range(path, start, length):
+    """Отдает кусок файла блоками, не читая его в память целиком."""
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def offload_response(full_path, path):
+    """Передает отдачу файла веб-серверу через X-Accel-Redirect/X-Sendfile."""
+    response = HttpResponse()
+    if settings.MEDIA_ACCEL_REDIRECT == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = (
+            settings.MEDIA_ACCEL_PREFIX + quote(path)
+        )
+    else:
+        response['X-Sendfile'] = full_path
+    # Тип и длину файла выставит сам веб-сервер.
+    del response['Content-Type']
+    return response
+
+
+def file_response(request, full_path, size, etag, mtime):
+    """Отдает файл целиком или запрошенный диапазон байт."""
+    header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if header and if_range:
+        # Файл изменился с момента первой части — отдаем его целиком.
+        if if_range != etag and parse_http_date_safe(if_range) != int(mtime):
+            header = None
+    byte_range = parse_range(header, size) if header else None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        # Без Range файл отдается через wsgi.file_wrapper, то есть
+        # сервер приложений может переслать его sendfile без копирования.
+        return FileResponse(open(full_path, 'rb'))
+    start, length = byte_range
+    response = StreamingHttpResponse(
+        read_range(full_path, start, length), status=206
+    )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+    return response
+
+
+def cache_control(public, digest):
+    """Закрытые файлы общим кешам (прокси, CDN) не отдаются."""
+    if not public:
+        return PRIVATE_CACHE_CONTROL
+    if digest:
+        return IMMUTABLE_CACHE_CONTROL
+    return f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+def serve(request, path):
+    """Отдает файлы из MEDIA_ROOT с поддержкой кеширования и диапазонов."""
+    path, full_path, public = media_path(request, path)
+    stat = os.stat(full_path)
+    digest = name_digest(path)
+    etag = quote_etag(digest or f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control(public, digest),
+    }
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        if settings.MEDIA_ACCEL_REDIRECT:
+            response = offload_response(full_path, path)
+        else:
+            response = file_response(
+                request, full_path, stat.st_size, etag, stat.st_mtime
+            )
+            content_type, encoding = mimetypes.guess_type(full_path)
+            response['Content-Type'] = (
+                content_type or 'application/octet-stream'
+            )
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
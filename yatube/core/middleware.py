@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from . import routers
+from .auth import forget_session, get_user
+
+PIN_COOKIE = 'primary_pin'
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware, которая берет пользователя из кеша.
+
+    Вход, выход и смена пароля меняют или удаляют ключ сессии; запись
+    для прежнего ключа тогда удаляется сразу после ответа.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.auth_session_key = request.session.session_key
+        request.user = SimpleLazyObject(lambda: get_user(request))
+
+    def process_response(self, request, response):
+        session_key = getattr(request, 'auth_session_key', None)
+        if session_key and request.session.session_key != session_key:
+            forget_session(session_key)
+        return response
+
+
+class ReplicaPinningMiddleware(MiddlewareMixin):
+    """Закрепляет за пользователем основную базу после его записи.
+
+    Реплики могут отставать, поэтому после записи ставится подписанная
+    cookie, и REPLICA_PIN_SECONDS секунд все чтения этого пользователя,
+    включая страницу после редиректа, идут в основную базу.
+    """
+
+    def process_request(self, request):
+        routers.reset()
+        if request.get_signed_cookie(
+            PIN_COOKIE, default=None, max_age=settings.REPLICA_PIN_SECONDS
+        ):
+            routers.pin_to_primary()
+
+    def process_response(self, request, response):
+        if getattr(routers.state, 'wrote', False):
+            response.set_signed_cookie(
+                PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        routers.reset()
+        return response
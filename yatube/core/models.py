@@ -0,0 +1,124 @@
+from django.db import models
+from django.utils import timezone
+
+
+class MediaBlob(models.Model):
+    """Файл контентно-адресуемого хранилища и число ссылок на него."""
+
+    name = models.CharField(
+        'Путь к файлу',
+        max_length=255,
+        unique=True,
+    )
+    refcount = models.PositiveIntegerField(
+        'Число ссылок',
+        default=0,
+    )
+    created = models.DateTimeField(
+        'Дата загрузки',
+        auto_now_add=True,
+    )
+
+    def __str__(self):
+        """Метод возвращающий строку name."""
+        return self.name
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+
+
+class Task(models.Model):
+    """Отложенная задача очереди core.tasks."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField('Задача', max_length=100)
+    payload = models.TextField('Аргументы в JSON', default='{}')
+    key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=255,
+        unique=True,
+        null=True,
+        blank=True,
+        help_text='Вторая задача с тем же ключом не ставится в очередь',
+    )
+    status = models.CharField(
+        'Состояние',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    run_at = models.DateTimeField('Выполнить не раньше')
+    locked_until = models.DateTimeField(
+        'Занята воркером до',
+        null=True,
+        blank=True,
+    )
+    error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Дата постановки', auto_now_add=True)
+    finished = models.DateTimeField('Дата завершения', null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_at'])]
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+
+
+class OutgoingEmail(models.Model):
+    """Письмо в очереди отправки core.mail."""
+
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не отправлено'),
+    )
+
+    subject = models.TextField('Тема')
+    recipients = models.TextField('Получатели')
+    message = models.BinaryField('Письмо целиком (pickle)')
+    status = models.CharField(
+        'Состояние',
+        max_length=10,
+        choices=STATUSES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    send_after = models.DateTimeField(
+        'Отправить не раньше',
+        default=timezone.now,
+    )
+    locked_until = models.DateTimeField(
+        'Занято воркером до',
+        null=True,
+        blank=True,
+    )
+    error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Дата постановки', auto_now_add=True)
+    sent = models.DateTimeField('Дата отправки', null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.subject} → {self.recipients}'
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'send_after'])]
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Исходящие письма'
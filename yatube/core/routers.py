@@ -0,0 +1,43 @@
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+state = threading.local()
+
+
+def pin_to_primary():
+    """Направляет чтения текущего запроса в основную базу."""
+    state.pinned = True
+
+
+def reset():
+    state.pinned = False
+    state.wrote = False
+
+
+class ReplicaRouter:
+    """Читает модели из REPLICA_APPS с реплик, а пишет в основную базу.
+
+    Запрос, который что-то записал, и несколько секунд после него
+    (см. core.middleware.ReplicaPinningMiddleware) читают из основной
+    базы, чтобы автор сразу увидел свои изменения.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not settings.DATABASE_REPLICAS
+                or model._meta.app_label not in settings.REPLICA_APPS
+                or getattr(state, 'pinned', False)
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in settings.REPLICA_APPS:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в основной базе.
+        return True
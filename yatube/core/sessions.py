@@ -0,0 +1,31 @@
+from django.contrib.sessions.backends import cached_db
+
+
+class SessionStore(cached_db.SessionStore):
+    """Сессии в кеше с записью в базу, но только если данные изменились.
+
+    Django сохраняет сессию после любого присваивания, даже того же
+    значения. Здесь сохранение пропускается, если сериализованные данные
+    совпадают с прочитанными, и запросы не пишут в django_session зря.
+    """
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        self._loaded_data = None
+
+    def _dump(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        data = super().load()
+        self._loaded_data = self._dump(data) if self.session_key else None
+        return data
+
+    def save(self, must_create=False):
+        if (not must_create and self.session_key
+                and self._loaded_data is not None
+                and self._dump(self._get_session(no_load=True))
+                == self._loaded_data):
+            return
+        super().save(must_create)
+        self._loaded_data = self._dump(self._get_session(no_load=True))
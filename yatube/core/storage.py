@@ -0,0 +1,104 @@
+import hashlib
+import os
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from .db import write_atomic
+
+HASHED_NAME_RE = re.compile(r'^(?P<digest>[0-9a-f]{64})(?:\.\w+)?$')
+
+
+def file_digest(content):
+    """Считает sha256 содержимого файла, читая его по частям."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def name_digest(name):
+    """Возвращает хеш из имени файла или None для обычных имен."""
+    match = HASHED_NAME_RE.match(os.path.basename(name or ''))
+    return match.group('digest') if match else None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище с именами по хешу содержимого.
+
+    Файл сохраняется как <каталог>/ab/cd/abcd...ef.<расширение>, поэтому
+    в одном каталоге не копятся сотни тысяч файлов, а одинаковые загрузки
+    записываются на диск один раз. Сколько строк ссылается на файл,
+    учитывается в core.MediaBlob через retain()/release().
+    """
+
+    def hashed_name(self, name, content):
+        """Строит шардированное имя файла по его содержимому."""
+        digest = file_digest(content)
+        directory = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        width = settings.MEDIA_SHARD_WIDTH
+        shards = [
+            digest[i * width:(i + 1) * width]
+            for i in range(settings.MEDIA_SHARD_DEPTH)
+        ]
+        return os.path.join(directory, *shards, digest + ext).replace(
+            '\\', '/'
+        )
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Такой файл уже лежит в хранилище — повторно не пишем.
+            return name
+        return self._save(name, content)
+
+    def retain(self, name):
+        """Увеличивает счетчик ссылок на файл."""
+        if not name_digest(name):
+            return
+        blob_model = apps.get_model('core', 'MediaBlob')
+        with write_atomic():
+            blob, created = blob_model.objects.get_or_create(
+                name=name, defaults={'refcount': 1}
+            )
+            if not created:
+                blob_model.objects.filter(pk=blob.pk).update(
+                    refcount=F('refcount') + 1
+                )
+
+    def release(self, name, keep_file=False):
+        """Уменьшает счетчик ссылок и удаляет файл, когда ссылок не осталось.
+
+        С keep_file=True файл остается на диске, даже если счетчик дошел
+        до нуля. Возвращает True, если файл был удален с диска.
+        """
+        if not name_digest(name):
+            return False
+        blob_model = apps.get_model('core', 'MediaBlob')
+        with transaction.atomic():
+            blob_model.objects.filter(name=name, refcount__gt=0).update(
+                refcount=F('refcount') - 1
+            )
+            deleted, _ = blob_model.objects.filter(
+                name=name, refcount=0
+            ).delete()
+        if not deleted or keep_file:
+            return False
+        self.delete(name)
+        return True
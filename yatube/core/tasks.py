@@ -0,0 +1,217 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .db import write_atomic
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Очередь — таблица core.Task, брокер не нужен: представления только
+# вставляют строку, а работу делает воркер (команда run_tasks).
+registry = {}
+
+
+class TaskFunction:
+    """Зарегистрированная задача; вызывается как обычная функция."""
+
+    def __init__(self, func, name, batch, max_attempts, retry_delay):
+        self.func = func
+        self.name = name
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, key=None, countdown=0, **payload):
+        return enqueue(self.name, payload, key=key, countdown=countdown)
+
+
+def task(name, batch=False, max_attempts=None, retry_delay=None):
+    """Регистрирует функцию как задачу очереди.
+
+    Обычная задача получает аргументы payload как именованные. Задача
+    с batch=True получает список payload всех готовых задач этого типа,
+    забранных воркером за раз, и обрабатывает их одним вызовом.
+
+        @task('posts.process_images', batch=True)
+        def process_images(payloads):
+            ...
+
+        process_images.delay(post_id=1, key='images:1')
+    """
+    def decorator(func):
+        registry[name] = TaskFunction(
+            func, name, batch,
+            max_attempts or settings.TASKS_MAX_ATTEMPTS,
+            settings.TASKS_RETRY_DELAY if retry_delay is None
+            else retry_delay,
+        )
+        return registry[name]
+    return decorator
+
+
+def enqueue(name, payload, key=None, countdown=0):
+    """Ставит задачу в очередь; с занятым ключом возвращает None.
+
+    Ключ хранится, пока хранится строка задачи (см. prune), поэтому
+    повторная постановка с тем же ключом — например, повторная
+    отправка формы — ничего не делает.
+    """
+    if name not in registry:
+        raise LookupError(f'Неизвестная задача {name}')
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            return Task.objects.using(DEFAULT_DB_ALIAS).create(
+                name=name,
+                payload=json.dumps(payload, cls=DjangoJSONEncoder),
+                key=key,
+                run_at=timezone.now() + timedelta(seconds=countdown),
+            )
+    except IntegrityError:
+        if key is None:
+            raise
+        return None
+
+
+def claim(limit, names=None):
+    """Забирает до limit готовых задач и помечает их выполняемыми.
+
+    Задачи упавшего воркера возвращаются в работу, когда истекает
+    их аренда TASKS_LEASE_SECONDS. Попытка засчитывается уже здесь,
+    поэтому задача, на которой воркер падает, тоже исчерпывает
+    попытки (см. execute). Транзакция сразу берет блокировку
+    записи (write_atomic), так что два воркера одну задачу не заберут.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=settings.TASKS_LEASE_SECONDS)
+    tasks = Task.objects.using(DEFAULT_DB_ALIAS)
+    with write_atomic(using=DEFAULT_DB_ALIAS):
+        ready = tasks.filter(
+            Q(status=Task.QUEUED, run_at__lte=now)
+            | Q(status=Task.RUNNING, locked_until__lt=now)
+        )
+        if names:
+            ready = ready.filter(name__in=names)
+        claimed = list(ready.order_by('run_at', 'pk')[:limit])
+        tasks.filter(pk__in=[item.pk for item in claimed]).update(
+            status=Task.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=now + lease,
+        )
+    for item in claimed:
+        item.attempts += 1
+    return claimed
+
+
+def execute(claimed):
+    """Выполняет забранные задачи, пачечные — одним вызовом на тип."""
+    done = failed = 0
+    claimed = sorted(claimed, key=lambda item: (item.name, item.pk))
+    for name, group in groupby(claimed, key=lambda item: item.name):
+        group = list(group)
+        function = registry.get(name)
+        if function is None:
+            finish(group, error=f'Неизвестная задача {name}', final=True)
+            failed += len(group)
+            continue
+        group, crashed = drop_crashed(function, group)
+        failed += crashed
+        if not group:
+            continue
+        calls = [group] if function.batch else [[item] for item in group]
+        for items in calls:
+            payloads = [json.loads(item.payload) for item in items]
+            try:
+                if function.batch:
+                    function(payloads)
+                else:
+                    function(**payloads[0])
+            except Exception:
+                logger.exception('Задача %s упала', name)
+                failed += retry(function, items, traceback.format_exc())
+            else:
+                finish(items)
+                done += len(items)
+    return done, failed
+
+
+def drop_crashed(function, items):
+    """Завершает задачи, на которых воркер падал все попытки подряд.
+
+    Попытки сверх лимита бывают только у задач, вернувшихся в работу
+    по истечении аренды. Возвращает остальные задачи и число брошенных.
+    """
+    crashed = [item for item in items if item.attempts > function.max_attempts]
+    if crashed:
+        finish(crashed, error='Воркер падал, не завершив задачу', final=True)
+    return [item for item in items if item not in crashed], len(crashed)
+
+
+def finish(items, error='', final=False):
+    Task.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk__in=[item.pk for item in items]
+    ).update(
+        status=Task.FAILED if final else Task.DONE,
+        error=error,
+        finished=timezone.now(),
+        locked_until=None,
+    )
+
+
+def retry(function, items, error):
+    """Возвращает задачи в очередь с экспоненциальной задержкой.
+
+    Попытки уже засчитаны в claim. Возвращает число задач,
+    исчерпавших попытки.
+    """
+    failed = 0
+    tasks = Task.objects.using(DEFAULT_DB_ALIAS)
+    for item in items:
+        attempts = item.attempts
+        if attempts >= function.max_attempts:
+            tasks.filter(pk=item.pk).update(
+                status=Task.FAILED, error=error,
+                finished=timezone.now(), locked_until=None,
+            )
+            failed += 1
+            continue
+        delay = function.retry_delay * 2 ** (attempts - 1)
+        tasks.filter(pk=item.pk).update(
+            status=Task.QUEUED, error=error,
+            run_at=timezone.now() + timedelta(seconds=delay),
+            locked_until=None,
+        )
+    return failed
+
+
+def run_pending(limit=None, names=None):
+    """Выполняет все готовые задачи; возвращает (выполнено, упало)."""
+    limit = limit or settings.TASKS_BATCH_SIZE
+    done = failed = 0
+    while True:
+        claimed = claim(limit, names)
+        if not claimed:
+            return done, failed
+        result = execute(claimed)
+        done += result[0]
+        failed += result[1]
+
+
+def prune(days=None):
+    """Удаляет завершенные задачи старше days дней вместе с их ключами."""
+    days = settings.TASKS_KEEP_DAYS if days is None else days
+    border = timezone.now() - timedelta(days=days)
+    return Task.objects.using(DEFAULT_DB_ALIAS).filter(
+        status__in=(Task.DONE, Task.FAILED), finished__lt=border
+    ).delete()[0]
@@ -0,0 +1,96 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from ..auth import session_cache_key, user_cache_key
+from ..cache.tiered import tiered_cache
+
+User = get_user_model()
+
+
+class CachedAuthenticationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='auth', password='old-password-123'
+        )
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.clear_local()
+        self.client = Client()
+        self.client.login(username='auth', password='old-password-123')
+        self.url = reverse('about:author')
+
+    def test_logged_in_page_skips_session_and_user_queries(self):
+        """Повторный запрос не читает ни сессию, ни пользователя."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+            self.assertEqual(response.context['user'].username, 'auth')
+
+    def test_logout_invalidates_session(self):
+        """После выхода старая cookie сессии не аутентифицирует."""
+        self.client.get(self.url)
+        cookies = self.client.cookies
+        other_client = Client()
+        other_client.cookies = cookies.__class__(cookies)
+        self.client.get(reverse('users:logout'))
+        response = other_client.get(self.url)
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_password_change_logs_out_other_sessions(self):
+        """Смена пароля разлогинивает остальные сессии пользователя."""
+        other_client = Client()
+        other_client.login(username='auth', password='old-password-123')
+        other_client.get(self.url)
+        response = self.client.post(reverse('users:password_change'), {
+            'old_password': 'old-password-123',
+            'new_password1': 'new-password-456',
+            'new_password2': 'new-password-456',
+        })
+        self.assertRedirects(response, reverse('users:password_change_done'))
+        response = self.client.get(self.url)
+        self.assertTrue(response.context['user'].is_authenticated)
+        response = other_client.get(self.url)
+        self.assertFalse(response.context['user'].is_authenticated)
+
+    def test_user_save_refreshes_cached_user(self):
+        """Правка пользователя видна в следующем запросе."""
+        self.client.get(self.url)
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Новое имя'
+        user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['user'].first_name, 'Новое имя')
+
+    def test_cached_user_has_no_password_hash(self):
+        """В кеш попадает компактная запись без хеша пароля."""
+        self.client.get(self.url)
+        record = tiered_cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn(self.user.password, repr(record))
+
+    def test_deleted_session_row_is_not_authenticated(self):
+        """Удаленная в базе сессия не аутентифицирует из кеша."""
+        self.client.get(self.url)
+        session_key = self.client.session.session_key
+        Session.objects.get(session_key=session_key).delete()
+        self.assertIsNone(cache.get(session_cache_key(session_key)))
+
+    def test_session_entry_expires_with_session(self):
+        """Привязка сессии живет не дольше строки сессии."""
+        self.client.get(self.url)
+        session_key = self.client.session.session_key
+        cache.delete(session_cache_key(session_key))
+        Session.objects.filter(session_key=session_key).update(
+            expire_date=timezone.now() - timedelta(seconds=1)
+        )
+        self.client.get(self.url)
+        self.assertIsNone(cache.get(session_cache_key(session_key)))
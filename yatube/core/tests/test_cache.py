@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import SimpleTestCase
+
+from ..cache.sqlite import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        """Кеш хранит значения любых типов и соблюдает таймауты."""
+        values = {'str': 'строка', 'int': 42, 'dict': {'a': [1, 2]}}
+        for key, value in values.items():
+            with self.subTest(key=key):
+                self.cache.set(key, value)
+                self.assertEqual(self.cache.get(key), value)
+        self.cache.set('expired', 1, timeout=0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('new', 1))
+        self.assertFalse(self.cache.add('new', 2))
+        self.assertEqual(self.cache.get('new'), 1)
+        self.cache.delete('new')
+        self.assertFalse(self.cache.has_key('new'))
+
+    def test_get_many_and_set_many(self):
+        """Пакетные операции читают и пишут несколько ключей сразу."""
+        self.cache.set_many({'a': 1, 'b': 'два'})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 'два'}
+        )
+        self.cache.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b']), {})
+
+    def test_incr_is_atomic(self):
+        """incr из нескольких потоков не теряет увеличений."""
+        self.cache.set('counter', 0)
+
+        def increment():
+            for _ in range(50):
+                self.cache.incr('counter')
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(self.cache.decr('counter', 10), 190)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_cache_is_shared_between_instances(self):
+        """Запись через один экземпляр видна другому, как другому процессу."""
+        other = SQLiteCache(self.location, {})
+        self.cache.set('shared', 'значение')
+        self.assertEqual(other.get('shared'), 'значение')
+        other.delete('shared')
+        self.assertIsNone(self.cache.get('shared'))
+
+    def test_least_recently_used_keys_are_evicted(self):
+        """При переполнении вытесняются давно не читавшиеся ключи."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 10}})
+        cache.set('hot', 'value')
+        cache._connection.execute("UPDATE cache SET accessed = accessed + 60"
+                                  " WHERE key LIKE '%hot'")
+        for i in range(20):
+            cache.set(f'key:{i}', i)
+        cache._cull()
+        self.assertEqual(cache.get('hot'), 'value')
+        self.assertIsNone(cache.get('key:0'))
+        self.assertLessEqual(
+            cache._connection.execute('SELECT COUNT(*) FROM cache')
+            .fetchone()[0], 10
+        )
+
+    def test_reads_do_not_write(self):
+        """Чтение не пишет в файл, но учитывается при вытеснении."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 10}})
+        cache.set('read', 'value')
+        cache._connection.execute('UPDATE cache SET accessed = 0')
+        changes = cache._connection.total_changes
+        self.assertEqual(cache.get('read'), 'value')
+        self.assertEqual(cache._connection.total_changes, changes)
+        for i in range(20):
+            cache.set(f'key:{i}', i)
+        cache._connection.execute('UPDATE cache SET accessed = 1'
+                                  " WHERE key NOT LIKE '%read'")
+        cache._cull()
+        self.assertEqual(cache.get('read'), 'value')
+
+    def test_size_limit(self):
+        """Суммарный размер значений не превышает MAX_SIZE."""
+        cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_SIZE': 10000}})
+        for i in range(20):
+            cache.set(f'key:{i}', 'x' * 1000)
+        cache._cull()
+        size = cache._connection.execute(
+            'SELECT SUM(size) FROM cache'
+        ).fetchone()[0]
+        self.assertLessEqual(size, 10000)
+        self.assertIsNotNone(cache.get('key:19'))
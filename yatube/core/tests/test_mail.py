@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail import send_mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import mail as queued_mail
+from ..models import OutgoingEmail, Task
+from ..tasks import run_pending
+
+User = get_user_model()
+
+
+class CountingBackend(EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class FailingBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError('SMTP недоступен')
+
+
+@override_settings(
+    EMAIL_BACKEND='core.mail.QueuedEmailBackend',
+    QUEUED_EMAIL_BACKEND='core.tests.test_mail.CountingBackend',
+    EMAIL_RATE=0,
+)
+class QueuedEmailTest(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+
+    def send(self, count=1):
+        for number in range(count):
+            send_mail(f'Письмо {number}', 'Текст', None, ['to@example.com'])
+
+    def test_send_mail_only_enqueues(self):
+        """send_mail сохраняет письмо, а отправляет его воркер."""
+        self.send()
+        self.assertEqual(mail.outbox, [])
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipients, 'to@example.com')
+        self.assertEqual(run_pending(), (1, 0))
+        self.assertEqual(mail.outbox[0].subject, 'Письмо 0')
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+        self.assertEqual(bytes(email.message), b'')
+
+    def test_prune_removes_old_finished_emails(self):
+        """Старые отправленные и брошенные письма удаляются."""
+        self.send(3)
+        run_pending()
+        emails = OutgoingEmail.objects.order_by('pk')
+        emails.filter(pk=emails[1].pk).update(status=OutgoingEmail.FAILED)
+        emails.filter(pk=emails[2].pk).update(status=OutgoingEmail.QUEUED)
+        OutgoingEmail.objects.update(
+            created=timezone.now() - timedelta(days=30)
+        )
+        self.assertEqual(queued_mail.prune(days=7), 2)
+        self.assertEqual(
+            list(OutgoingEmail.objects.values_list('status', flat=True)),
+            [OutgoingEmail.QUEUED],
+        )
+
+    def test_batch_uses_one_connection(self):
+        """Пачка писем отправляется через одно соединение."""
+        self.send(5)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(CountingBackend.opened, 1)
+
+    @override_settings(
+        QUEUED_EMAIL_BACKEND='core.tests.test_mail.FailingBackend'
+    )
+    def test_failed_email_is_postponed(self):
+        """Неотправленное письмо откладывается и ставится повторно."""
+        self.send()
+        run_pending()
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.QUEUED)
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('SMTP недоступен', email.error)
+        self.assertTrue(Task.objects.filter(status=Task.QUEUED).exists())
+
+    def test_password_reset_is_queued(self):
+        """Сброс пароля не ждет отправки письма."""
+        User.objects.create_user(
+            username='user', email='user@example.com', password='password'
+        )
+        self.client.post(
+            reverse('users:password_reset'), {'email': 'user@example.com'}
+        )
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
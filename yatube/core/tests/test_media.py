@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import Client, TestCase, override_settings
+from posts.models import Post, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+CONTENT = bytes(range(256)) * 4
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaServeTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        storage = Post._meta.get_field('image').storage
+        cls.name = storage.save('posts/image.gif', ContentFile(CONTENT))
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'private'))
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'private', 'a.txt'), 'w') as f:
+            f.write('секрет')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.url = settings.MEDIA_URL + MediaServeTest.name
+
+    def test_hashed_file_is_served_with_immutable_headers(self):
+        """Файл с хешем в имени отдается целиком и кешируется навсегда."""
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), CONTENT)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'image/gif')
+
+    def test_conditional_requests(self):
+        """ETag и If-Modified-Since дают ответ 304."""
+        response = self.guest_client.get(self.url)
+        conditions = {
+            'HTTP_IF_NONE_MATCH': response['ETag'],
+            'HTTP_IF_MODIFIED_SINCE': response['Last-Modified'],
+        }
+        for header, value in conditions.items():
+            with self.subTest(header=header):
+                response = self.guest_client.get(self.url, **{header: value})
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+
+    def test_byte_ranges(self):
+        """Запрос диапазона отдает только нужные байты."""
+        ranges = {
+            'bytes=10-19': CONTENT[10:20],
+            'bytes=-5': CONTENT[-5:],
+            'bytes=1000-': CONTENT[1000:],
+        }
+        for header, expected in ranges.items():
+            with self.subTest(header=header):
+                response = self.guest_client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT
+                )
+                self.assertEqual(
+                    b''.join(response.streaming_content), expected
+                )
+        response = self.guest_client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+
+    def test_permissions(self):
+        """Закрытые и несуществующие файлы не отдаются."""
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        url = settings.MEDIA_URL + 'private/a.txt'
+        urls = {
+            url: HTTPStatus.FORBIDDEN,
+            settings.MEDIA_URL + 'posts/../private/a.txt':
+                HTTPStatus.FORBIDDEN,
+            settings.MEDIA_URL + 'posts/missing.gif': HTTPStatus.NOT_FOUND,
+            # Отсутствующий закрытый файл неотличим от существующего.
+            settings.MEDIA_URL + 'private/missing.txt': HTTPStatus.FORBIDDEN,
+        }
+        for address, status in urls.items():
+            with self.subTest(address=address):
+                response = self.guest_client.get(address)
+                self.assertEqual(response.status_code, status)
+        self.guest_client.force_login(staff)
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='x-accel-redirect')
+    def test_accel_redirect(self):
+        """Отдача файла передается nginx через X-Accel-Redirect."""
+        response = self.guest_client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            settings.MEDIA_ACCEL_PREFIX + MediaServeTest.name
+        )
+        self.assertEqual(response.content, b'')
@@ -0,0 +1,91 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from posts.models import Group, Post
+
+from ..cache.queryset import bump_table_version
+
+User = get_user_model()
+
+
+class QuerySetCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Post.objects.create(author=cls.user, group=cls.group, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def fetch(self, queryset):
+        with CaptureQueriesContext(connection) as queries:
+            result = list(queryset)
+        return result, len(queries)
+
+    def test_repeated_query_is_served_from_cache(self):
+        """Повторный одинаковый запрос не доходит до базы."""
+        queryset = Post.objects.select_related('author').cache()
+        first, _ = self.fetch(queryset)
+        second, count = self.fetch(queryset.all())
+        self.assertEqual(count, 0)
+        self.assertEqual(first, second)
+        self.assertEqual(second[0].author, self.user)
+
+    def test_uncached_queryset_hits_database(self):
+        """Без cache() запрос выполняется каждый раз."""
+        self.fetch(Post.objects.all())
+        _, count = self.fetch(Post.objects.all())
+        self.assertEqual(count, 1)
+
+    def test_parameters_are_part_of_key(self):
+        """Запросы с разными параметрами кешируются отдельно."""
+        Group.objects.create(title='Другая', slug='other', description='-')
+        found = Group.objects.cache().get(slug='test-slug')
+        other = Group.objects.cache().get(slug='other')
+        self.assertEqual(found, self.group)
+        self.assertEqual(other.slug, 'other')
+
+    def test_save_and_delete_invalidate_table(self):
+        """Сохранение и удаление строки сбрасывают запросы к таблице."""
+        queryset = Post.objects.filter(group=self.group).cache()
+        self.assertEqual(queryset.count(), 1)
+        post = Post.objects.create(author=self.user, group=self.group,
+                                   text='Новый пост')
+        self.assertEqual(queryset.count(), 2)
+        self.assertEqual(len(queryset.all()), 2)
+        post.delete()
+        self.assertEqual(queryset.count(), 1)
+
+    def test_joined_tables_invalidate_query(self):
+        """Изменение связанной таблицы сбрасывает запрос с join."""
+        queryset = Post.objects.select_related('group').cache()
+        list(queryset)
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertEqual(queryset.all()[0].group.title, 'Новое название')
+        self.group.title = 'Тестовая группа'
+        self.group.save()
+
+    def test_lost_version_does_not_return_old_results(self):
+        """После вытеснения версии старые результаты не находятся."""
+        queryset = Post.objects.cache()
+        list(queryset)
+        cache.delete('qc:ver:posts_post')
+        Post.objects.filter(group=self.group).update(text='Изменен')
+        bump_table_version('posts_post')
+        self.assertEqual(queryset.all()[0].text, 'Изменен')
+        Post.objects.filter(group=self.group).update(text='Пост')
+
+    def test_timeout_can_be_overridden(self):
+        """timeout=0 у конкретного запроса отключает хранение."""
+        list(Post.objects.cache(timeout=0))
+        _, count = self.fetch(Post.objects.cache(timeout=0))
+        self.assertEqual(count, 1)
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+
+from ..cache.tiered import tiered_cache
+
+User = get_user_model()
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+REPLICA = 'replica'
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRouterTest(TransactionTestCase):
+    """Основная база — тестовая, реплика — отдельный файл SQLite.
+
+    Репликации между ними нет, поэтому реплика изображает сильно
+    отставшую копию: в ней есть автор, но нет его новых постов.
+    """
+
+    databases = {'default', REPLICA}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[REPLICA] = {
+            'ENGINE': 'core.db.sqlite3',
+            'NAME': os.path.join(TEMP_DIR, 'replica.sqlite3'),
+        }
+        super().setUpClass()
+        call_command('migrate', database=REPLICA, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.clear_local()
+        self.user = User.objects.create_user(username='auth')
+        User.objects.using(REPLICA).create(
+            id=self.user.id, username='auth', password=self.user.password
+        )
+        Post.objects.create(author=self.user, text='Старый пост')
+        self.profile_url = reverse('posts:profile', args=['auth'])
+
+    def test_reads_go_to_replica(self):
+        """Без записи страницы читаются с реплики."""
+        response = self.client.get(self.profile_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Старый пост')
+
+    def test_writer_reads_own_writes(self):
+        """После публикации автор видит свой пост, хотя реплика отстала."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'}, follow=True
+        )
+        self.assertContains(response, 'Новый пост')
+        self.assertContains(response, 'Старый пост')
+        self.assertFalse(Post.objects.using(REPLICA).exists())
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pin_expires(self):
+        """По истечении REPLICA_PIN_SECONDS чтения снова идут на реплику."""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'}, follow=True
+        )
+        self.assertNotContains(response, 'Новый пост')
@@ -0,0 +1,57 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ..sessions import SessionStore
+
+
+class SessionStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = SessionStore()
+        self.session['theme'] = 'dark'
+        self.session.save()
+
+    def test_unchanged_session_is_not_written(self):
+        """Присваивание того же значения не пишет в базу."""
+        session = SessionStore(self.session.session_key)
+        session['theme'] = 'dark'
+        with self.assertNumQueries(0):
+            session.save()
+
+    def test_changed_session_is_written(self):
+        """Измененная сессия сохраняется в базу и в кеш."""
+        session = SessionStore(self.session.session_key)
+        session['theme'] = 'light'
+        session.save()
+        cache.clear()
+        session = SessionStore(self.session.session_key)
+        self.assertEqual(session['theme'], 'light')
+
+
+class ClearExpiredSessionsTest(TestCase):
+    def test_expired_sessions_are_deleted_in_batches(self):
+        """Команда удаляет только истекшие сессии."""
+        now = timezone.now()
+        for number in range(5):
+            Session.objects.create(
+                session_key=f'expired{number}', session_data='',
+                expire_date=now - timedelta(days=1),
+            )
+        Session.objects.create(
+            session_key='alive', session_data='',
+            expire_date=now + timedelta(days=1),
+        )
+        out = StringIO()
+        call_command(
+            'clear_expired_sessions', batch_size=2, pause=0, stdout=out
+        )
+        self.assertIn('5', out.getvalue())
+        self.assertQuerysetEqual(
+            Session.objects.all(), ['alive'], lambda session: session.pk
+        )
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import closing
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase
+
+from ..db import write_atomic
+from ..db.sqlite3.base import DatabaseWrapper
+
+WRITERS = 4
+WRITES = 25
+ALIAS = 'stress'
+
+
+class SQLiteStressTest(SimpleTestCase):
+    """Конкурентная запись в файл SQLite не приводит к database is locked."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.path = os.path.join(self.directory, 'stress.sqlite3')
+        with closing(self.connect()) as db, db.cursor() as cursor:
+            cursor.execute('CREATE TABLE counter (n INTEGER UNIQUE)')
+            cursor.execute('CREATE TABLE hits (id INTEGER PRIMARY KEY)')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def connect(self):
+        return DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': self.path}, ALIAS
+        )
+
+    def work(self):
+        """Чередует одиночные вставки и транзакции чтение-запись."""
+        connections[ALIAS] = self.connect()
+        try:
+            for number in range(WRITES):
+                with connections[ALIAS].cursor() as cursor:
+                    cursor.execute('INSERT INTO hits DEFAULT VALUES')
+                with write_atomic(using=ALIAS):
+                    with connections[ALIAS].cursor() as cursor:
+                        cursor.execute(
+                            'SELECT COALESCE(MAX(n), 0) FROM counter'
+                        )
+                        last = cursor.fetchone()[0]
+                        cursor.execute(
+                            'INSERT INTO counter (n) VALUES (%s)', [last + 1]
+                        )
+                        # Читатели в это время не должны мешать писателю.
+                        cursor.execute('SELECT COUNT(*) FROM hits')
+        finally:
+            connections[ALIAS].close()
+            del connections[ALIAS]
+
+    def assertAllWritesSaved(self, writers):
+        with closing(self.connect()) as db, db.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('SELECT COUNT(*), MAX(n) FROM counter')
+            self.assertEqual(cursor.fetchone(), (writers * WRITES,) * 2)
+            cursor.execute('SELECT COUNT(*) FROM hits')
+            self.assertEqual(cursor.fetchone()[0], writers * WRITES)
+
+    def test_threads(self):
+        """Потоки одного процесса пишут по очереди."""
+        errors = []
+
+        def run():
+            try:
+                self.work()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=run) for _ in range(WRITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertAllWritesSaved(WRITERS)
+
+    def test_processes(self):
+        """Процессы ждут блокировку базы, а не падают."""
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=self.work) for _ in range(WRITERS)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(
+            [process.exitcode for process in processes], [0] * WRITERS
+        )
+        self.assertAllWritesSaved(WRITERS)
+
+    def test_read_only_transaction_does_not_take_write_lock(self):
+        """Транзакция только для чтения не ждет блокировку записи."""
+        writer = self.connect()
+        writer.acquire_write_lock()
+        connections[ALIAS] = self.connect()
+        try:
+            with transaction.atomic(using=ALIAS):
+                with connections[ALIAS].cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM hits')
+                self.assertFalse(connections[ALIAS].holds_write_lock)
+        finally:
+            writer.release_write_lock()
+            connections[ALIAS].close()
+            del connections[ALIAS]
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+
+from ..cache.stampede import get_or_recompute, metrics
+
+
+@override_settings(STAMPEDE_METRICS_INTERVAL=0)
+class StampedeProtectionTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocMemCache('stampede', {})
+        self.cache.clear()
+        self.calls = 0
+
+    def recompute(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return f'значение {self.calls}'
+
+    def get(self, key='fragment', timeout=20):
+        return get_or_recompute(key, self.recompute, timeout, self.cache)
+
+    def test_value_is_cached(self):
+        """Свежее значение берется из кеша без пересчета."""
+        self.assertEqual(self.get(), 'значение 1')
+        self.assertEqual(self.get(), 'значение 1')
+        self.assertEqual(self.calls, 1)
+
+    def test_single_flight_on_cold_key(self):
+        """При пустом кеше значение считает только один из запросов."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.get()))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(set(results), {'значение 1'})
+
+    def test_stale_value_is_served_while_recomputing(self):
+        """Пока другой запрос пересчитывает, отдается устаревшее значение."""
+        self.cache.set('fragment', ('старое', time.time() - 1, 0.1))
+        self.cache.add('fragment:lock', 1)
+        self.assertEqual(self.get(), 'старое')
+        self.assertEqual(self.calls, 0)
+        self.cache.delete('fragment:lock')
+        self.assertEqual(self.get(), 'значение 1')
+
+    def test_early_refresh(self):
+        """Значение, которое вот-вот истечет, пересчитывается заранее."""
+        self.cache.set('fragment', ('старое', time.time() + 0.01, 100))
+        self.assertEqual(self.get(), 'значение 1')
+
+    def test_metrics_count_avoided_recomputes(self):
+        """Метрики показывают, сколько пересчетов удалось избежать."""
+        before = metrics.totals(self.cache)
+        self.cache.set('fragment', ('старое', time.time() - 1, 0.1))
+        self.cache.add('fragment:lock', 1)
+        self.get()
+        after = metrics.totals(self.cache)
+        self.assertEqual(after['avoided'] - before['avoided'], 1)
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from posts.models import Post, User
+
+from ..tasks import run_pending
+
+from ..models import MediaBlob, Task
+from ..storage import name_digest
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, name='small.gif', content=SMALL_GIF):
+        post = Post.objects.create(
+            author=ContentAddressedStorageTest.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile(name, content, 'image/gif'),
+        )
+        run_pending()
+        return post
+
+    def test_image_is_named_by_content_hash(self):
+        """Картинка сохраняется в шардированный каталог по хешу."""
+        post = self.create_post()
+        digest = name_digest(post.image.name)
+        self.assertIsNotNone(digest)
+        self.assertEqual(
+            post.image.name,
+            f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif'
+        )
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_identical_uploads_are_stored_once(self):
+        """Одинаковые картинки хранятся в одном файле со счетчиком ссылок."""
+        first = self.create_post('first.gif')
+        second = self.create_post('second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            MediaBlob.objects.get(name=first.image.name).refcount, 2
+        )
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_file_is_deleted_with_last_reference(self):
+        """Файл удаляется только вместе с последним ссылающимся постом."""
+        first = self.create_post()
+        second = self.create_post()
+        path = first.image.path
+        first.delete()
+        run_pending()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        run_pending()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(MediaBlob.objects.filter(name=second.image.name))
+
+    def test_replaced_image_is_released(self):
+        """Замена картинки снимает ссылку со старого файла."""
+        post = self.create_post()
+        old_path = post.image.path
+        post.image = SimpleUploadedFile('new.gif', SMALL_GIF + b'\x00')
+        post.save()
+        run_pending()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(
+            MediaBlob.objects.get(name=post.image.name).refcount, 1
+        )
+
+    def test_release_keeps_file_of_pending_upload(self):
+        """Файл не удаляется, пока на него ссылается новый пост.
+
+        Ссылка нового поста может быть учтена очередью позже, чем снята
+        ссылка удаленного.
+        """
+        first = self.create_post()
+        path = first.image.path
+        first.delete()
+        Post.objects.create(
+            author=ContentAddressedStorageTest.user,
+            text='Тестовый пост',
+            image=SimpleUploadedFile('again.gif', SMALL_GIF, 'image/gif'),
+        )
+        run_pending(limit=1)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(
+            MediaBlob.objects.get(name=first.image.name).refcount, 1
+        )
+
+    def test_failed_reference_update_is_not_counted_twice(self):
+        """Повтор упавшей задачи не учитывает новую ссылку второй раз."""
+        post = self.create_post()
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('new.gif', SMALL_GIF + b'\x00')
+        post.save()
+        with mock.patch(
+            'posts.tasks.release_image', side_effect=OSError('диск занят')
+        ):
+            run_pending()
+        self.assertFalse(MediaBlob.objects.filter(name=post.image.name))
+        Task.objects.filter(status=Task.QUEUED).update(run_at=timezone.now())
+        run_pending()
+        self.assertEqual(
+            MediaBlob.objects.get(name=post.image.name).refcount, 1
+        )
+        self.assertFalse(MediaBlob.objects.filter(name=old_name))
+
+    def test_reupload_of_previous_image_is_processed(self):
+        """Вернувшаяся картинка (A -> B -> A) снова обрабатывается."""
+        post = self.create_post()
+        first_name = post.image.name
+        for content in (SMALL_GIF + b'\x00', SMALL_GIF):
+            post.image = SimpleUploadedFile('image.gif', content)
+            post.save()
+        self.assertEqual(post.image.name, first_name)
+        self.assertEqual(
+            Task.objects.filter(name='posts.process_images').count(), 3
+        )
+        run_pending()
+        self.assertEqual(
+            MediaBlob.objects.get(name=first_name).refcount, 1
+        )
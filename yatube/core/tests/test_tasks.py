@@ -0,0 +1,105 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import tasks
+from ..models import Task
+
+calls = []
+
+
+@tasks.task('tests.add')
+def add(a, b):
+    calls.append(a + b)
+
+
+@tasks.task('tests.collect', batch=True)
+def collect(payloads):
+    calls.append(sorted(payload['n'] for payload in payloads))
+
+
+@tasks.task('tests.broken', max_attempts=2, retry_delay=0)
+def broken():
+    raise ValueError('сломано')
+
+
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_delay_only_enqueues(self):
+        """delay ставит задачу в очередь, а выполняет ее воркер."""
+        add.delay(a=1, b=2)
+        self.assertEqual(calls, [])
+        self.assertEqual(tasks.run_pending(), (1, 0))
+        self.assertEqual(calls, [3])
+        self.assertEqual(Task.objects.get().status, Task.DONE)
+
+    def test_idempotency_key(self):
+        """Задача с тем же ключом ставится в очередь один раз."""
+        self.assertIsNotNone(add.delay(a=1, b=1, key='once'))
+        self.assertIsNone(add.delay(a=1, b=1, key='once'))
+        tasks.run_pending()
+        self.assertIsNone(add.delay(a=1, b=1, key='once'))
+        self.assertEqual(calls, [2])
+
+    def test_batch_task_runs_once_per_claim(self):
+        """Готовые задачи одного типа обрабатываются одним вызовом."""
+        for n in range(5):
+            collect.delay(n=n)
+        add.delay(a=2, b=2)
+        self.assertEqual(tasks.run_pending(), (6, 0))
+        self.assertIn([0, 1, 2, 3, 4], calls)
+        self.assertIn(4, calls)
+
+    def test_countdown(self):
+        """Отложенная задача не выполняется раньше времени."""
+        add.delay(a=1, b=1, countdown=60)
+        self.assertEqual(tasks.run_pending(), (0, 0))
+
+    def test_failed_task_is_retried_then_given_up(self):
+        """Упавшая задача повторяется, пока не кончатся попытки."""
+        broken.delay()
+        tasks.run_pending()
+        task = Task.objects.get()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertIn('сломано', task.error)
+
+    def test_expired_lease_is_reclaimed(self):
+        """Задачу упавшего воркера забирает другой после конца аренды."""
+        add.delay(a=1, b=1)
+        self.assertEqual(len(tasks.claim(10)), 1)
+        self.assertEqual(tasks.claim(10), [])
+        Task.objects.update(locked_until=timezone.now() - timedelta(1))
+        self.assertEqual(len(tasks.claim(10)), 1)
+
+    def test_crashing_task_runs_out_of_attempts(self):
+        """Задача, на которой падает воркер, не забирается бесконечно."""
+        broken.delay()
+        for _ in range(2):
+            self.assertEqual(len(tasks.claim(10)), 1)
+            Task.objects.update(locked_until=timezone.now() - timedelta(1))
+        self.assertEqual(tasks.run_pending(), (0, 1))
+        task = Task.objects.get()
+        self.assertEqual(task.status, Task.FAILED)
+        self.assertIn('Воркер падал', task.error)
+
+    def test_prune_frees_keys(self):
+        """Старые выполненные задачи удаляются вместе с ключами."""
+        add.delay(a=1, b=1, key='old')
+        tasks.run_pending()
+        Task.objects.update(finished=timezone.now() - timedelta(days=30))
+        self.assertEqual(tasks.prune(days=7), 1)
+        self.assertIsNotNone(add.delay(a=1, b=1, key='old'))
+
+    def test_run_tasks_command(self):
+        """run_tasks --once выполняет очередь и завершается."""
+        add.delay(a=1, b=1)
+        out = StringIO()
+        call_command('run_tasks', '--once', stdout=out)
+        self.assertIn('Выполнено задач: 1, с ошибками: 0', out.getvalue())
+        self.assertEqual(calls, [2])
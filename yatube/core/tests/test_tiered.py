@@ -0,0 +1,44 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+
+from ..cache.tiered import TieredCache
+
+
+@override_settings(TIERED_SYNC_INTERVAL=0)
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.l2 = LocMemCache('tiered', {})
+        self.l2.clear()
+        # Два экземпляра с общим L2 изображают два процесса сервера.
+        self.worker = TieredCache(self.l2)
+        self.other_worker = TieredCache(self.l2)
+
+    def test_hot_keys_are_read_from_l1(self):
+        """Прочитанный ключ отдается из памяти процесса без L2."""
+        self.worker.set('group:1', 'Группа')
+        self.assertEqual(self.other_worker.get('group:1'), 'Группа')
+        self.l2.delete('group:1')
+        self.assertEqual(self.other_worker.get('group:1'), 'Группа')
+
+    def test_invalidation_reaches_other_workers(self):
+        """Удаление ключа в одном процессе сбрасывает L1 в другом."""
+        self.worker.set('group:1', 'Группа')
+        self.assertEqual(self.other_worker.get('group:1'), 'Группа')
+        self.worker.delete('group:1')
+        self.assertIsNone(self.other_worker.get('group:1'))
+
+    def test_lost_log_clears_l1(self):
+        """Если журнал инвалидаций потерян, L1 очищается целиком."""
+        self.worker.set('group:1', 'Группа')
+        self.assertEqual(self.other_worker.get('group:1'), 'Группа')
+        self.worker.delete('unrelated')
+        self.l2.clear()
+        self.l2.set('group:1', 'Новая группа')
+        self.assertEqual(self.other_worker.get('group:1'), 'Новая группа')
+
+    @override_settings(TIERED_L1_MAX_ENTRIES=2)
+    def test_l1_is_bounded(self):
+        """L1 хранит не больше TIERED_L1_MAX_ENTRIES ключей."""
+        for i in range(5):
+            self.worker.set(f'key:{i}', i)
+        self.assertEqual(list(self.worker.entries), ['key:3', 'key:4'])
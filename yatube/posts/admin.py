@@ -1,19 +1,149 @@
-from django.contrib import admin
+from core.cache.queryset import bump_table_version
+from core.cache.tiered import tiered_cache
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.db import router, transaction
+from django.db.models import Q
 
 from .models import Comment, Follow, Group, Post
+from .retention import Purger
+from .tasks import score_comments
+from .utils import posts_count_key
+
+
+def in_batches(queryset, values):
+    """Записывает values в строки queryset пачками, по UPDATE на пачку.
+
+    Сигналы post_save не посылаются, поэтому версия таблицы в кеше
+    запросов, счетчики постов авторов и баллы за скрытые или открытые
+    комментарии обновляются здесь, один раз на пачку. Возвращает число
+    измененных строк.
+    """
+    model = queryset.model
+    # Чтения админки могут идти в реплику, а писать надо в основную базу.
+    alias = queryset._db or router.db_for_write(model)
+    scored = model is Comment and 'hidden' in values
+    fields = ['pk', 'author_id']
+    if scored:
+        # Баллы поста меняются, только если видимость действительно сменилась.
+        queryset = queryset.exclude(hidden=values['hidden'])
+        fields.append('post_id')
+    rows = list(queryset.order_by().values_list(*fields))
+    size = settings.MODERATION_BATCH_SIZE
+    changed = 0
+    for start in range(0, len(rows), size):
+        batch = rows[start:start + size]
+        with transaction.atomic(using=alias):
+            changed += model.objects.using(alias).filter(
+                pk__in=[row[0] for row in batch]
+            ).update(**values)
+        bump_table_version(model._meta.db_table)
+        if model is Post:
+            tiered_cache.delete_many(
+                {posts_count_key(row[1]) for row in batch}
+            )
+        if scored:
+            score_comments(
+                [row[2] for row in batch], -1 if values['hidden'] else 1
+            )
+    return changed
+
+
+def delete_in_batches(queryset):
+    """Удаляет выбранные посты или комментарии пачками через Purger."""
+    ids = list(queryset.order_by().values_list('pk', flat=True))
+    size = settings.MODERATION_BATCH_SIZE
+    purger = Purger(batch_size=size)
+    for start in range(0, len(ids), size):
+        batch = Q(pk__in=ids[start:start + size])
+        if queryset.model is Post:
+            purger.posts(batch)
+        else:
+            for alias in purger.aliases():
+                purger.delete_comments(
+                    Comment.objects.using(alias).filter(batch), alias
+                )
+    return sum(purger.deleted.values())
+
+
+class PostActionForm(ActionForm):
+    group = forms.ModelChoiceField(
+        Group.objects.all(),
+        required=False,
+        label='Группа',
+        empty_label='без группы',
+    )
+
+
+class ModerationAdmin(admin.ModelAdmin):
+    """Массовые действия модератора без подтверждения по каждой строке.
+
+    Стандартное удаление сохраняет и удаляет объекты по одному и перед
+    этим показывает страницу со всеми связанными объектами. Здесь
+    строки меняются пачками, а результат — просто число строк.
+    """
+
+    actions = ('hide', 'unhide', 'delete_batched')
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def hide(self, request, queryset):
+        changed = in_batches(queryset, {'hidden': True})
+        self.message_user(request, f'Скрыто записей: {changed}')
+    hide.short_description = 'Скрыть выбранные'
+
+    def unhide(self, request, queryset):
+        changed = in_batches(queryset, {'hidden': False})
+        self.message_user(request, f'Открыто записей: {changed}')
+    unhide.short_description = 'Показать выбранные'
+
+    def delete_batched(self, request, queryset):
+        deleted = delete_in_batches(queryset)
+        self.message_user(request, f'Удалено строк: {deleted}')
+    delete_batched.short_description = 'Удалить выбранные пачками'
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ModerationAdmin):
     """Указание отображаемых полей в админке через PostAdmin."""
 
-    list_display = ('pk', 'text', 'pub_date', 'author', 'group',)
+    list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'hidden',)
     list_editable = ('group',)
     search_fields = ('text',)
-    list_filter = ('pub_date',)
+    list_filter = ('pub_date', 'hidden',)
     empty_value_display = '-пусто-'
+    action_form = PostActionForm
+    actions = ModerationAdmin.actions + ('move_to_group',)
+
+    def move_to_group(self, request, queryset):
+        try:
+            group = PostActionForm.base_fields['group'].clean(
+                request.POST.get('group')
+            )
+        except ValidationError:
+            self.message_user(request, 'Такой группы нет.', messages.ERROR)
+            return
+        changed = in_batches(queryset, {'group': group})
+        self.message_user(
+            request, f'Перенесено в «{group or "без группы"}»: {changed}'
+        )
+    move_to_group.short_description = 'Перенести в группу'
+
+
+@admin.register(Comment)
+class CommentAdmin(ModerationAdmin):
+    list_display = ('pk', 'text', 'created', 'author', 'post', 'hidden',)
+    search_fields = ('text',)
+    list_filter = ('created', 'hidden',)
+    # Путь в ветке считается при создании, перенос ответа его сломал бы.
+    readonly_fields = ('parent',)
 
 
 admin.site.register(Group)
-admin.site.register(Comment)
 admin.site.register(Follow)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     """Создание приложения posts."""
     name = 'posts'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from .sharding import seed_id_ranges
+        post_migrate.connect(seed_id_ranges, sender=self)
@@ -0,0 +1,58 @@
+from .models import ArchivedPost, Post
+from .sharding import shard_for
+
+
+def archived_copy(obj, archive_model):
+    """Архивная копия строки с тем же id и общими полями."""
+    names = {field.attname for field in archive_model._meta.concrete_fields}
+    return archive_model(**{
+        field.attname: getattr(obj, field.attname)
+        for field in obj._meta.concrete_fields
+        if field.attname in names
+    })
+
+
+class ChainedFeed:
+    """Лента из нескольких queryset'ов, идущих друг за другом.
+
+    Архивные посты старше любого горячего, поэтому лента автора —
+    это горячие посты, а за ними архивные. Поддерживает count()
+    и срезы, как требует Paginator.
+    """
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+
+    def counts(self):
+        if not hasattr(self, '_counts'):
+            self._counts = [queryset.count() for queryset in self.querysets]
+        return self._counts
+
+    def count(self):
+        return sum(self.counts())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        items = []
+        for queryset, count in zip(self.querysets, self.counts()):
+            if start < count and stop > 0:
+                items.extend(queryset[max(start, 0):min(stop, count)])
+            start -= count
+            stop -= count
+        return items
+
+
+def author_feed(author_id):
+    """Посты автора: сначала горячие, затем архивные."""
+    alias = shard_for(author_id)
+    return ChainedFeed([
+        Post.objects.using(alias)
+        .filter(author_id=author_id, hidden=False).cache(),
+        ArchivedPost.objects.using(alias)
+        .filter(author_id=author_id, hidden=False).cache(),
+    ])
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.db.models import Case, F, IntegerField, When
+from django.db.models.functions import Greatest
+
+from .sharding import shard_for
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedCounter:
+    """Счетчик в поле поста, приращения которого копятся в памяти процесса.
+
+    UPDATE на каждый просмотр или отметку выстраивал бы все запросы
+    в очередь за блокировкой записи SQLite, поэтому add() только
+    складывает приращение в Counter, а flush() пишет накопленное одним
+    UPDATE ... CASE на базу. В веб-процессе flush() раз
+    в COUNTERS_FLUSH_INTERVAL секунд вызывает фоновый поток (см.
+    enable_flusher), в остальных процессах — только явный вызов.
+    Показанные числа отстают на этот интервал, а при остановке процесса
+    несброшенные приращения теряются. Версия таблицы в кеше запросов
+    при сбросе не меняется: иначе кеш лент сбрасывался бы каждые
+    несколько секунд.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.counter = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, post, delta=1):
+        # Пост живет в шарде автора, а без шардов — в основной базе.
+        # Роутер не спрашиваем: для него это запись, и он закрепил бы
+        # читателя за основной базой (core.routers).
+        alias = shard_for(post.author_id) or DEFAULT_DB_ALIAS
+        ensure_flusher()
+        with self.lock:
+            self.counter[type(post), alias, post.pk] += delta
+
+    def flush(self):
+        """Пишет накопленное в базу; возвращает число учтенных изменений.
+
+        Если запись не удалась, приращения возвращаются в буфер
+        и будут записаны следующим сбросом.
+        """
+        with self.lock:
+            counter, self.counter = self.counter, Counter()
+        try:
+            self.write(counter)
+        except Exception:
+            with self.lock:
+                self.counter.update(counter)
+            raise
+        return sum(abs(delta) for delta in counter.values())
+
+    def write(self, counter):
+        batches = defaultdict(lambda: defaultdict(list))
+        for (model, alias, pk), delta in counter.items():
+            if delta:
+                batches[model, alias][delta].append(pk)
+        for (model, alias), by_delta in batches.items():
+            # Посты с одинаковым приращением объединяются в одно условие.
+            value = Case(
+                *[When(pk__in=ids, then=self.increment(delta))
+                  for delta, ids in by_delta.items()],
+                default=F(self.field),
+                output_field=model._meta.get_field(self.field),
+            )
+            ids = [pk for pks in by_delta.values() for pk in pks]
+            model.objects.using(alias).filter(pk__in=ids).update(
+                **{self.field: value}
+            )
+
+    def increment(self, delta):
+        if delta > 0:
+            return F(self.field) + delta
+        # Снятие отметки может прийти раньше ее постановки, которая еще
+        # в буфере другого процесса или потеряна при перезапуске.
+        # Поле неотрицательное, и без нижней границы UPDATE упал бы
+        # вместе с приращениями остальных постов.
+        return Greatest(
+            F(self.field) + delta, 0, output_field=IntegerField()
+        )
+
+
+views = BufferedCounter('views')
+likes = BufferedCounter('likes_count')
+
+flusher = None
+flusher_pid = None
+flusher_enabled = False
+flusher_lock = threading.Lock()
+
+
+def flush_all():
+    for counter in (views, likes):
+        try:
+            counter.flush()
+        except Exception:
+            logger.exception('Не удалось записать счетчик %s', counter.field)
+
+
+def run_flusher():
+    while True:
+        time.sleep(settings.COUNTERS_FLUSH_INTERVAL)
+        flush_all()
+        close_old_connections()
+
+
+def enable_flusher():
+    """Разрешает процессу фоновый сброс счетчиков (yatube/wsgi.py).
+
+    Сам поток запускает первый add() — в каждом процессе свой. Под
+    gunicorn --preload wsgi.py импортирует мастер, а запросы
+    обслуживают его форки, куда потоки мастера не переходят.
+    """
+    global flusher_enabled
+    flusher_enabled = True
+
+
+def ensure_flusher():
+    """Запускает поток сброса, если в этом процессе его еще нет."""
+    global flusher, flusher_pid
+    pid = os.getpid()
+    if not flusher_enabled or flusher_pid == pid:
+        return
+    with flusher_lock:
+        if flusher_pid == pid:
+            return
+        flusher = threading.Thread(
+            target=run_flusher, name='counters-flusher', daemon=True
+        )
+        flusher.start()
+        flusher_pid = pid
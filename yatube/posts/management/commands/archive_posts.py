@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from core.cache.queryset import bump_table_version
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+from posts.archive import archived_copy
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Like,
+                          Post)
+from posts.sharding import shards
+from posts.utils import delete_rows
+
+
+class Command(BaseCommand):
+    """Переносит старые посты и их комментарии в архивные таблицы."""
+
+    help = ('Переносит посты старше --days дней вместе с комментариями '
+            'в архив: горячие таблицы и их индексы остаются маленькими.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Возраст поста в днях, после которого он уходит в архив.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько строк будет перенесено.',
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        border = timezone.now() - timedelta(days=options['days'])
+        posts = comments = 0
+        # Без шардов читаем тоже из основной базы, а не из реплик.
+        for alias in shards():
+            alias = alias or DEFAULT_DB_ALIAS
+            moved = self.archive_shard(alias, border)
+            posts += moved[0]
+            comments += moved[1]
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f'{alias}: постов {moved[0]}, '
+                    f'комментариев {moved[1]}'
+                )
+        if posts and not self.dry_run:
+            for model in (Post, Comment, ArchivedPost, ArchivedComment):
+                bump_table_version(model._meta.db_table)
+        verb = 'Будет перенесено' if self.dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} в архив постов: {posts}, комментариев: {comments}'
+        ))
+
+    def archive_shard(self, alias, border):
+        """Архивирует посты одного шарда пачками по возрастанию id.
+
+        Копия и удаление идут в одной транзакции, так что пост в любой
+        момент лежит ровно в одной таблице. Сигналы удаления не
+        посылаются: картинка переходит к архивной копии.
+        """
+        posts = comments = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.using(alias)
+                .filter(pub_date__lt=border, pk__gt=last_pk)
+                .order_by('pk')[:self.batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            ids = [post.pk for post in batch]
+            batch_comments = list(
+                Comment.objects.using(alias).filter(post_id__in=ids)
+            )
+            posts += len(batch)
+            comments += len(batch_comments)
+            if self.dry_run:
+                continue
+            with transaction.atomic(using=alias):
+                ArchivedPost.objects.using(alias).bulk_create(
+                    [archived_copy(post, ArchivedPost) for post in batch],
+                    ignore_conflicts=True,
+                )
+                ArchivedComment.objects.using(alias).bulk_create(
+                    [archived_copy(comment, ArchivedComment)
+                     for comment in batch_comments],
+                    ignore_conflicts=True,
+                )
+                delete_rows(
+                    Comment,
+                    [comment.pk for comment in batch_comments], alias,
+                )
+                # Сами отметки в архив не идут, остается только их число.
+                Like.objects.using(alias).filter(post_id__in=ids).delete()
+                delete_rows(Post, ids, alias)
+        return posts, comments
@@ -0,0 +1,57 @@
+from core.cache.queryset import bump_table_version
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.sharding import shards
+from posts.utils import image_placeholder
+
+
+class Command(BaseCommand):
+    """Досчитывает заглушки для ранее загруженных картинок."""
+
+    help = ('Заполняет image_placeholder у постов, загруженных '
+            'до появления заглушек.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов обрабатывать за один проход.',
+        )
+
+    @staticmethod
+    def batches(batch_size):
+        """Пачки постов без заглушек из всех шардов."""
+        for alias in shards():
+            posts = Post.objects.using(alias)
+            last_pk = 0
+            while True:
+                batch = list(
+                    posts.filter(pk__gt=last_pk, image_placeholder='')
+                    .exclude(image='')
+                    .order_by('pk')
+                    .only('pk', 'image')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                yield posts, batch
+
+    def handle(self, *args, **options):
+        filled = failed = 0
+        for posts, batch in self.batches(options['batch_size']):
+            for post in batch:
+                try:
+                    with post.image.open('rb') as file:
+                        placeholder = image_placeholder(file)
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f'Пост {post.pk}: {error}')
+                    continue
+                posts.filter(pk=post.pk).update(
+                    image_placeholder=placeholder
+                )
+                filled += 1
+        if filled:
+            bump_table_version(Post._meta.db_table)
+        self.stdout.write(self.style.SUCCESS(
+            f'Заполнено заглушек: {filled}, с ошибками: {failed}'
+        ))
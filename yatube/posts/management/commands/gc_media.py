@@ -0,0 +1,223 @@
+import os
+import time
+from itertools import islice, product
+
+from core.models import MediaBlob
+from django.core.management.base import BaseCommand
+from posts.models import ArchivedPost, Post
+from posts.sharding import shards
+from sorl.thumbnail import default
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+
+def iter_files(storage, directory):
+    """Лениво обходит каталог хранилища, отдавая имена файлов и их mtime."""
+    root = storage.path(directory)
+    for dirpath, _, filenames in os.walk(root):
+        names = (
+            os.path.relpath(os.path.join(dirpath, filename), storage.location)
+            for filename in filenames
+        )
+        yield from file_times(storage, names)
+
+
+def file_times(storage, names):
+    """Отдает имена существующих файлов хранилища вместе с их mtime."""
+    for name in names:
+        name = name.replace('\\', '/')
+        try:
+            yield name, os.stat(storage.path(name)).st_mtime
+        except FileNotFoundError:
+            continue
+
+
+def batched(iterable, size):
+    """Разбивает поток на списки длиной не больше size."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Throttle:
+    """Ограничивает число операций в секунду."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+
+class Command(BaseCommand):
+    """Удаляет картинки постов и миниатюры, на которые никто не ссылается."""
+
+    help = ('Находит в MEDIA_ROOT/posts/ и в кеше миниатюр файлы без '
+            'ссылок из базы и удаляет их с ограничением скорости.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько файлов сверять с базой за один запрос.',
+        )
+        parser.add_argument(
+            '--rate', type=float, default=50,
+            help='Удалений в секунду, не больше (0 — без ограничения).',
+        )
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Не трогать файлы моложе стольких секунд.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.dry_run = options['dry_run']
+        self.batch_size = options['batch_size']
+        self.throttle = Throttle(options['rate'])
+        self.deadline = time.time() - options['min_age']
+        self.image_storage = Post._meta.get_field('image').storage
+        originals = self.collect_originals()
+        thumbnails = self.collect_thumbnails()
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: картинок {originals[0]} ({originals[1]} байт), '
+            f'миниатюр {thumbnails[0]} ({thumbnails[1]} байт)'
+        ))
+
+    def orphans(self, files, referenced):
+        """Отбирает достаточно старые файлы, которых нет в referenced."""
+        return [
+            name for name, mtime in files
+            if mtime < self.deadline and name not in referenced
+        ]
+
+    def remove(self, storage, name, delete):
+        """Удаляет файл с учетом dry-run и ограничения скорости."""
+        size = storage.size(name)
+        if self.verbosity > 1:
+            self.stdout.write(name)
+        if not self.dry_run:
+            self.throttle.wait()
+            delete(name)
+        return size
+
+    def delete_original(self, name):
+        """Удаляет картинку вместе с ее миниатюрами и счетчиком ссылок."""
+        delete_thumbnails(ImageFile(name, self.image_storage))
+        MediaBlob.objects.filter(name=name).delete()
+
+    def referenced(self, names):
+        """Имена из names, на которые ссылаются посты или архив."""
+        referenced = set()
+        for model, alias in product((Post, ArchivedPost), shards()):
+            referenced.update(
+                model.objects.using(alias).filter(image__in=names)
+                .values_list('image', flat=True)
+            )
+        return referenced
+
+    def collect_originals(self):
+        storage = self.image_storage
+        count = size = 0
+        for batch in batched(iter_files(storage, 'posts'), self.batch_size):
+            referenced = self.referenced([name for name, _ in batch])
+            for name in self.orphans(batch, referenced):
+                size += self.remove(storage, name, self.delete_original)
+                count += 1
+        return count, size
+
+    def kvstore_records(self, keys):
+        """Записи sorl о картинках по ключам ImageFile.key, одним запросом."""
+        values = KVStore.objects.filter(
+            key__in=[add_prefix(key) for key in keys]
+        ).values_list('value', flat=True)
+        return [deserialize_image_file(value) for value in values]
+
+    def dead_sources(self):
+        """Картинки с миниатюрами, на которые больше не ссылается ни один пост.
+
+        Список миниатюр каждой картинки sorl хранит в записи с identity
+        'thumbnails'. Записи читаются пачками по ключу, поэтому удаление
+        уже просмотренных не сбивает обход.
+        """
+        records = KVStore.objects.filter(
+            key__startswith=add_prefix('', identity='thumbnails')
+        ).order_by('key')
+        last_key = ''
+        while True:
+            keys = list(
+                records.filter(key__gt=last_key)
+                .values_list('key', flat=True)[:self.batch_size]
+            )
+            if not keys:
+                return
+            last_key = keys[-1]
+            sources = self.kvstore_records([del_prefix(key) for key in keys])
+            referenced = self.referenced([source.name for source in sources])
+            for source in sources:
+                if source.name not in referenced:
+                    yield source
+
+    def collect_dead_thumbnails(self, storage):
+        """Миниатюры картинок, которых больше нет в базе, и записи о них."""
+        count = size = 0
+        for source in self.dead_sources():
+            keys = default.kvstore._get(source.key, identity='thumbnails')
+            thumbnails = {
+                thumbnail.name: thumbnail
+                for thumbnail in self.kvstore_records(keys or ())
+            }
+            files = list(file_times(storage, thumbnails))
+            orphans = self.orphans(files, ())
+            for name in orphans:
+                size += self.remove(
+                    storage, name,
+                    lambda name: self.delete_thumbnail(thumbnails[name]),
+                )
+                count += 1
+            if not self.dry_run and len(orphans) == len(files):
+                default.kvstore.delete(source)
+        return count, size
+
+    def delete_thumbnail(self, thumbnail):
+        default.kvstore.delete(thumbnail, delete_thumbnails=False)
+        thumbnail.delete()
+
+    def collect_thumbnails(self):
+        """Миниатюры без живой картинки и файлы, которых sorl не знает.
+
+        Файлы кеша миниатюр сверяются с записями sorl пачками, как
+        картинки в collect_originals: миниатюра картинки, которую еще
+        показывают, всегда есть в kvstore.
+        """
+        storage = default.storage
+        prefix = thumbnail_settings.THUMBNAIL_PREFIX.strip('/')
+        if not storage.exists(prefix):
+            return 0, 0
+        count, size = self.collect_dead_thumbnails(storage)
+        for batch in batched(iter_files(storage, prefix), self.batch_size):
+            known = {
+                thumbnail.name for thumbnail in self.kvstore_records(
+                    ImageFile(name, storage).key for name, _ in batch
+                )
+            }
+            for name in self.orphans(batch, known):
+                size += self.remove(storage, name, storage.delete)
+                count += 1
+        return count, size
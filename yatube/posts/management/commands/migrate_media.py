@@ -0,0 +1,77 @@
+from core.cache.queryset import bump_table_version
+from core.storage import name_digest
+from django.core.management.base import BaseCommand
+from posts.models import Post
+from posts.sharding import shards
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+
+class Command(BaseCommand):
+    """Переносит картинки постов в контентно-адресуемое хранилище."""
+
+    help = ('Переименовывает картинки постов по хешу содержимого, '
+            'раскладывает их по каталогам и удаляет дубликаты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов обрабатывать за один проход.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько файлов будет перенесено.',
+        )
+
+    @staticmethod
+    def batches(batch_size):
+        """Пачки пар (id, картинка) постов из всех шардов."""
+        for alias in shards():
+            posts = Post.objects.using(alias)
+            last_pk = 0
+            while True:
+                batch = list(
+                    posts.filter(pk__gt=last_pk)
+                    .exclude(image='')
+                    .order_by('pk')
+                    .values_list('pk', 'image')[:batch_size]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                yield posts, batch
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        moved = missing = 0
+        for posts, batch in self.batches(batch_size):
+            old_names = set()
+            for pk, name in batch:
+                if name_digest(name):
+                    continue
+                if not storage.exists(name):
+                    missing += 1
+                    self.stderr.write(f'Пост {pk}: файл {name} не найден')
+                    continue
+                moved += 1
+                if dry_run:
+                    continue
+                with storage.open(name) as content:
+                    new_name = storage.save(name, content)
+                posts.filter(pk=pk, image=name).update(image=new_name)
+                storage.retain(new_name)
+                old_names.add(name)
+            for name in old_names:
+                if not any(
+                    Post.objects.using(alias).filter(image=name).exists()
+                    for alias in shards()
+                ):
+                    delete_thumbnails(ImageFile(name, storage))
+        if moved and not dry_run:
+            bump_table_version(Post._meta.db_table)
+        verb = 'Будет перенесено' if dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} файлов: {moved}, не найдено: {missing}'
+        ))
@@ -0,0 +1,70 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from posts.models import Group, User
+from posts.retention import Purger
+
+
+def start_of_day(value):
+    date = parse_date(value)
+    if date is None:
+        raise CommandError(f'Дата должна быть в формате ГГГГ-ММ-ДД: {value}')
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+class Command(BaseCommand):
+    """Удаляет пользователя, группу или посты за период пачками."""
+
+    help = ('Удаляет пользователя со всеми постами, комментариями '
+            'и подписками, группу с ее постами или посты за период. '
+            'Строки удаляются короткими транзакциями, сайт остается '
+            'доступным для записи.')
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', help='Имя пользователя.')
+        target.add_argument('--group', help='Slug группы.')
+        target.add_argument(
+            '--before', type=start_of_day,
+            help='Удалить посты, опубликованные раньше этой даты.',
+        )
+        parser.add_argument(
+            '--after', type=start_of_day,
+            help='Вместе с --before: посты не раньше этой даты.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько строк удалять за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.1,
+            help='Пауза между пачками в секундах.',
+        )
+
+    def handle(self, *args, **options):
+        purger = Purger(
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            progress=self.progress if options['verbosity'] > 1 else None,
+        )
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'Нет пользователя {options["user"]}.')
+            deleted = purger.user(user)
+        elif options['group']:
+            group = Group.objects.filter(slug=options['group']).first()
+            if group is None:
+                raise CommandError(f'Нет группы {options["group"]}.')
+            deleted = purger.group(group)
+        else:
+            deleted = purger.date_range(options['after'], options['before'])
+        summary = ', '.join(
+            f'{label}: {count}' for label, count in sorted(deleted.items())
+        ) or 'ничего'
+        self.stdout.write(self.style.SUCCESS(f'Удалено {summary}'))
+
+    def progress(self, model, deleted):
+        self.stdout.write(f'{model._meta.label}: удалено {deleted}')
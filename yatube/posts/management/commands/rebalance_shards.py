@@ -0,0 +1,171 @@
+from core.cache.queryset import bump_table_version
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.db import write_atomic
+from django.db import DEFAULT_DB_ALIAS, transaction
+from posts.models import (PATH_DIGITS, PATH_STEP, ArchivedComment,
+                          ArchivedPost, Comment, Like, Post, PostScore,
+                          path_segment)
+from posts.sharding import SHARD_ID_RANGE, id_range_start, shard_for, shards
+from posts.utils import delete_rows
+
+
+def remap_path(path, new_ids):
+    """Путь в ветке с id предков, замененными по new_ids."""
+    return ''.join(
+        path_segment(new_ids.get(pk, pk))
+        for pk in (
+            int(path[start:start + PATH_STEP], len(PATH_DIGITS))
+            for start in range(0, len(path), PATH_STEP)
+        )
+    )
+
+
+class Command(BaseCommand):
+    """Переносит посты и комментарии в шарды их авторов."""
+
+    help = ('Переносит посты авторов, оказавшиеся не в своем шарде '
+            '(например, после добавления шарда в DB_SHARDS), вместе '
+            'с комментариями и отметками, в том числе архивные.')
+
+    # Горячие и архивные таблицы переносятся одинаково: пост и строки,
+    # которые хранятся рядом с ним. Первыми идут комментарии.
+    tables = (
+        (Post, (Comment, Like)),
+        (ArchivedPost, (ArchivedComment,)),
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько постов переносить за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько строк будет перенесено.',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.POST_SHARDS:
+            raise CommandError('Шарды не настроены: задайте DB_SHARDS.')
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run']
+        posts = comments = 0
+        for post_model, child_models in self.tables:
+            moved_posts = 0
+            for source in shards():
+                authors = list(
+                    post_model.objects.using(source).order_by()
+                    .values_list('author_id', flat=True).distinct()
+                )
+                for author_id in authors:
+                    target = shard_for(author_id)
+                    if target == source:
+                        continue
+                    moved = self.move_author(
+                        post_model, child_models, author_id, source, target
+                    )
+                    moved_posts += moved[0]
+                    comments += moved[1]
+                    if options['verbosity'] > 1:
+                        self.stdout.write(
+                            f'{post_model.__name__}, автор {author_id}: '
+                            f'{source} -> {target}, постов {moved[0]}, '
+                            f'комментариев {moved[1]}'
+                        )
+            if moved_posts and not self.dry_run:
+                for model in (post_model,) + child_models:
+                    bump_table_version(model._meta.db_table)
+            posts += moved_posts
+        verb = 'Будет перенесено' if self.dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} постов: {posts}, комментариев: {comments}'
+        ))
+
+    def move_author(self, post_model, child_models, author_id, source,
+                    target):
+        """Переносит посты автора пачками: сначала копия, потом удаление.
+
+        Строки сохраняют свои id, если шард переезда выдает id выше
+        прежнего: по id виден прежний шард, и candidate_shards найдет
+        строку. В шард с диапазоном ниже строки переезжают с новыми id
+        (см. renumber). Повторный запуск после сбоя безопасен: уже
+        скопированные строки пропускаются. Исключение — пачка с новыми
+        id, прерванная между копией и удалением: ее строки останутся
+        в обоих шардах.
+        """
+        renumber = id_range_start(target) < id_range_start(source)
+        posts = comments = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                post_model.objects.using(source)
+                .filter(author_id=author_id, pk__gt=last_pk)
+                .order_by('pk')[:self.batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            ids = [post.pk for post in batch]
+            children = [
+                (model, list(
+                    model.objects.using(source).filter(post_id__in=ids)
+                    .order_by('pk')
+                ))
+                for model in child_models
+            ]
+            posts += len(batch)
+            comments += len(children[0][1])
+            if self.dry_run:
+                continue
+            with write_atomic(using=target):
+                if renumber:
+                    moved_ids = self.renumber(batch, children, target)
+                post_model.objects.using(target).bulk_create(
+                    batch, ignore_conflicts=True
+                )
+                for model, rows in children:
+                    model.objects.using(target).bulk_create(
+                        rows, ignore_conflicts=True
+                    )
+            with transaction.atomic(using=source):
+                for model, rows in children:
+                    delete_rows(model, [row.pk for row in rows], source)
+                delete_rows(post_model, ids, source)
+            if renumber and post_model is Post:
+                for old, new in moved_ids.items():
+                    PostScore.objects.using(DEFAULT_DB_ALIAS).filter(
+                        post_id=old
+                    ).update(post_id=new)
+        return posts, comments
+
+    @staticmethod
+    def renumber(batch, children, target):
+        """Выдает строкам новые id из диапазона target.
+
+        AUTOINCREMENT в SQLite продолжает счет от наибольшего id
+        в таблице, поэтому строка с id из диапазона выше увела бы
+        в него и все новые строки шарда. Ссылки на пост, родителя
+        и путь в ветке пересчитываются; порядок id сохраняется.
+        Возвращает новые id постов по прежним.
+        """
+        def remap(model, rows):
+            start = id_range_start(target)
+            last = model.objects.using(target).filter(
+                pk__gte=start, pk__lt=start + SHARD_ID_RANGE
+            ).order_by('-pk').values_list('pk', flat=True).first()
+            new_ids = {}
+            for number, row in enumerate(rows, start=(last or start) + 1):
+                new_ids[row.pk] = number
+                row.pk = number
+            return new_ids
+
+        posts = remap(type(batch[0]), batch)
+        for model, rows in children:
+            new_ids = remap(model, rows)
+            for row in rows:
+                row.post_id = posts[row.post_id]
+                if hasattr(row, 'path'):
+                    row.parent_id = new_ids.get(row.parent_id)
+                    row.path = remap_path(row.path, new_ids)
+        return posts
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from posts import trending
+
+
+class Command(BaseCommand):
+    """Пересчитывает рейтинг «Популярное»."""
+
+    help = ('Пересчитывает рейтинг недавних постов с учетом возраста '
+            'и просмотров и удаляет из него старые посты. Запускайте '
+            'из cron раз в несколько минут.')
+
+    def handle(self, *args, **options):
+        tracked, pruned = trending.refresh()
+        self.stdout.write(
+            f'Постов в рейтинге: {tracked}, удалено: {pruned}'
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    """Пересчитывает рекомендации подписок по графу подписок."""
+
+    help = ('Строит граф подписок в памяти и сохраняет каждому '
+            'пользователю авторов, которых читают его «соседи». '
+            'Запускайте из cron, например, раз в сутки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Скольким пользователям заменять рекомендации '
+                 'за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Сколько рекомендаций хранить на пользователя.',
+        )
+
+    def handle(self, *args, **options):
+        users, saved = suggestions.rebuild(
+            batch_size=options['batch_size'], limit=options['limit'],
+        )
+        self.stdout.write(
+            f'Пользователей: {users}, рекомендаций: {saved}'
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-19 07:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_content_addressed_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_placeholder',
+            field=models.TextField(blank=True, help_text='Уменьшенная копия картинки в виде data URI', verbose_name='Заглушка картинки'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-19 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_add_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedcomment',
+            name='hidden',
+            field=models.BooleanField(default=False, verbose_name='Скрыт'),
+        ),
+        migrations.AddField(
+            model_name='archivedpost',
+            name='hidden',
+            field=models.BooleanField(default=False, verbose_name='Скрыт'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='hidden',
+            field=models.BooleanField(default=False, help_text='Скрытые модератором записи видны только в админке', verbose_name='Скрыт'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='hidden',
+            field=models.BooleanField(default=False, help_text='Скрытые модератором записи видны только в админке', verbose_name='Скрыт'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.16 on 2026-10-19 08:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_add_comment_threads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post_id', models.IntegerField(primary_key=True, serialize=False, verbose_name='Пост')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('points', models.FloatField(default=0, verbose_name='Баллы за активность')),
+                ('score', models.FloatField(db_index=True, default=0, verbose_name='Рейтинг')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_scores', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг поста',
+                'verbose_name_plural': 'Рейтинг постов',
+            },
+        ),
+    ]
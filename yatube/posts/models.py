@@ -1,9 +1,44 @@
+from core.cache.queryset import CachingQuerySet
+from core.storage import ContentAddressedStorage
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, router, transaction
 
 User = get_user_model()
 
+# Путь комментария в ветке — id всех его предков и его собственный,
+# каждый в base36 и дополненный нулями до PATH_STEP знаков. Сортировка
+# по пути дает порядок показа ветки, а поддерево — это диапазон путей
+# с общим префиксом. В CharField на 255 знаков помещается 25 уровней.
+PATH_STEP = 10
+PATH_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+MAX_DEPTH = 255 // PATH_STEP - 1
+
+
+def path_segment(pk):
+    digits = ''
+    while pk:
+        pk, digit = divmod(pk, len(PATH_DIGITS))
+        digits = PATH_DIGITS[digit] + digits
+    return digits.rjust(PATH_STEP, '0')
+
+
+def subtree_end(path):
+    """Верхняя граница путей поддерева: больше любого из них."""
+    return path + '~'
+
+
+class ShardedQuerySet(CachingQuerySet):
+    """QuerySet моделей, которые могут жить в шардах (posts.sharding)."""
+
+    def create(self, **kwargs):
+        # В отличие от QuerySet.create, база без явного using() выбирается
+        # роутером по самому объекту, то есть по шарду автора.
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
 
 class Group(models.Model):
     """Группы, с описанием их тематики."""
@@ -16,6 +51,8 @@ class Group(models.Model):
     )
     description = models.TextField(verbose_name="Описание")
 
+    objects = CachingQuerySet.as_manager()
+
     def __str__(self):
         """Метод возвращающий строку title."""
         return self.title
@@ -54,9 +91,32 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         help_text='Загрузите картинку'
     )
+    image_placeholder = models.TextField(
+        'Заглушка картинки',
+        blank=True,
+        help_text='Уменьшенная копия картинки в виде data URI',
+    )
+    hidden = models.BooleanField(
+        'Скрыт',
+        default=False,
+        help_text='Скрытые модератором записи видны только в админке',
+    )
+    views = models.PositiveIntegerField(
+        'Просмотры',
+        default=0,
+        help_text='Пишется пачками из posts.counters, поэтому отстает',
+    )
+    likes_count = models.PositiveIntegerField(
+        'Отметок «нравится»',
+        default=0,
+        help_text='Пишется пачками из posts.counters, поэтому отстает',
+    )
+
+    objects = ShardedQuerySet.as_manager()
 
     def __str__(self):
         """выводим текст поста"""
@@ -91,14 +151,67 @@ class Comment(models.Model):
         related_name='comments',
         verbose_name='Автор',
     )
+    hidden = models.BooleanField(
+        'Скрыт',
+        default=False,
+        help_text='Скрытые модератором записи видны только в админке',
+    )
+    # Комментарии поста удаляются пачками мимо каскада (posts.retention),
+    # и родитель может уйти раньше ответов, поэтому ограничения внешнего
+    # ключа в базе нет.
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='replies',
+        verbose_name='Ответ на',
+    )
+    path = models.CharField(
+        'Путь в ветке', max_length=255, default='', editable=False,
+    )
+    depth = models.PositiveSmallIntegerField(
+        'Уровень вложенности', default=0, editable=False,
+    )
+
+    objects = ShardedQuerySet.as_manager()
 
     def __str__(self):
         """Метод возвращающий строку text."""
         return self.text
 
+    def save(self, *args, **kwargs):
+        if self.path:
+            return super().save(*args, **kwargs)
+        prefix = ''
+        if self.parent_id is not None:
+            parent = self.parent
+            prefix = parent.path
+            if parent.depth >= MAX_DEPTH:
+                # Глубже пути не хватит: ответ встает рядом с родителем.
+                self.parent_id = parent.parent_id
+                prefix = parent.path[:-PATH_STEP]
+        self.depth = len(prefix) // PATH_STEP
+        # В путь входит собственный id, известный только после вставки,
+        # поэтому новая запись сохраняется в два шага одной транзакцией.
+        using = (
+            kwargs.pop('using', None)
+            or router.db_for_write(type(self), instance=self)
+        )
+        with transaction.atomic(using=using):
+            super().save(*args, using=using, **kwargs)
+            self.path = prefix + path_segment(self.pk)
+            type(self).objects.using(using).filter(pk=self.pk).update(
+                path=self.path
+            )
+
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(fields=['post', 'path'], name='comment_thread_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -117,6 +230,194 @@ class Follow(models.Model):
         verbose_name='Автор',
     )
 
+    objects = CachingQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+
+
+class FollowSuggestion(models.Model):
+    """Автор, на которого стоит подписаться пользователю.
+
+    Таблицу целиком пересчитывает команда suggest_follows
+    (см. posts.suggestions), страницы только читают ее.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='follow_suggestions',
+        verbose_name='Пользователь',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggested_to',
+        verbose_name='Автор',
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow_suggestion'
+            ),
+        ]
+        verbose_name = 'Рекомендация подписки'
+        verbose_name_plural = 'Рекомендации подписок'
+
+
+class Like(models.Model):
+    """Отметка «нравится»: не больше одной от пользователя на пост.
+
+    Хранится в шарде поста, как и комментарии.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        verbose_name='Пользователь',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='likes',
+        verbose_name='Пост',
+    )
+    created = models.DateTimeField(
+        'Дата отметки',
+        auto_now_add=True,
+    )
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_like'
+            ),
+        ]
+        verbose_name = 'Отметка «нравится»'
+        verbose_name_plural = 'Отметки «нравится»'
+
+
+class PostScore(models.Model):
+    """Строка рейтинга «Популярное» для недавнего поста.
+
+    Рейтинг живет в основной базе, даже если посты разложены по шардам,
+    поэтому страница популярного — один запрос по индексу score.
+    points растут сразу при записи (комментарий, подписка на автора),
+    а score с учетом просмотров и возраста пересчитывает команда
+    refresh_trending (см. posts.trending).
+    """
+
+    post_id = models.IntegerField('Пост', primary_key=True)
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='post_scores',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+    points = models.FloatField('Баллы за активность', default=0)
+    score = models.FloatField('Рейтинг', default=0, db_index=True)
+
+    class Meta:
+        verbose_name = 'Рейтинг поста'
+        verbose_name_plural = 'Рейтинг постов'
+
+
+class ArchivedPost(models.Model):
+    """Старые посты, перенесенные из Post командой archive_posts.
+
+    id сохраняется, поэтому адреса постов не меняются.
+    """
+
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField('Текст поста')
+    pub_date = models.DateTimeField('Дата публикации')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_posts',
+        verbose_name='Автор',
+    )
+    group = models.ForeignKey(
+        Group,
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        related_name='archived_posts',
+        verbose_name='Группа',
+    )
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/',
+        storage=ContentAddressedStorage(),
+        blank=True,
+    )
+    image_placeholder = models.TextField('Заглушка картинки', blank=True)
+    hidden = models.BooleanField('Скрыт', default=False)
+    views = models.PositiveIntegerField('Просмотры', default=0)
+    likes_count = models.PositiveIntegerField(
+        'Отметок «нравится»', default=0
+    )
+    archived = models.DateTimeField('Дата архивации', auto_now_add=True)
+
+    objects = CachingQuerySet.as_manager()
+
+    def __str__(self):
+        return self.text[:settings.CHARS_LIMIT]
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Архивный пост'
+        verbose_name_plural = 'Архивные посты'
+
+
+class ArchivedComment(models.Model):
+    """Комментарии к архивным постам."""
+
+    id = models.IntegerField(primary_key=True)
+    text = models.TextField('Комментарий')
+    created = models.DateTimeField('Дата публикации')
+    post = models.ForeignKey(
+        ArchivedPost,
+        on_delete=models.CASCADE,
+        related_name='comments',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_comments',
+        verbose_name='Автор',
+    )
+    hidden = models.BooleanField('Скрыт', default=False)
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='replies',
+        verbose_name='Ответ на',
+    )
+    path = models.CharField('Путь в ветке', max_length=255, default='')
+    depth = models.PositiveSmallIntegerField('Уровень вложенности', default=0)
+
+    objects = CachingQuerySet.as_manager()
+
+    def __str__(self):
+        return self.text
+
+    class Meta:
+        verbose_name = 'Архивный комментарий'
+        verbose_name_plural = 'Архивные комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'path'], name='archived_comment_thread_idx'
+            ),
+        ]
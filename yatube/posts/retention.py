@@ -0,0 +1,213 @@
+import time
+from collections import Counter
+
+from core.cache.queryset import bump_table_version
+from core.cache.tiered import tiered_cache
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+
+from . import counters
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Like,
+                     Post)
+from .sharding import shards
+from .tasks import score_comments
+from .utils import delete_rows, posts_count_key, release_image
+
+# Посты удаляются вместе с комментариями и в горячих, и в архивных таблицах.
+POST_TABLES = ((Post, Comment), (ArchivedPost, ArchivedComment))
+
+
+class Purger:
+    """Удаляет посты, комментарии и подписки небольшими пачками.
+
+    Каскад Django собирает все связанные объекты в память и удаляет их
+    в одной транзакции, на время которой SQLite закрыт для записи.
+    Здесь каждая пачка удаляется одним DELETE ... WHERE id IN и сразу
+    коммитится, а между пачками есть пауза, так что сайт продолжает
+    писать. Порядок — ответы, комментарии, посты, подписки, сама
+    строка — не нарушает внешних ключей, и прерванную чистку можно
+    просто запустить заново.
+    """
+
+    def __init__(self, batch_size=500, pause=0.0, progress=None):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.progress = progress
+        self.deleted = Counter()
+
+    def user(self, user):
+        """Все следы пользователя, а затем и он сам."""
+        for alias in self.aliases():
+            self.delete_likes(alias, user)
+            for post_model, comment_model in POST_TABLES:
+                self.delete_comments(
+                    comment_model.objects.using(alias).filter(author=user),
+                    alias,
+                )
+                self.delete_posts(
+                    post_model, comment_model, alias, Q(author=user)
+                )
+        self.delete_batches(
+            Follow.objects.using(DEFAULT_DB_ALIAS)
+            .filter(Q(user=user) | Q(author=user)),
+            DEFAULT_DB_ALIAS,
+        )
+        self.delete_instance(user)
+        return self.deleted
+
+    def group(self, group):
+        """Посты группы, а затем и сама группа."""
+        self.posts(Q(group=group))
+        self.delete_instance(group)
+        return self.deleted
+
+    def date_range(self, since=None, until=None):
+        """Посты, опубликованные в промежутке [since, until)."""
+        condition = Q()
+        if since is not None:
+            condition &= Q(pub_date__gte=since)
+        if until is not None:
+            condition &= Q(pub_date__lt=until)
+        return self.posts(condition)
+
+    def posts(self, condition):
+        for alias in self.aliases():
+            for post_model, comment_model in POST_TABLES:
+                self.delete_posts(post_model, comment_model, alias, condition)
+        return self.deleted
+
+    @staticmethod
+    def aliases():
+        # Без шардов id читаем тоже из основной базы, а не из реплик.
+        return [alias or DEFAULT_DB_ALIAS for alias in shards()]
+
+    def delete_posts(self, post_model, comment_model, alias, condition):
+        """Пачка постов: сначала комментарии и отметки, потом сами посты."""
+        queryset = (
+            post_model.objects.using(alias).filter(condition).order_by('pk')
+        )
+        while True:
+            rows = list(
+                queryset.values_list('pk', 'author_id', 'image')
+                [:self.batch_size]
+            )
+            if not rows:
+                break
+            ids = [pk for pk, _, _ in rows]
+            self.delete_batches(
+                comment_model.objects.using(alias).filter(post_id__in=ids),
+                alias,
+            )
+            if post_model is Post:
+                self.delete_batches(
+                    Like.objects.using(alias).filter(post_id__in=ids), alias
+                )
+            self.delete_chunk(post_model, ids, alias)
+            # Сигналы post_delete не посылались: делаем их работу сами.
+            for _, _, image in rows:
+                if image:
+                    release_image(post_model(image=image).image, image)
+            tiered_cache.delete_many(
+                [posts_count_key(author_id) for _, author_id, _ in rows]
+            )
+
+    def delete_likes(self, alias, user):
+        """Отметки пользователя; счетчики постов уменьшаются сразу.
+
+        Как и при снятии отметки, счетчик не уходит ниже нуля: сама
+        отметка могла еще не попасть в него из буфера posts.counters.
+        """
+        likes = Like.objects.using(alias).filter(user_id=user.pk)
+        while True:
+            rows = list(
+                likes.order_by('pk').values_list('pk', 'post_id')
+                [:self.batch_size]
+            )
+            if not rows:
+                break
+            with transaction.atomic(using=alias):
+                Post.objects.using(alias).filter(
+                    pk__in=[post_id for _, post_id in rows]
+                ).update(likes_count=counters.likes.increment(-1))
+                delete_rows(Like, [pk for pk, _ in rows], alias)
+            self.record(Like, len(rows))
+
+    def delete_comments(self, queryset, alias):
+        """Комментарии вместе с ответами на них.
+
+        Ответ без родителя в ветке уже не показать, поэтому поддерево
+        удаляется целиком, причем раньше самого комментария: прерванная
+        чистка не оставит ответов, на которые ничто не ссылается.
+        Баллы видимых комментариев вычитаются из рейтинга популярного.
+        """
+        while True:
+            rows = list(
+                queryset.order_by('pk').values_list('pk', 'post_id', 'hidden')
+                [:self.batch_size]
+            )
+            if not rows:
+                break
+            ids = [pk for pk, _, _ in rows]
+            self.delete_comments(
+                queryset.model.objects.using(alias).filter(parent_id__in=ids),
+                alias,
+            )
+            self.delete_chunk(queryset.model, ids, alias)
+            if queryset.model is Comment:
+                score_comments(
+                    [post_id for _, post_id, hidden in rows if not hidden],
+                    -1,
+                )
+
+    def delete_instance(self, instance):
+        """Удаляет саму строку без каскада Django.
+
+        Посты и комментарии к этому моменту уже удалены по шардам,
+        остались прямые ссылки в основной базе: рекомендации, рейтинг,
+        журнал админки, группы и права пользователя. Они удаляются
+        пачками, а post_delete посылается вручную, чтобы сбросить кеши.
+        """
+        model = type(instance)
+        using = DEFAULT_DB_ALIAS
+        for field in model._meta.many_to_many:
+            self.delete_batches(
+                field.remote_field.through.objects.using(using)
+                .filter(**{field.m2m_field_name(): instance}),
+                using,
+            )
+        for relation in model._meta.related_objects:
+            related = relation.related_model.objects.using(using).filter(
+                **{relation.field.name: instance}
+            )
+            if relation.on_delete is models.SET_NULL:
+                related.update(**{relation.field.name: None})
+            elif relation.on_delete is models.CASCADE:
+                self.delete_batches(related, using)
+        with transaction.atomic(using=using):
+            delete_rows(model, [instance.pk], using)
+        post_delete.send(sender=model, instance=instance, using=using)
+        self.record(model, 1)
+
+    def delete_batches(self, queryset, alias):
+        while True:
+            ids = list(
+                queryset.order_by('pk').values_list('pk', flat=True)
+                [:self.batch_size]
+            )
+            if not ids:
+                break
+            self.delete_chunk(queryset.model, ids, alias)
+
+    def delete_chunk(self, model, ids, alias):
+        with transaction.atomic(using=alias):
+            delete_rows(model, ids, alias)
+        self.record(model, len(ids))
+
+    def record(self, model, count):
+        bump_table_version(model._meta.db_table)
+        self.deleted[model._meta.label] += count
+        if self.progress is not None:
+            self.progress(model, self.deleted[model._meta.label])
+        if self.pause:
+            time.sleep(self.pause)
@@ -0,0 +1,164 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import Http404
+
+from .models import (ArchivedComment, ArchivedPost, Comment, Like, Post,
+                     User)
+
+# Каждый шард выдает id из своего диапазона, поэтому id постов
+# и комментариев уникальны во всех шардах и по id виден домашний шард.
+SHARD_ID_RANGE = 10 ** 12
+SHARDED_MODELS = (Post, Comment, Like)
+# Архив живет в том же шарде, что и горячие строки автора.
+ARCHIVE_MODELS = (ArchivedPost, ArchivedComment)
+
+
+def shards():
+    """Алиасы шардов; без шардов — [None], то есть базу выбирают роутеры."""
+    return settings.POST_SHARDS or [None]
+
+
+def shard_for(author_id):
+    """Шард, в котором живут посты автора и комментарии к ним."""
+    aliases = shards()
+    return aliases[author_id % len(aliases)]
+
+
+def candidate_shards(pk):
+    """Шарды в порядке вероятности найти в них строку с этим id.
+
+    Первым идет шард, выдавший id; после перебалансировки строка могла
+    переехать в другой.
+    """
+    aliases = shards()
+    home = pk // SHARD_ID_RANGE
+    if home < len(aliases):
+        return [aliases[home]] + [
+            alias for alias in aliases if alias != aliases[home]
+        ]
+    return aliases
+
+
+def get_post_or_404(post_id, archived=False, hidden=False):
+    """Ищет пост по всем шардам, с archived=True — и в архиве.
+
+    Скрытые модератором посты находятся только с hidden=True.
+    """
+    models = (Post, ArchivedPost) if archived else (Post,)
+    for model in models:
+        for alias in candidate_shards(post_id):
+            post = model.objects.using(alias).filter(pk=post_id).first()
+            if post is not None:
+                if post.hidden and not hidden:
+                    break
+                return post
+    raise Http404('Пост не найден')
+
+
+def id_range_start(alias):
+    """Первый id диапазона, который выдает шард."""
+    return settings.POST_SHARDS.index(alias) * SHARD_ID_RANGE
+
+
+def seed_id_ranges(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Сдвигает счетчики id таблиц шарда в его диапазон (post_migrate)."""
+    if using not in settings.POST_SHARDS:
+        return
+    start = id_range_start(using)
+    if not start:
+        return
+    with connections[using].cursor() as cursor:
+        for model in SHARDED_MODELS:
+            table = model._meta.db_table
+            cursor.execute(
+                'UPDATE sqlite_sequence SET seq = MAX(seq, %s)'
+                ' WHERE name = %s', [start, table],
+            )
+            if not cursor.rowcount:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                    [table, start],
+                )
+
+
+class ShardRouter:
+    """Раскладывает посты по шардам по id автора.
+
+    Комментарии и отметки «нравится» хранятся в шарде своего поста.
+    Запросы без подсказки (например, ленты всех постов) роутер направить
+    не может — для них есть feed() и get_post_or_404(). Без POST_SHARDS
+    роутер ничего не решает.
+    """
+
+    def db_for_read(self, model, instance=None, **hints):
+        if (not settings.POST_SHARDS
+                or model not in SHARDED_MODELS + ARCHIVE_MODELS):
+            return None
+        if isinstance(instance, SHARDED_MODELS + ARCHIVE_MODELS):
+            return instance._state.db
+        if model in (Post, ArchivedPost) and isinstance(instance, User):
+            return shard_for(instance.pk)
+        return None
+
+    def db_for_write(self, model, instance=None, **hints):
+        if (not settings.POST_SHARDS
+                or model not in SHARDED_MODELS + ARCHIVE_MODELS):
+            return None
+        if (isinstance(instance, SHARDED_MODELS + ARCHIVE_MODELS)
+                and not instance._state.adding):
+            return instance._state.db
+        if isinstance(instance, (Post, ArchivedPost)):
+            return shard_for(instance.author_id)
+        if model is Post and isinstance(instance, User):
+            return shard_for(instance.pk)
+        if isinstance(instance, (Comment, Like)):
+            if type(instance).post.is_cached(instance):
+                return instance.post._state.db
+            return get_post_or_404(
+                instance.post_id, hidden=True
+            )._state.db
+        return None
+
+
+class MergedFeed:
+    """Лента, слитая из нескольких шардов по убыванию даты.
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator.
+    Для страницы [start:stop] из каждого шарда читается не больше stop
+    строк, и они сливаются кучей (k-way merge).
+    """
+
+    def __init__(self, querysets):
+        self.querysets = querysets
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        parts = [list(queryset[:stop]) for queryset in self.querysets]
+        merged = heapq.merge(
+            *parts, key=lambda post: (post.pub_date, post.pk), reverse=True
+        )
+        return list(islice(merged, start, stop))
+
+
+def feed(queryset):
+    """Лента постов по всем шардам.
+
+    Без шардов возвращает queryset как есть. С шардами связанные таблицы
+    не присоединяются (пользователи и группы живут в основной базе),
+    их подставляет post_paginator.
+    """
+    if not settings.POST_SHARDS:
+        return queryset
+    queryset = queryset.select_related(None).order_by('-pub_date', '-pk')
+    return MergedFeed([queryset.using(alias) for alias in shards()])
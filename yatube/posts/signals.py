@@ -0,0 +1,169 @@
+from core.cache.tiered import tiered_cache
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import (ArchivedPost, Comment, Follow, FollowSuggestion, Group,
+                     Post, User)
+from .tasks import (process_images, score_comments, score_posts,
+                    update_image_references)
+from .utils import GROUPS_KEY, author_key, posts_count_key
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_image(sender, instance, using, update_fields=None,
+                       **kwargs):
+    """Запоминает, какая картинка была у поста до сохранения."""
+    instance._old_image = instance.image.name or ''
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    instance._old_image = ''
+    if instance.pk:
+        instance._old_image = sender.objects.using(using).filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first() or ''
+
+
+@receiver(pre_save, sender=Post)
+def reset_image_placeholder(sender, instance, **kwargs):
+    """Сбрасывает заглушку, если картинку убрали или заменили.
+
+    Новую картинку в запросе не декодируем: заглушку посчитает
+    задача posts.process_images.
+    """
+    image = instance.image
+    instance._new_upload = bool(image) and not image._committed
+    if not image or instance._new_upload:
+        instance.image_placeholder = ''
+
+
+@receiver(post_save, sender=Post)
+def queue_image_work(sender, instance, **kwargs):
+    """Ставит в очередь обработку новой картинки и пересчет ссылок."""
+    old_name = getattr(instance, '_old_image', '')
+    new_name = instance.image.name or ''
+    if getattr(instance, '_new_upload', False):
+        # Без ключа: повторная загрузка той же картинки (A -> B -> A)
+        # тоже должна обработаться, а лишний прогон ничего не портит.
+        process_images.delay(post_id=instance.pk)
+    if old_name != new_name:
+        update_image_references.delay(
+            retain=new_name or None, release=old_name or None
+        )
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+def release_deleted_image(sender, instance, **kwargs):
+    """Ставит в очередь снятие ссылки с картинки удаленного поста."""
+    if instance.image.name:
+        update_image_references.delay(release=instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=ArchivedPost)
+def invalidate_author_stats(sender, instance, created=True, **kwargs):
+    """Сбрасывает закешированную статистику автора.
+
+    Правка поста число постов не меняет, а post_delete не передает created.
+    """
+    if created:
+        tiered_cache.delete(posts_count_key(instance.author_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_registry(sender, **kwargs):
+    """Сбрасывает реестр групп во всех процессах."""
+    tiered_cache.delete(GROUPS_KEY)
+
+
+AUTHOR_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(pre_save, sender=User)
+def remember_old_username(sender, instance, update_fields=None, **kwargs):
+    """Запоминает прежний username, чтобы сбросить и его запись."""
+    instance._old_username = None
+    if not instance.pk:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    instance._old_username = (
+        User.objects.filter(pk=instance.pk)
+        .values_list('username', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_author_record(sender, instance, update_fields=None,
+                             **kwargs):
+    """Сбрасывает закешированную запись автора, в том числе «нет такого»."""
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        # Например, вход пользователя обновляет только last_login.
+        return
+    usernames = {instance.username, getattr(instance, '_old_username', None)}
+    usernames.discard(None)
+    tiered_cache.delete_many([author_key(name) for name in usernames])
+
+
+@receiver(post_save, sender=Post)
+def track_trending(sender, instance, created, **kwargs):
+    """Новый пост попадает в рейтинг популярного."""
+    if created:
+        score_posts.delay(
+            track=instance.pk,
+            author_id=instance.author_id,
+            pub_date=instance.pub_date,
+        )
+
+
+@receiver(post_delete, sender=Post)
+def untrack_trending(sender, instance, **kwargs):
+    score_posts.delay(untrack=instance.pk)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_hidden(sender, instance, using, **kwargs):
+    """Запоминает, был ли комментарий скрыт до сохранения."""
+    instance._was_hidden = None
+    if instance.pk:
+        instance._was_hidden = sender.objects.using(using).filter(
+            pk=instance.pk
+        ).values_list('hidden', flat=True).first()
+
+
+@receiver(post_save, sender=Comment)
+def score_comment(sender, instance, created, **kwargs):
+    """Видимый комментарий поднимает пост в рейтинге, скрытый — нет."""
+    was_hidden = True if created else instance._was_hidden
+    if was_hidden is not None and was_hidden != instance.hidden:
+        score_comments([instance.post_id], -1 if instance.hidden else 1)
+
+
+@receiver(post_delete, sender=Comment)
+def unscore_comment(sender, instance, **kwargs):
+    """Удаленный комментарий больше не поднимает пост."""
+    if not instance.hidden:
+        score_comments([instance.post_id], -1)
+
+
+@receiver(post_save, sender=Follow)
+def score_follow(sender, instance, created, **kwargs):
+    """Новый подписчик поднимает недавние посты автора."""
+    if created:
+        score_posts.delay(
+            points=settings.TRENDING_FOLLOW_WEIGHT,
+            author_id=instance.author_id,
+        )
+
+
+@receiver(post_save, sender=Follow)
+def drop_suggestion(sender, instance, created, **kwargs):
+    """Автор, на которого подписались, больше не рекомендуется."""
+    if created:
+        FollowSuggestion.objects.filter(
+            user_id=instance.user_id, author_id=instance.author_id
+        ).delete()
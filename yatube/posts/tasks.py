@@ -0,0 +1,160 @@
+import logging
+import time
+from collections import Counter
+from datetime import datetime
+from itertools import product
+
+from core.cache.queryset import bump_table_version
+from core.db import write_atomic
+from core.tasks import task
+from django.conf import settings
+from django.core.mail import send_mail
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from . import trending
+from .models import ArchivedPost, Post, User
+from .sharding import get_post_or_404, shards
+from .utils import attach_authors, image_placeholder, release_image
+
+logger = logging.getLogger(__name__)
+
+# Должно совпадать с {% thumbnail %} в posts/includes/post_image.html.
+THUMBNAIL_GEOMETRY = '960x339'
+THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+@task('posts.process_images', batch=True)
+def process_images(payloads):
+    """Заглушки и миниатюры новых картинок постов.
+
+    Ставится сигналом сохранения поста: декодировать картинку прямо
+    в запросе — значит задерживать ответ, а миниатюру иначе строил бы
+    первый запрос страницы с постом.
+    """
+    ids = {payload['post_id'] for payload in payloads}
+    processed = False
+    for alias in shards():
+        posts = Post.objects.using(alias)
+        for post in (
+            posts.filter(pk__in=ids).exclude(image='').only('pk', 'image')
+        ):
+            try:
+                with post.image.open('rb') as file:
+                    placeholder = image_placeholder(file)
+            except OSError:
+                logger.exception('Не удалось прочитать картинку %s', post.pk)
+                continue
+            # Картинку могли заменить, пока задача ждала в очереди.
+            posts.filter(pk=post.pk, image=post.image.name).update(
+                image_placeholder=placeholder
+            )
+            get_thumbnail(post.image, THUMBNAIL_GEOMETRY, **THUMBNAIL_OPTIONS)
+            processed = True
+    if processed:
+        bump_table_version(Post._meta.db_table)
+
+
+def image_in_use(name):
+    return any(
+        model.objects.using(alias).filter(image=name).exists()
+        for model, alias in product((Post, ArchivedPost), shards())
+    )
+
+
+@task('posts.update_image_references')
+def update_image_references(retain=None, release=None):
+    """Счетчики ссылок на файлы картинок (core.MediaBlob).
+
+    Каждая замена картинки — отдельная задача в одной транзакции:
+    упавшая задача откатывается целиком, и повтор не учтет новую
+    ссылку второй раз. Новая ссылка на тот же файл может прийти
+    следующей задачей, поэтому файл без ссылок удаляется, только если
+    ни один пост на него уже не ссылается.
+    """
+    field_file = Post(image='').image
+    with write_atomic():
+        if retain:
+            field_file.storage.retain(retain)
+        if release:
+            release_image(
+                field_file, release, keep_file=image_in_use(release)
+            )
+
+
+@task('posts.score_posts', batch=True)
+def score_posts(payloads):
+    """События рейтинга популярного, одной пачкой (posts.trending)."""
+    trending.apply(payloads)
+
+
+def score_comments(post_ids, sign=1):
+    """Баллы постам за появившиеся (sign=1) или пропавшие (-1) комментарии.
+
+    post_ids — по id поста на каждый комментарий.
+    """
+    for post_id, count in Counter(post_ids).items():
+        score_posts.delay(
+            points=sign * count * settings.TRENDING_COMMENT_WEIGHT,
+            post_id=post_id,
+        )
+
+
+@task('posts.comment_digest')
+def comment_digest(post_id, bucket):
+    """Одно письмо автору поста обо всех комментариях за окно bucket."""
+    try:
+        post = get_post_or_404(post_id)
+    except Http404:
+        return
+    author = User.objects.filter(pk=post.author_id).first()
+    if author is None or not author.email:
+        return
+    window = settings.COMMENT_DIGEST_WINDOW
+    comments = list(
+        post.comments.filter(
+            created__gte=datetime.fromtimestamp(bucket * window, timezone.utc),
+            created__lt=datetime.fromtimestamp(
+                (bucket + 1) * window, timezone.utc
+            ),
+            hidden=False,
+        ).exclude(author_id=author.pk).order_by('created')
+    )
+    if not comments:
+        return
+    attach_authors(comments)
+    send_mail(
+        f'Новые комментарии к посту «{post}»',
+        render_to_string('posts/email/comment_digest.txt', {
+            'author': author,
+            'post': post,
+            'comments': comments,
+            'post_url': settings.SITE_URL + reverse(
+                'posts:post_detail', args=[post.pk]
+            ),
+        }),
+        None,
+        [author.email],
+    )
+
+
+def enqueue_comment_digest(comment):
+    """Ставит письмо автору поста, если за это окно его еще не ставили.
+
+    Окно определяется временем комментария, а ключ идемпотентности —
+    постом и окном, поэтому активное обсуждение дает одно письмо
+    в COMMENT_DIGEST_WINDOW секунд, отправленное в конце окна.
+    """
+    if comment.author_id == comment.post.author_id:
+        return
+    window = settings.COMMENT_DIGEST_WINDOW
+    bucket = int(comment.created.timestamp() // window)
+    comment_digest.delay(
+        post_id=comment.post_id,
+        bucket=bucket,
+        key=f'comment_digest:{comment.post_id}:{bucket}',
+        countdown=max(0, (bucket + 1) * window - time.time()),
+    )
@@ -0,0 +1,102 @@
+from core.tasks import run_pending
+from django.conf import settings
+from django.contrib.admin import ACTION_CHECKBOX_NAME
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Group, Post, PostScore, User
+
+
+class ModerationActionsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.moderator = User.objects.create_superuser(
+            username='moderator', email='moderator@example.com',
+            password='password',
+        )
+        cls.author = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.posts = [
+            Post.objects.create(
+                author=ModerationActionsTest.author, text=f'Пост {number}'
+            )
+            for number in range(3)
+        ]
+        self.comment = Comment.objects.create(
+            post=self.posts[0], author=ModerationActionsTest.author,
+            text='Комментарий',
+        )
+        self.admin = Client()
+        self.admin.force_login(ModerationActionsTest.moderator)
+        self.guest = Client()
+
+    def act(self, model, action, objects, **data):
+        url = reverse(f'admin:posts_{model}_changelist')
+        return self.admin.post(url, {
+            'action': action,
+            ACTION_CHECKBOX_NAME: [obj.pk for obj in objects],
+            **data,
+        }, follow=True)
+
+    def test_hide_removes_posts_from_site(self):
+        """Скрытые посты пропадают из ленты и со своей страницы."""
+        response = self.act('post', 'hide', self.posts[:2])
+        self.assertContains(response, 'Скрыто записей: 2')
+        response = self.guest.get(reverse('posts:index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [self.posts[2]]
+        )
+        response = self.guest.get(
+            reverse('posts:post_detail', args=[self.posts[0].pk])
+        )
+        self.assertEqual(response.status_code, 404)
+        self.act('post', 'unhide', self.posts[:2])
+        response = self.guest.get(reverse('posts:index'))
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_hide_comments(self):
+        """Скрытый комментарий не показывается под постом."""
+        self.act('comment', 'hide', [self.comment])
+        response = self.guest.get(
+            reverse('posts:post_detail', args=[self.posts[0].pk])
+        )
+        self.assertNotContains(response, 'Комментарий')
+
+    def test_hidden_comment_loses_trending_points(self):
+        """Скрытие комментария вычитает его баллы, открытие — возвращает."""
+        self.act('comment', 'hide', [self.comment])
+        run_pending()
+        score = PostScore.objects.get(post_id=self.posts[0].pk)
+        self.assertEqual(score.points, 0)
+        self.act('comment', 'unhide', [self.comment])
+        run_pending()
+        score.refresh_from_db()
+        self.assertEqual(score.points, settings.TRENDING_COMMENT_WEIGHT)
+
+    def test_move_to_group(self):
+        """Посты переносятся в выбранную группу одним действием."""
+        response = self.act(
+            'post', 'move_to_group', self.posts,
+            group=ModerationActionsTest.group.pk,
+        )
+        self.assertContains(response, 'Перенесено в «Группа»: 3')
+        response = self.guest.get(
+            reverse('posts:group_posts', args=['group'])
+        )
+        self.assertEqual(len(response.context['page_obj']), 3)
+        self.act('post', 'move_to_group', self.posts[:1], group='')
+        self.assertIsNone(Post.objects.get(pk=self.posts[0].pk).group)
+
+    def test_delete_without_confirmation(self):
+        """Удаление сразу удаляет посты с комментариями."""
+        response = self.act('post', 'delete_batched', self.posts[:1])
+        self.assertContains(response, 'Удалено строк: 2')
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertFalse(Comment.objects.exists())
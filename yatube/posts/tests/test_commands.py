@@ -0,0 +1,448 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from core.models import MediaBlob
+from core.storage import name_digest
+from core.tasks import run_pending
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from ..models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                      FollowSuggestion, Group, Like, Post, PostScore, User)
+from ..retention import Purger
+from ..utils import delete_rows
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MigrateMediaCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_legacy_images_are_moved_and_deduplicated(self):
+        """Старые картинки переносятся в хранилище без дубликатов."""
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        for name in ('first.gif', 'second.gif'):
+            with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', name), 'wb') as f:
+                f.write(b'GIF89a-legacy')
+        first = Post.objects.create(
+            author=MigrateMediaCommandTest.user, text='Первый',
+            image='posts/first.gif',
+        )
+        second = Post.objects.create(
+            author=MigrateMediaCommandTest.user, text='Второй',
+            image='posts/second.gif',
+        )
+        call_command('migrate_media', stdout=open(os.devnull, 'w'))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertIsNotNone(name_digest(first.image.name))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(os.path.exists(first.image.path))
+        self.assertEqual(
+            MediaBlob.objects.get(name=first.image.name).refcount, 2
+        )
+        self.assertFalse(os.path.exists(
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'first.gif')
+        ))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GarbageCollectMediaCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(
+            author=GarbageCollectMediaCommandTest.user,
+            text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+        self.thumbnail = get_thumbnail(self.post.image, '960x339')
+        self.orphan = os.path.join(TEMP_MEDIA_ROOT, 'posts', 'orphan.gif')
+        with open(self.orphan, 'wb') as f:
+            f.write(SMALL_GIF)
+        self.orphan_thumbnail = os.path.join(
+            TEMP_MEDIA_ROOT, 'cache', 'orphan.jpg'
+        )
+        with open(self.orphan_thumbnail, 'wb') as f:
+            f.write(SMALL_GIF)
+
+    def gc_media(self, *args):
+        call_command(
+            'gc_media', '--min-age=0', '--rate=0', *args,
+            stdout=open(os.devnull, 'w'),
+        )
+
+    def test_dry_run_keeps_files(self):
+        """Пробный запуск ничего не удаляет."""
+        self.gc_media('--dry-run')
+        self.assertTrue(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.orphan_thumbnail))
+
+    def test_only_orphans_are_deleted(self):
+        """Удаляются только файлы, на которые не ссылается ни один пост."""
+        self.gc_media()
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertFalse(os.path.exists(self.orphan_thumbnail))
+        self.assertTrue(os.path.exists(self.post.image.path))
+        self.assertTrue(self.thumbnail.exists())
+
+    def test_thumbnails_of_forgotten_image_are_deleted(self):
+        """Миниатюры картинки, на которую не ссылаются посты, удаляются."""
+        source = ImageFile(self.post.image.name, self.post.image.storage)
+        os.remove(self.post.image.path)
+        Post.objects.filter(pk=self.post.pk).update(image='')
+        self.gc_media('--batch-size=1')
+        self.assertFalse(self.thumbnail.exists())
+        self.assertIsNone(default.kvstore.get(self.thumbnail))
+        self.assertIsNone(default.kvstore.get(source))
+
+
+class ArchivePostsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        cache.clear()
+        self.old = Post.objects.create(
+            author=ArchivePostsCommandTest.user, text='Старый пост'
+        )
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - timedelta(days=400)
+        )
+        Comment.objects.create(
+            post=self.old, author=ArchivePostsCommandTest.user,
+            text='Старый комментарий',
+        )
+        self.fresh = Post.objects.create(
+            author=ArchivePostsCommandTest.user, text='Новый пост'
+        )
+        self.client = Client()
+        self.client.force_login(ArchivePostsCommandTest.user)
+
+    def archive(self, *args):
+        call_command(
+            'archive_posts', '--days=365', *args,
+            stdout=open(os.devnull, 'w'),
+        )
+
+    def test_dry_run_keeps_posts(self):
+        """Пробный запуск ничего не переносит."""
+        self.archive('--dry-run')
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertFalse(ArchivedPost.objects.exists())
+
+    def test_old_posts_are_moved_with_comments(self):
+        """Старый пост переезжает в архив с тем же id и комментариями."""
+        self.archive()
+        self.assertEqual(list(Post.objects.all()), [self.fresh])
+        self.assertFalse(Comment.objects.exists())
+        archived = ArchivedPost.objects.get()
+        self.assertEqual(archived.pk, self.old.pk)
+        self.assertEqual(archived.text, 'Старый пост')
+        self.assertEqual(
+            ArchivedComment.objects.get().post_id, self.old.pk
+        )
+
+    def test_archived_posts_are_readable(self):
+        """Архивный пост виден в профиле и на своей странице без формы."""
+        self.archive()
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(list(response.context['page_obj']), [self.fresh])
+        response = self.client.get(
+            reverse('posts:profile', args=['auth'])
+        )
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Новый пост', 'Старый пост'],
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.old.pk])
+        )
+        self.assertContains(response, 'Старый комментарий')
+        self.assertEqual(response.context['posts_count'], 2)
+        self.assertTrue(response.context['archived'])
+        self.assertNotContains(
+            response, reverse('posts:add_comment', args=[self.old.pk])
+        )
+
+
+class PurgeCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Спам', slug='spam', description='Спам'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.spammer = User.objects.create_user(username='spammer')
+        self.reader = User.objects.create_user(username='reader')
+        self.kept = Post.objects.create(author=self.reader, text='Пост')
+        self.spam = [
+            Post.objects.create(
+                author=self.spammer, text=f'Спам {number}',
+                group=PurgeCommandTest.group,
+            )
+            for number in range(3)
+        ]
+        Comment.objects.create(
+            post=self.spam[0], author=self.reader, text='Ответ'
+        )
+        Comment.objects.create(
+            post=self.kept, author=self.spammer, text='Спам'
+        )
+        Follow.objects.create(user=self.spammer, author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.spammer)
+
+    def purge(self, *args):
+        out = StringIO()
+        call_command(
+            'purge', '--batch-size=1', '--pause=0', '-v2', *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_user_is_deleted_with_everything(self):
+        """Пользователь удаляется со всеми своими постами и подписками."""
+        out = self.purge('--user', 'spammer')
+        self.assertIn('posts.Post: удалено 3', out)
+        self.assertFalse(User.objects.filter(username='spammer').exists())
+        self.assertEqual(list(Post.objects.all()), [self.kept])
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+
+    def test_user_purge_deletes_replies_and_references(self):
+        """Ответы на комментарии пользователя и ссылки на него удаляются."""
+        spam = Comment.objects.get(author=self.spammer)
+        reply = Comment.objects.create(
+            post=self.kept, author=self.reader, text='Ответ', parent=spam
+        )
+        Comment.objects.create(
+            post=self.kept, author=self.reader, text='Ответ', parent=reply
+        )
+        FollowSuggestion.objects.create(
+            user=self.reader, author=self.spammer, score=1
+        )
+        run_pending()
+        self.assertTrue(
+            PostScore.objects.filter(author_id=self.spammer.pk).exists()
+        )
+        with mock.patch('django.db.models.deletion.Collector.collect') as (
+            collect
+        ):
+            self.purge('--user', 'spammer')
+        collect.assert_not_called()
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(FollowSuggestion.objects.exists())
+        self.assertFalse(
+            PostScore.objects.filter(author_id=self.spammer.pk).exists()
+        )
+
+    def test_user_purge_with_unflushed_like(self):
+        """Отметка, еще не дошедшая до счетчика, не ломает чистку."""
+        Like.objects.create(user=self.spammer, post=self.kept)
+        self.purge('--user', 'spammer')
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.likes_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_group_is_deleted_with_posts(self):
+        """Группа удаляется вместе со своими постами."""
+        self.purge('--group', 'spam')
+        self.assertFalse(Group.objects.exists())
+        self.assertEqual(list(Post.objects.all()), [self.kept])
+        self.assertEqual(Comment.objects.get().post, self.kept)
+
+    def test_date_range(self):
+        """Удаляются только посты из заданного периода."""
+        Post.objects.filter(pk=self.kept.pk).update(
+            pub_date=timezone.now() - timedelta(days=30)
+        )
+        before = (timezone.now() - timedelta(days=1)).date().isoformat()
+        self.purge('--before', before)
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertFalse(Post.objects.filter(pk=self.kept.pk).exists())
+
+
+class RefreshTrendingCommandTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='auth')
+        self.reader = User.objects.create_user(username='reader')
+        self.quiet, self.busy, self.old = [
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+            for number in range(3)
+        ]
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - timedelta(days=30)
+        )
+        run_pending()
+
+    def refresh(self):
+        out = StringIO()
+        call_command('refresh_trending', stdout=out)
+        return out.getvalue()
+
+    def test_points_grow_on_write(self):
+        """Комментарии и подписки добавляют посту баллы через очередь."""
+        Comment.objects.create(
+            post=self.busy, author=self.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        run_pending()
+        points = dict(PostScore.objects.values_list('post_id', 'points'))
+        self.assertEqual(
+            points[self.busy.pk],
+            settings.TRENDING_COMMENT_WEIGHT
+            + settings.TRENDING_FOLLOW_WEIGHT,
+        )
+        self.assertEqual(
+            points[self.quiet.pk], settings.TRENDING_FOLLOW_WEIGHT
+        )
+
+    def test_deleted_and_hidden_comments_lose_points(self):
+        """Удаленный или скрытый комментарий забирает свои баллы."""
+        deleted, hidden = [
+            Comment.objects.create(
+                post=self.busy, author=self.reader, text='Комментарий'
+            )
+            for _ in range(2)
+        ]
+        run_pending()
+        deleted.delete()
+        hidden.hidden = True
+        hidden.save()
+        run_pending()
+        self.assertEqual(PostScore.objects.get(post_id=self.busy.pk).points, 0)
+        Comment.objects.create(
+            post=self.busy, author=self.reader, text='Комментарий'
+        )
+        Purger().user(self.reader)
+        run_pending()
+        self.assertEqual(PostScore.objects.get(post_id=self.busy.pk).points, 0)
+
+    def test_refresh_ranks_and_prunes(self):
+        """Пересчет упорядочивает посты и убирает старые и удаленные."""
+        Comment.objects.create(
+            post=self.busy, author=self.reader, text='Комментарий'
+        )
+        gone = Post.objects.create(author=self.author, text='Удален')
+        run_pending()
+        delete_rows(Post, [gone.pk], 'default')
+        self.assertIn('Постов в рейтинге: 2, удалено: 2', self.refresh())
+        response = Client().get(reverse('posts:trending'))
+        self.assertEqual(
+            list(response.context['page_obj']), [self.busy, self.quiet]
+        )
+
+    def test_refresh_seeds_missing_posts(self):
+        """Недавний пост без строки рейтинга получает баллы за комментарии."""
+        Comment.objects.create(
+            post=self.quiet, author=self.reader, text='Комментарий'
+        )
+        PostScore.objects.all().delete()
+        self.refresh()
+        self.assertEqual(
+            PostScore.objects.get(post_id=self.quiet.pk).points,
+            settings.TRENDING_COMMENT_WEIGHT,
+        )
+        self.assertEqual(PostScore.objects.count(), 2)
+
+
+class SuggestFollowsCommandTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = {
+            name: User.objects.create_user(username=name)
+            for name in ('me', 'bob', 'carol', 'alice', 'ben', 'cid')
+        }
+        for user, authors in (
+            ('me', ['alice']),
+            ('bob', ['alice', 'ben']),
+            ('carol', ['alice', 'ben', 'cid']),
+        ):
+            for author in authors:
+                Follow.objects.create(
+                    user=self.users[user], author=self.users[author]
+                )
+
+    def suggest(self):
+        out = StringIO()
+        call_command('suggest_follows', '--batch-size=2', stdout=out)
+        return out.getvalue()
+
+    def suggested(self, name):
+        return list(
+            FollowSuggestion.objects.filter(user=self.users[name])
+            .order_by('-score').values_list('author__username', 'score')
+        )
+
+    def test_co_followed_authors_are_suggested(self):
+        """Рекомендуются авторы, которых читают те же подписчики."""
+        FollowSuggestion.objects.create(
+            user=self.users['cid'], author=self.users['me'], score=1
+        )
+        self.assertIn('Пользователей: 3', self.suggest())
+        suggested = self.suggested('me')
+        self.assertEqual([name for name, _ in suggested], ['ben', 'cid'])
+        self.assertAlmostEqual(suggested[0][1], 1 / 2 + 1 / 3)
+        self.assertEqual(
+            [name for name, _ in self.suggested('bob')], ['cid']
+        )
+        self.assertEqual(self.suggested('carol'), [])
+        self.assertEqual(self.suggested('cid'), [])
+
+    def test_suggestions_are_shown_until_followed(self):
+        """Рекомендации видны в ленте подписок и пропадают после подписки."""
+        self.suggest()
+        client = Client()
+        client.force_login(self.users['me'])
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            response.context['suggestions'],
+            [self.users['ben'], self.users['cid']],
+        )
+        client.get(reverse('posts:profile_follow', args=['ben']))
+        response = client.get(reverse('posts:profile', args=['alice']))
+        self.assertEqual(
+            response.context['suggestions'], [self.users['cid']]
+        )
@@ -1,7 +1,11 @@
+import hashlib
 import shutil
 import tempfile
 
+from core.models import Task
+from core.tasks import run_pending
 from django.conf import settings
+from django.core import mail
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
@@ -9,6 +13,15 @@ from django.urls import reverse
 from ..forms import PostForm
 from ..models import Comment, Group, Post, User
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
@@ -80,10 +93,32 @@ class PostCreateFormTests(TestCase):
                 text=form_data['text'],
                 group=form_data['group'],
                 author=PostCreateFormTests.user,
-                image=f'posts/{uploaded.name}'
+                image__startswith='posts/',
+                image__endswith=f'{hashlib.sha256(small_gif).hexdigest()}.gif'
             ).exclude(id__in=posts_before).exists()
         )
 
+    def test_image_is_processed_by_queue(self):
+        """Заглушку и миниатюру новой картинки готовит очередь, а не запрос."""
+        uploaded = SimpleUploadedFile(
+            name='queued.gif',
+            content=SMALL_GIF,
+            content_type='image/gif',
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Пост с картинкой', 'image': uploaded},
+        )
+        task = Task.objects.get(name='posts.process_images')
+        self.assertEqual(task.status, Task.QUEUED)
+        post = Post.objects.get(text='Пост с картинкой')
+        self.assertEqual(post.image_placeholder, '')
+        run_pending()
+        post.refresh_from_db()
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+
     def test_edit_post(self):
         """Валидная форма редактирует n-ый пост."""
         posts_count = Post.objects.count()
@@ -139,3 +174,27 @@ class PostCreateFormTests(TestCase):
                 post=PostCreateFormTests.post
             ).exclude(id__in=comments_before).exists()
         )
+
+    @override_settings(COMMENT_DIGEST_WINDOW=10 ** 9)
+    def test_comment_digest(self):
+        """Автор поста получает одно письмо на все комментарии окна."""
+        PostCreateFormTests.user.email = 'auth@example.com'
+        PostCreateFormTests.user.save()
+        reader = Client()
+        reader.force_login(User.objects.create_user(username='reader'))
+        url = reverse(
+            'posts:add_comment', args=[PostCreateFormTests.post.id]
+        )
+        for text in ('Первый', 'Второй'):
+            reader.post(url, {'text': text})
+        self.authorized_client.post(url, {'text': 'Ответ автора'})
+        task = Task.objects.get(name='posts.comment_digest')
+        digests = ['posts.comment_digest']
+        self.assertEqual(run_pending(names=digests), (0, 0))
+        Task.objects.filter(pk=task.pk).update(run_at=task.created)
+        self.assertEqual(run_pending(names=digests), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['auth@example.com'])
+        self.assertIn('Первый', mail.outbox[0].body)
+        self.assertIn('Второй', mail.outbox[0].body)
+        self.assertNotIn('Ответ автора', mail.outbox[0].body)
@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from core.cache.tiered import tiered_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Like, Post, User
+from ..sharding import SHARD_ID_RANGE, shard_for
+
+TEMP_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SHARD = 'shard1'
+SHARDS = ['default', SHARD]
+
+
+@override_settings(POST_SHARDS=SHARDS)
+class ShardingTest(TransactionTestCase):
+    """Два шарда: тестовая база и отдельный файл SQLite."""
+
+    databases = {'default', SHARD}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[SHARD] = {
+            'ENGINE': 'core.db.sqlite3',
+            'NAME': os.path.join(TEMP_DIR, 'shard1.sqlite3'),
+            'OPTIONS': {'PRAGMAS': {'foreign_keys': 'OFF'}},
+        }
+        super().setUpClass()
+        call_command('migrate', database=SHARD, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[SHARD].close()
+        del connections[SHARD]
+        del connections.databases[SHARD]
+        shutil.rmtree(TEMP_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.clear_local()
+        first = User.objects.create_user(username='first')
+        second = User.objects.create_user(username='second')
+        # Авторы с id разной четности попадают в разные шарды.
+        self.local, self.remote = sorted(
+            [first, second], key=lambda user: shard_for(user.pk) == SHARD
+        )
+        self.client = Client()
+        self.client.force_login(self.local)
+
+    def publish(self, author, text):
+        return Post.objects.create(author=author, text=text)
+
+    def test_posts_are_stored_in_author_shard(self):
+        """Пост сохраняется в шарде автора с id из диапазона шарда."""
+        local = self.publish(self.local, 'Локальный пост')
+        remote = self.publish(self.remote, 'Удаленный пост')
+        self.assertTrue(Post.objects.using('default').filter(
+            pk=local.pk).exists())
+        self.assertTrue(Post.objects.using(SHARD).filter(
+            pk=remote.pk).exists())
+        self.assertFalse(Post.objects.using('default').filter(
+            pk=remote.pk).exists())
+        self.assertGreater(remote.pk, SHARD_ID_RANGE)
+
+    def test_index_merges_shards_by_date(self):
+        """Главная страница сливает шарды по дате публикации."""
+        texts = [f'Пост {number}' for number in range(12)]
+        for number, text in enumerate(texts):
+            self.publish((self.local, self.remote)[number % 2], text)
+        response = self.client.get(reverse('posts:index'))
+        page = response.context['page_obj']
+        self.assertEqual(page.paginator.count, 12)
+        self.assertEqual(
+            [post.text for post in page], texts[::-1][:10]
+        )
+        self.assertEqual(page[0].author, self.remote)
+        response = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            texts[1::-1],
+        )
+
+    def test_follow_index_reads_remote_shard(self):
+        """Лента подписок находит посты автора из другого шарда."""
+        self.publish(self.remote, 'Удаленный пост')
+        self.client.get(
+            reverse('posts:profile_follow', args=[self.remote.username])
+        )
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Удаленный пост'],
+        )
+
+    def test_detail_and_comments_live_in_post_shard(self):
+        """Пост из шарда открывается, а комментарий ложится рядом с ним."""
+        post = self.publish(self.remote, 'Удаленный пост')
+        response = self.client.post(
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'Комментарий'}, follow=True,
+        )
+        self.assertContains(response, 'Удаленный пост')
+        self.assertContains(response, 'Комментарий')
+        self.assertTrue(Comment.objects.using(SHARD).filter(
+            post_id=post.pk, author=self.local).exists())
+        response = self.client.get(
+            reverse('posts:profile', args=[self.remote.username])
+        )
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_rebalance_moves_posts_and_comments(self):
+        """Перебалансировка переносит посты и комментарии в шард автора."""
+        with self.settings(POST_SHARDS=[]):
+            post = self.publish(self.remote, 'Старый пост')
+            Comment.objects.create(
+                post=post, author=self.local, text='Комментарий'
+            )
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('постов: 1, комментариев: 1', out.getvalue())
+        self.assertFalse(Post.objects.using('default').exists())
+        self.assertFalse(Comment.objects.using('default').exists())
+        moved = Post.objects.using(SHARD).get()
+        self.assertEqual(moved.pk, post.pk)
+        self.assertEqual(moved.comments.get().text, 'Комментарий')
+        response = self.client.get(reverse('posts:post_detail',
+                                           args=[post.pk]))
+        self.assertContains(response, 'Комментарий')
+
+    def test_rebalance_keeps_id_range_of_lower_shard(self):
+        """Перенос в шард с диапазоном ниже не уводит его новые id."""
+        post = Post.objects.using(SHARD).create(
+            author=self.local, text='Пост не в своем шарде'
+        )
+        root = Comment.objects.using(SHARD).create(
+            post=post, author=self.local, text='Комментарий'
+        )
+        Comment.objects.using(SHARD).create(
+            post=post, author=self.local, text='Ответ', parent=root
+        )
+        self.assertGreater(post.pk, SHARD_ID_RANGE)
+        call_command('rebalance_shards', stdout=StringIO())
+        moved = Post.objects.using('default').get()
+        self.assertLess(moved.pk, SHARD_ID_RANGE)
+        root, reply = moved.comments.order_by('path')
+        self.assertLess(root.pk, SHARD_ID_RANGE)
+        self.assertEqual(reply.parent_id, root.pk)
+        self.assertTrue(reply.path.startswith(root.path))
+        self.assertFalse(Post.objects.using(SHARD).exists())
+        new = self.publish(self.local, 'Новый пост')
+        comment = Comment.objects.create(
+            post=new, author=self.local, text='Комментарий'
+        )
+        self.assertGreater(new.pk, moved.pk)
+        self.assertLess(new.pk, SHARD_ID_RANGE)
+        self.assertLess(comment.pk, SHARD_ID_RANGE)
+
+    def test_likes_live_in_post_shard(self):
+        """Отметка ложится в шард поста и находится лентой."""
+        post = self.publish(self.remote, 'Удаленный пост')
+        self.client.post(reverse('posts:post_like', args=[post.pk]))
+        self.assertTrue(Like.objects.using(SHARD).filter(
+            post_id=post.pk, user_id=self.local.pk).exists())
+        response = self.client.get(reverse('posts:index'))
+        self.assertTrue(response.context['page_obj'][0].liked)
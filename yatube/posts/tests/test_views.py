@@ -1,14 +1,20 @@
 import shutil
 import tempfile
+from unittest import mock
 
+from core.middleware import PIN_COOKIE
+from core.tasks import run_pending
 from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from ..models import Comment, Follow, Group, Post, User
+from .. import counters
+from ..models import Comment, Follow, Group, Like, Post, User
+from ..utils import attach_likes
 
 NUMBER_OF_POSTS_TEST_PAGINATOR = 13
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -44,6 +50,8 @@ class PostPagesTests(TestCase):
             group=cls.group,
             image=cls.image,
         )
+        run_pending()
+        cls.post.refresh_from_db()
 
     @classmethod
     def tearDownClass(cls):
@@ -186,7 +194,8 @@ class PostPagesTests(TestCase):
         self.assertEqual(post.text, PostPagesTests.post.text)
         self.assertEqual(post.author, PostPagesTests.post.author)
         self.assertEqual(post.group, PostPagesTests.group)
-        self.assertEqual(post.image.name, f'posts/{PostPagesTests.image.name}')
+        self.assertEqual(post.image.name, PostPagesTests.post.image.name)
+        self.assertTrue(post.image.name.startswith('posts/'))
 
     def test_index_page_show_correct_context(self):
         """Шаблон index сформирован с правильным контекстом."""
@@ -245,6 +254,70 @@ class PostPagesTests(TestCase):
         form_field = response.context.get('form').fields.get('text')
         self.assertIsInstance(form_field, forms.fields.CharField)
 
+    def test_image_placeholder_is_rendered(self):
+        """Заглушка картинки считается очередью после загрузки."""
+        post = PostPagesTests.post
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,')
+        )
+        response = self.authorized_client.get(reverse(
+            'posts:post_detail',
+            kwargs={'post_id': post.id}
+        ))
+        self.assertContains(response, post.image_placeholder)
+
+    @override_settings(COUNTERS_FLUSH_INTERVAL=3600)
+    def test_views_are_buffered(self):
+        """Просмотры копятся в памяти и пишутся в базу одним UPDATE."""
+        counters.views.counter.clear()
+        url = reverse('posts:post_detail', args=[PostPagesTests.post.id])
+        for _ in range(3):
+            self.client.get(url)
+        post = Post.objects.get(pk=PostPagesTests.post.id)
+        self.assertEqual(post.views, 0)
+        with self.assertNumQueries(1):
+            self.assertEqual(counters.views.flush(), 3)
+        response = self.client.get(url)
+        self.assertEqual(response.context['post'].views, 3)
+        self.assertContains(response, 'Просмотров: 3')
+
+    def test_flusher_starts_in_each_process(self):
+        """Поток сброса запускается первым учетом в каждом процессе.
+
+        Под gunicorn --preload форк не наследует поток мастера.
+        """
+        with mock.patch.multiple(
+            counters, flusher=None, flusher_pid=None, flusher_enabled=True
+        ), mock.patch.object(counters.threading, 'Thread') as thread:
+            with mock.patch.object(counters.os, 'getpid', return_value=1):
+                counters.views.add(PostPagesTests.post)
+                counters.views.add(PostPagesTests.post)
+            self.assertEqual(thread.return_value.start.call_count, 1)
+            with mock.patch.object(counters.os, 'getpid', return_value=2):
+                counters.views.add(PostPagesTests.post)
+            self.assertEqual(thread.return_value.start.call_count, 2)
+        counters.views.counter.clear()
+
+    def test_view_does_not_pin_reader_to_primary(self):
+        """Учет просмотра не считается записью и не закрепляет читателя."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[PostPagesTests.post.id])
+        )
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_failed_flush_keeps_views(self):
+        """Если UPDATE не прошел, просмотры остаются в буфере."""
+        counters.views.counter.clear()
+        counters.views.add(PostPagesTests.post)
+        with mock.patch.object(
+            counters.views, 'write', side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                counters.views.flush()
+        self.assertEqual(counters.views.flush(), 1)
+        post = Post.objects.get(pk=PostPagesTests.post.id)
+        self.assertEqual(post.views, 1)
+
     def test_post_does_not_exist_in_any_group(self):
         """Тестовый пост не попадает на стр. другой группы."""
         new_group = Group.objects.create(
@@ -258,6 +331,50 @@ class PostPagesTests(TestCase):
         object = response.context['page_obj']
         self.assertFalse(object)
 
+    def test_groups_are_attached_without_queries(self):
+        """Группы в ленте берутся из реестра, а не из базы."""
+        self.authorized_client.get(reverse('posts:index'))
+        response = self.authorized_client.get(reverse(
+            'posts:profile',
+            kwargs={'username': PostPagesTests.user.username}
+        ))
+        post = response.context['page_obj'][0]
+        with self.assertNumQueries(0):
+            self.assertEqual(post.group.slug, PostPagesTests.group.slug)
+
+    def test_group_changes_reach_group_page(self):
+        """Правка группы сбрасывает реестр групп."""
+        url = reverse('posts:group_posts',
+                      kwargs={'slug': PostPagesTests.group.slug})
+        self.authorized_client.get(url)
+        group = Group.objects.get(pk=PostPagesTests.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        response = self.authorized_client.get(url)
+        self.assertEqual(response.context['group'].title, 'Новое название')
+        group.title = PostPagesTests.group.title
+        group.save()
+
+    def test_missing_author_is_cached(self):
+        """Несуществующий автор отдает 404 и кешируется."""
+        url = reverse('posts:profile', kwargs={'username': 'nobody'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 404)
+        User.objects.create_user(username='nobody')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_renamed_author_is_resolved(self):
+        """Переименование автора сбрасывает записи обоих имен."""
+        user = User.objects.create_user(username='old_name')
+        self.client.get(reverse('posts:profile', args=['old_name']))
+        user.username = 'new_name'
+        user.save()
+        response = self.client.get(reverse('posts:profile', args=['old_name']))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('posts:profile', args=['new_name']))
+        self.assertEqual(response.context['author'].id, user.id)
+
     def test_form_pages_show_correct_context(self):
         """Шаблоны с формами сформированы с правильным контекстом."""
         pages_names = {
@@ -351,3 +468,176 @@ class PaginatorViewsTest(TestCase):
                 len(response.context['page_obj']),
                 NUMBER_OF_POSTS_TEST_PAGINATOR - settings.NUMBER_OF_POSTS
             )
+
+
+@override_settings(COUNTERS_FLUSH_INTERVAL=3600)
+class LikeViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {number}')
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        counters.likes.counter.clear()
+        self.client = Client()
+        self.client.force_login(LikeViewsTest.reader)
+
+    def like(self, post, action='post_like'):
+        return self.client.post(reverse(f'posts:{action}', args=[post.pk]))
+
+    def test_like_and_unlike(self):
+        """Отметка ставится один раз, снимается и учитывается в счетчике."""
+        post = LikeViewsTest.posts[0]
+        self.assertRedirects(
+            self.like(post), reverse('posts:post_detail', args=[post.pk])
+        )
+        self.like(post)
+        self.assertEqual(post.likes.count(), 1)
+        counters.likes.flush()
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 1)
+        response = self.client.get(
+            reverse('posts:post_detail', args=[post.pk])
+        )
+        self.assertTrue(response.context['post'].liked)
+        self.assertContains(response, 'Больше не нравится')
+        self.like(post, 'post_unlike')
+        counters.likes.flush()
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 0)
+        self.assertFalse(post.likes.exists())
+
+    def test_unlike_does_not_go_below_zero(self):
+        """Снятие отметки при нулевом счетчике оставляет ноль."""
+        post, other = LikeViewsTest.posts[:2]
+        Like.objects.create(user=LikeViewsTest.reader, post=post)
+        self.like(post, 'post_unlike')
+        counters.likes.add(other)
+        counters.likes.flush()
+        post.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(post.likes_count, 0)
+        self.assertEqual(other.likes_count, 1)
+
+    def test_like_requires_post(self):
+        """Отметка ставится только POST-запросом."""
+        response = self.client.get(
+            reverse('posts:post_like', args=[LikeViewsTest.posts[0].pk])
+        )
+        self.assertEqual(response.status_code, 405)
+
+    def test_feed_marks_liked_posts_in_one_query(self):
+        """Лента узнает отмеченные посты страницы одним запросом."""
+        self.like(LikeViewsTest.posts[1])
+        page = [
+            Post.objects.get(pk=post.pk) for post in LikeViewsTest.posts
+        ]
+        with self.assertNumQueries(1):
+            attach_likes(page, LikeViewsTest.reader)
+        self.assertEqual(
+            [post.liked for post in page], [False, True, False]
+        )
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(
+            [post.liked for post in response.context['page_obj']],
+            [False, True, False],
+        )
+        self.assertContains(response, 'в том числе вам', count=1)
+
+    def test_cached_index_is_shared_between_users(self):
+        """Фрагмент index общий, отметки читателя подставляются поверх."""
+        self.like(LikeViewsTest.posts[1])
+        anonymous = Client()
+        anonymous.get(reverse('posts:index'))
+        with self.assertNumQueries(1):
+            response = anonymous.get(reverse('posts:index'))
+        self.assertNotContains(response, 'в том числе вам')
+        self.assertNotContains(response, '<!--liked:')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'в том числе вам', count=1)
+        self.assertNotContains(response, '<!--liked:')
+
+
+@override_settings(COMMENT_THREADS_PER_PAGE=2, COMMENT_MAX_DEPTH=1)
+class CommentThreadsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(CommentThreadsTest.user)
+
+    def comment(self, text, parent=None):
+        return Comment.objects.create(
+            post=CommentThreadsTest.post, author=CommentThreadsTest.user,
+            text=text, parent=parent,
+        )
+
+    def detail(self, **params):
+        return self.client.get(
+            reverse('posts:post_detail', args=[CommentThreadsTest.post.pk]),
+            params,
+        )
+
+    def test_reply_is_shown_under_parent(self):
+        """Ответ встает под родителем, а не в конец обсуждения."""
+        first = self.comment('Первый')
+        second = self.comment('Второй')
+        self.client.post(
+            reverse('posts:add_comment', args=[CommentThreadsTest.post.pk]),
+            {'text': 'Ответ', 'reply_to': first.pk},
+        )
+        reply = Comment.objects.get(text='Ответ')
+        self.assertEqual(reply.parent, first)
+        self.assertEqual(reply.depth, 1)
+        self.assertTrue(reply.path.startswith(first.path))
+        response = self.detail()
+        self.assertEqual(
+            response.context['comments'], [first, reply, second]
+        )
+        self.assertEqual(
+            [comment.indent for comment in response.context['comments']],
+            [0, 1, 0],
+        )
+
+    def test_reply_to_foreign_comment(self):
+        """Ответить можно только на комментарий этого же поста."""
+        other = Post.objects.create(author=CommentThreadsTest.user, text='2')
+        foreign = Comment.objects.create(
+            post=other, author=CommentThreadsTest.user, text='Чужой'
+        )
+        response = self.client.post(
+            reverse('posts:add_comment', args=[CommentThreadsTest.post.pk]),
+            {'text': 'Ответ', 'reply_to': foreign.pk},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Comment.objects.filter(text='Ответ').exists())
+
+    def test_threads_are_paginated_and_depth_limited(self):
+        """Ветки разбиты на страницы, глубокие ответы — по ссылке."""
+        roots = [self.comment(f'Ветка {number}') for number in range(3)]
+        reply = self.comment('Ответ', roots[0])
+        deep = self.comment('Глубже', reply)
+        response = self.detail()
+        self.assertEqual(
+            response.context['comments'], [roots[0], reply, roots[1]]
+        )
+        self.assertEqual(response.context['comments'][1].more_replies, 1)
+        self.assertContains(response, f'?thread={reply.pk}')
+        response = self.detail(page=2)
+        self.assertEqual(response.context['comments'], [roots[2]])
+        response = self.detail(thread=reply.pk)
+        self.assertIsNone(response.context['threads'])
+        self.assertEqual(response.context['comments'], [reply, deep])
+        self.assertEqual(response.context['comments'][1].indent, 1)
+        self.assertEqual(self.detail(thread='x').status_code, 404)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.http import Http404
+
+from .models import PATH_STEP, subtree_end
+from .utils import attach_authors
+
+
+def comment_threads(request, post):
+    """Ветки комментариев поста для страницы, в порядке показа.
+
+    На страницу попадает COMMENT_THREADS_PER_PAGE корневых комментариев,
+    а их ответы до глубины COMMENT_MAX_DEPTH загружаются одним запросом:
+    это диапазон путей по индексу (post, path), уже отсортированный.
+    Ответы глубже не загружаются, у их предка на последнем уровне
+    в more_replies записано, сколько их; ?thread=<id> показывает
+    поддерево одного комментария так же, как страницу веток.
+    Возвращает страницу веток (None для поддерева) и комментарии.
+    """
+    comments = post.comments.filter(hidden=False)
+    thread = request.GET.get('thread')
+    if thread is None:
+        page = Paginator(
+            comments.filter(depth=0).order_by('path'),
+            settings.COMMENT_THREADS_PER_PAGE,
+        ).get_page(request.GET.get('page'))
+        roots = list(page)
+    else:
+        if not thread.isdigit():
+            raise Http404('Комментарий не найден')
+        page = None
+        roots = list(comments.filter(pk=thread))
+        if not roots:
+            raise Http404('Комментарий не найден')
+    if not roots:
+        return page, []
+    base = roots[0].depth
+    limit = base + settings.COMMENT_MAX_DEPTH
+    rows = comments.filter(
+        path__gte=roots[0].path,
+        path__lt=subtree_end(roots[-1].path),
+        depth__lte=limit + 1,
+    ).order_by('path')
+    shown = []
+    by_path = {}
+    for comment in rows:
+        if comment.depth > limit:
+            parent = by_path.get(comment.path[:(limit + 1) * PATH_STEP])
+            if parent is not None:
+                parent.more_replies += 1
+            continue
+        comment.indent = comment.depth - base
+        comment.more_replies = 0
+        by_path[comment.path] = comment
+        shown.append(comment)
+    attach_authors(shown)
+    return page, shown
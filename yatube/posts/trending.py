@@ -0,0 +1,155 @@
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from core.db import write_atomic
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Post, PostScore
+from .sharding import shard_for, shards
+
+# SQLite ограничивает число параметров запроса, id читаем кусками.
+CHUNK_SIZE = 500
+
+
+def apply(payloads):
+    """Применяет пачку событий задачи posts.score_posts.
+
+    Событие — новый пост (track), удаленный пост (untrack) или баллы
+    (points) посту (post_id) либо всем постам автора (author_id).
+    Баллы к одному посту или автору складываются и пишутся одним
+    UPDATE; для старых постов строк в рейтинге нет, и им ничего
+    не пишется.
+    """
+    scores = PostScore.objects.using(DEFAULT_DB_ALIAS)
+    points = Counter()
+    untracked = []
+    with write_atomic(using=DEFAULT_DB_ALIAS):
+        for payload in payloads:
+            if 'track' in payload:
+                scores.get_or_create(post_id=payload['track'], defaults={
+                    'author_id': payload['author_id'],
+                    'pub_date': parse_datetime(payload['pub_date']),
+                })
+            elif 'untrack' in payload:
+                untracked.append(payload['untrack'])
+            elif 'post_id' in payload:
+                points['post_id', payload['post_id']] += payload['points']
+            else:
+                points['author_id', payload['author_id']] += payload['points']
+        for (field, pk), weight in points.items():
+            if weight:
+                scores.filter(**{field: pk}).update(
+                    points=F('points') + weight
+                )
+        for part in chunks(untracked):
+            scores.filter(post_id__in=part).delete()
+
+
+def score(points, views, pub_date, now):
+    """Рейтинг: активность, деленная на степень возраста в часах."""
+    hours = (now - pub_date).total_seconds() / 3600
+    activity = points + views * settings.TRENDING_VIEW_WEIGHT
+    return (activity + 1) / (hours + 2) ** settings.TRENDING_GRAVITY
+
+
+def chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def recent_posts(border):
+    """Видимые посты моложе border из всех шардов: id -> строка."""
+    posts = {}
+    for alias in shards():
+        for pk, author_id, pub_date, views in (
+            Post.objects.using(alias or DEFAULT_DB_ALIAS)
+            .filter(pub_date__gte=border, hidden=False)
+            .values_list('pk', 'author_id', 'pub_date', 'views')
+        ):
+            posts[pk] = (alias, author_id, pub_date, views)
+    return posts
+
+
+def seed_points(posts, ids):
+    """Баллы постов, которых еще нет в рейтинге, по их комментариям."""
+    by_alias = defaultdict(list)
+    for pk in ids:
+        by_alias[posts[pk][0]].append(pk)
+    points = {}
+    for alias, post_ids in by_alias.items():
+        for part in chunks(post_ids):
+            points.update(
+                Comment.objects.using(alias or DEFAULT_DB_ALIAS)
+                .filter(post_id__in=part, hidden=False)
+                .values('post_id')
+                .annotate(count=Count('pk'))
+                .values_list('post_id', 'count')
+            )
+    return {
+        pk: points.get(pk, 0) * settings.TRENDING_COMMENT_WEIGHT
+        for pk in ids
+    }
+
+
+def refresh():
+    """Пересчитывает рейтинг; возвращает (постов в рейтинге, удалено).
+
+    Посты старше TRENDING_WINDOW_HOURS, скрытые и удаленные (в том
+    числе пачками, мимо сигналов) из рейтинга удаляются, а недавние
+    посты, которых в нем нет, добавляются с баллами за комментарии.
+    """
+    now = timezone.now()
+    posts = recent_posts(now - timedelta(hours=settings.TRENDING_WINDOW_HOURS))
+    scores = PostScore.objects.using(DEFAULT_DB_ALIAS)
+    rows = {row.post_id: row for row in scores.all()}
+    stale = [pk for pk in rows if pk not in posts]
+    missing = [pk for pk in posts if pk not in rows]
+    for pk, points in seed_points(posts, missing).items():
+        rows[pk] = PostScore(
+            post_id=pk, author_id=posts[pk][1], pub_date=posts[pk][2],
+            points=points,
+        )
+    for pk, post in posts.items():
+        rows[pk].score = score(rows[pk].points, post[3], post[2], now)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        for part in chunks(stale):
+            scores.filter(post_id__in=part).delete()
+        # Новый пост мог попасть в рейтинг сигналом, пока шел пересчет.
+        scores.bulk_create(
+            [rows[pk] for pk in missing], batch_size=CHUNK_SIZE,
+            ignore_conflicts=True,
+        )
+        # Баллы, набежавшие за время пересчета, не затираются:
+        # обновляется только score.
+        scores.bulk_update(
+            [rows[pk] for pk in posts if pk not in missing], ['score'],
+            batch_size=CHUNK_SIZE,
+        )
+    return len(posts), len(stale)
+
+
+def trending_posts():
+    """Первые TRENDING_SIZE постов рейтинга в порядке убывания.
+
+    Один запрос по индексу score и по запросу на шард за самими постами.
+    """
+    top = list(
+        PostScore.objects.using(DEFAULT_DB_ALIAS)
+        .order_by('-score', '-post_id')
+        .values_list('post_id', 'author_id')[:settings.TRENDING_SIZE]
+    )
+    by_alias = defaultdict(list)
+    for post_id, author_id in top:
+        by_alias[shard_for(author_id)].append(post_id)
+    posts = {}
+    for alias, ids in by_alias.items():
+        posts.update(Post.objects.using(alias).in_bulk(ids))
+    return [
+        posts[post_id] for post_id, _ in top
+        if post_id in posts and not posts[post_id].hidden
+    ]
@@ -1,9 +1,227 @@
 
+import base64
+from collections import defaultdict
+from collections.abc import Sequence
+from io import BytesIO
+
+from core.cache.tiered import tiered_cache
 from django.conf import settings
 from django.core.paginator import Paginator
+from django.db import connections
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from PIL import Image
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from .models import ArchivedPost, Group, Like, Post, User
+from .sharding import shard_for
+
+GROUPS_KEY = 'groups:registry'
+
+
+class AttachedPosts(Sequence):
+    """Посты страницы, которые читаются и дополняются при первом обращении.
+
+    Группы, авторы и отметки пользователя подставляются, только когда
+    шаблон действительно перебирает посты. Если фрагмент со страницей
+    взят из кеша, выполняется лишь COUNT для навигации.
+    """
+
+    def __init__(self, posts, user):
+        self.posts = posts
+        self.user = user
+        self.attached = False
+
+    def attach(self):
+        if self.attached:
+            return
+        self.attached = True
+        self.posts = list(self.posts)
+        attach_groups(self.posts)
+        attach_authors(self.posts)
+        attach_likes(self.posts, self.user)
+
+    def __len__(self):
+        self.attach()
+        return len(self.posts)
+
+    def __getitem__(self, index):
+        self.attach()
+        return self.posts[index]
 
 
 def post_paginator(request, post_list):
     paginator = Paginator(post_list, settings.NUMBER_OF_POSTS)
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    page = paginator.get_page(page_number)
+    page.object_list = AttachedPosts(page.object_list, request.user)
+    return page
+
+
+def image_placeholder(file):
+    """Возвращает крошечную копию картинки в виде data URI.
+
+    Копия встраивается прямо в страницу и показывается, пока грузится
+    настоящая картинка, поэтому верстка не прыгает.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        image = image.convert('RGB')
+        image.thumbnail((settings.PLACEHOLDER_SIZE, settings.PLACEHOLDER_SIZE))
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', quality=50)
+    file.seek(0)
+    encoded = base64.b64encode(buffer.getvalue()).decode('ascii')
+    return f'data:image/jpeg;base64,{encoded}'
+
+
+def release_image(field_file, name, keep_file=False):
+    """Снимает ссылку с картинки и чистит миниатюры удаленного файла."""
+    if field_file.storage.release(name, keep_file=keep_file):
+        delete_thumbnails(
+            ImageFile(name, field_file.storage), delete_file=False
+        )
+
+
+def posts_count_key(author_id):
+    return f'stats:posts_count:{author_id}'
+
+
+def author_posts_count(author_id):
+    """Число видимых постов автора, включая архивные, из кеша."""
+    return tiered_cache.get_or_set(
+        posts_count_key(author_id),
+        lambda: sum(
+            model.objects.using(shard_for(author_id))
+            .filter(author_id=author_id, hidden=False).count()
+            for model in (Post, ArchivedPost)
+        ),
+        settings.STATS_CACHE_TIMEOUT,
+    )
+
+
+def load_groups():
+    groups = list(Group.objects.all())
+    return {
+        'slug': {group.slug: group for group in groups},
+        'id': {group.pk: group for group in groups},
+    }
+
+
+def group_registry():
+    """Все группы по slug и id из памяти процесса.
+
+    Групп немного и меняются они редко, поэтому держим их целиком
+    в двухуровневом кеше; сигналы сбрасывают его при любой правке.
+    """
+    return tiered_cache.get_or_set(
+        GROUPS_KEY, load_groups, settings.GROUPS_CACHE_TIMEOUT
+    )
+
+
+def get_group_or_404(slug):
+    """Группа из реестра, а еще не попавшая в него — из базы."""
+    group = group_registry()['slug'].get(slug)
+    if group is None:
+        group = get_object_or_404(Group, slug=slug)
+    return group
+
+
+def attach_groups(posts):
+    """Подставляет постам группы из реестра вместо join или запросов."""
+    groups = group_registry()['id']
+    for post in posts:
+        group = groups.get(post.group_id)
+        if group is not None:
+            post.group = group
+
+
+def attach_likes(posts, user):
+    """Отмечает в post.liked посты, которые нравятся пользователю.
+
+    На всю страницу — один запрос к шарду по уникальному индексу
+    (user, post). Архивные посты отметить нельзя.
+    """
+    ids = defaultdict(list)
+    for post in posts:
+        post.liked = False
+        if isinstance(post, Post):
+            ids[post._state.db].append(post.pk)
+    liked = liked_post_ids(user, ids)
+    for post in posts:
+        post.liked = post.pk in liked and isinstance(post, Post)
+
+
+def liked_post_ids(user, ids):
+    """id постов, которые нравятся user, из {шард: [id поста, ...]}."""
+    liked = set()
+    if not user.is_authenticated:
+        return liked
+    for alias, post_ids in ids.items():
+        liked.update(
+            Like.objects.using(alias)
+            .filter(user_id=user.pk, post_id__in=post_ids)
+            .values_list('post_id', flat=True)
+        )
+    return liked
+
+
+def author_key(username):
+    return f'authors:{username}'
+
+
+def load_author(username):
+    author = (
+        User.objects.filter(username=username)
+        .only('id', 'username', 'first_name', 'last_name')
+        .first()
+    )
+    # Пустая строка в кеше означает «такого автора нет».
+    return author or ''
+
+
+def attach_authors(objects):
+    """Подставляет авторов одним запросом тем, у кого их еще нет."""
+    objects = [
+        obj for obj in objects if not type(obj).author.is_cached(obj)
+    ]
+    authors = User.objects.in_bulk({obj.author_id for obj in objects})
+    for obj in objects:
+        if obj.author_id in authors:
+            obj.author = authors[obj.author_id]
+
+
+def resolve_author(username):
+    """Возвращает автора по username или вызывает Http404.
+
+    Автор загружается только с id, username и именем, остальные поля
+    догружаются из базы при обращении к ним. Несуществующие имена тоже
+    кешируются, но на AUTHOR_MISSING_TIMEOUT, чтобы перебор адресов
+    не доходил до базы.
+    """
+    key = author_key(username)
+    author = tiered_cache.get(key)
+    if author is None:
+        author = load_author(username)
+        tiered_cache.set(
+            key, author,
+            settings.AUTHOR_CACHE_TIMEOUT if author
+            else settings.AUTHOR_MISSING_TIMEOUT,
+        )
+    if not author:
+        raise Http404('Автор не найден')
+    return author
+
+
+def delete_rows(model, ids, using):
+    """Удаляет строки по id одним DELETE, без сигналов и каскадов."""
+    if not ids:
+        return
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {model._meta.db_table}'
+            f' WHERE {model._meta.pk.column} IN ({placeholders})',
+            ids,
+        )
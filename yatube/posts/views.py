@@ -1,33 +1,64 @@
 from django.contrib.auth.decorators import login_required
+from django.db import router
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from posts.utils import post_paginator
+from django.views.decorators.http import require_POST
+from posts import counters
+from posts.archive import author_feed
+from posts.sharding import feed, get_post_or_404
+from posts.suggestions import suggestions_for
+from posts.tasks import enqueue_comment_digest
+from posts.threads import comment_threads
+from posts.trending import trending_posts
+from posts.utils import (attach_likes, author_posts_count, get_group_or_404,
+                         post_paginator, resolve_author)
 
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import ArchivedPost, Follow, Like, Post
 
 
 def index(request):
     """Возвращает стартовую страницу с разбивкой по 10 постов."""
     template = 'posts/index.html'
-    post_list = Post.objects.select_related('author', 'group').all()
+    post_list = feed(
+        Post.objects.select_related('author').filter(hidden=False)
+    )
     context = {'page_obj': post_paginator(request, post_list)}
     return render(request, template, context)
 
 
+def trending_index(request):
+    """Возвращает популярные посты из заранее посчитанного рейтинга."""
+    template = 'posts/trending.html'
+    context = {'page_obj': post_paginator(request, trending_posts())}
+    return render(request, template, context)
+
+
 @login_required
 def follow_index(request):
     """Возвращает страницу избранных авторов с разбивкой по 10 постов."""
     template = 'posts/follow.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
-    context = {'page_obj': post_paginator(request, post_list)}
+    authors = list(
+        request.user.follower.values_list('author_id', flat=True)
+    )
+    post_list = feed(
+        Post.objects.select_related('author')
+        .filter(author_id__in=authors, hidden=False)
+    )
+    context = {
+        'page_obj': post_paginator(request, post_list),
+        'suggestions': suggestions_for(request.user),
+    }
     return render(request, template, context)
 
 
 def group_posts(request, slug):
     """Возвращает страницу группы с разбивкой по 10 постов."""
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.select_related('author').all()
+    group = get_group_or_404(slug)
+    post_list = feed(
+        group.posts.select_related('author').filter(hidden=False).cache()
+    )
     context = {
         'group': group,
         'page_obj': post_paginator(request, post_list),
@@ -38,16 +69,21 @@ def group_posts(request, slug):
 def profile(request, username):
     """Возвращает страницу автора с разбивкой по 10 постов."""
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
+    author = resolve_author(username)
     check_author_is_user = author != request.user
     following = (request.user.is_authenticated
-                 and author.following.filter(user=request.user).exists())
-    post_list = author.posts.select_related('group').all()
+                 and Follow.objects.filter(
+                     author_id=author.id, user=request.user
+                 ).exists())
+    page_obj = post_paginator(request, author_feed(author.id))
+    for post in page_obj:
+        post.author = author
     context = {
         'author': author,
-        'page_obj': post_paginator(request, post_list),
+        'page_obj': page_obj,
         'following': following,
         'check_author_is_user': check_author_is_user,
+        'suggestions': suggestions_for(request.user, exclude=author),
     }
     return render(request, template, context)
 
@@ -55,11 +91,11 @@ def profile(request, username):
 @login_required
 def profile_follow(request, username):
     """Создание подписки на автора."""
-    author = get_object_or_404(User, username=username)
+    author = resolve_author(username)
     if author != request.user:
         Follow.objects.get_or_create(
             user=request.user,
-            author=author,
+            author_id=author.id,
         )
     return redirect('posts:profile', username=username)
 
@@ -67,10 +103,10 @@ def profile_follow(request, username):
 @login_required
 def profile_unfollow(request, username):
     """Отмена подписки на автора."""
-    author = get_object_or_404(User, username=username)
+    author = resolve_author(username)
     Follow.objects.get(
         user=request.user,
-        author=author,
+        author_id=author.id,
     ).delete()
     return redirect('posts:profile', username=username)
 
@@ -78,13 +114,18 @@ def profile_unfollow(request, username):
 def post_detail(request, post_id):
     """Возвращает страницу с определенным постом."""
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
+    post = get_post_or_404(post_id, archived=True)
+    counters.views.add(post)
     form = CommentForm(request.POST or None)
-    comments = post.comments.select_related('author').all()
+    threads, comments = comment_threads(request, post)
+    attach_likes([post], request.user)
     context = {
         'post': post,
+        'archived': isinstance(post, ArchivedPost),
         'form': form,
+        'threads': threads,
         'comments': comments,
+        'posts_count': author_posts_count(post.author_id),
     }
     return render(request, template, context)
 
@@ -107,7 +148,7 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     """Редактирует n-ый пост."""
-    post = get_object_or_404(Post, id=post_id)
+    post = get_post_or_404(post_id)
     form = PostForm(request.POST or None,
                     files=request.FILES or None, instance=post)
     if request.user != post.author:
@@ -130,12 +171,48 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    """Добавляет комментарий к посту."""
-    post = get_object_or_404(Post, id=post_id)
+    """Добавляет комментарий к посту или ответ на комментарий."""
+    post = get_post_or_404(post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        # Номер родителя приходит скрытым полем мимо формы: в ней
+        # только текст.
+        reply_to = request.POST.get('reply_to', '')
+        if reply_to:
+            if not reply_to.isdigit():
+                raise Http404('Комментарий не найден')
+            comment.parent = get_object_or_404(
+                post.comments.filter(hidden=False), pk=reply_to
+            )
         comment.save()
+        enqueue_comment_digest(comment)
+    return redirect('posts:post_detail', post_id=post_id)
+
+
+@login_required
+@require_POST
+def post_like(request, post_id):
+    """Ставит отметку «нравится»; повторная отметка ничего не меняет."""
+    post = get_post_or_404(post_id)
+    _, created = Like.objects.using(
+        router.db_for_write(Post, instance=post)
+    ).get_or_create(user_id=request.user.pk, post_id=post.pk)
+    if created:
+        counters.likes.add(post)
+    return redirect('posts:post_detail', post_id=post_id)
+
+
+@login_required
+@require_POST
+def post_unlike(request, post_id):
+    """Снимает отметку «нравится»."""
+    post = get_post_or_404(post_id)
+    deleted, _ = Like.objects.using(
+        router.db_for_write(Post, instance=post)
+    ).filter(user_id=request.user.pk, post_id=post.pk).delete()
+    if deleted:
+        counters.likes.add(post, -1)
     return redirect('posts:post_detail', post_id=post_id)
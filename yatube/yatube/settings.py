@@ -19,6 +19,16 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # https://docs.djangoproject.com/en/2.2/howto/static-files/
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Картинки постов раскладываются по каталогам posts/ab/cd/<sha256>.<ext>
+MEDIA_SHARD_DEPTH = 2
+MEDIA_SHARD_WIDTH = 2
+# Файлы из этих каталогов MEDIA_ROOT отдаются всем, остальные — персоналу.
+MEDIA_PUBLIC_PREFIXES = ('posts/', 'cache/')
+MEDIA_CACHE_MAX_AGE = 60 * 60
+# 'x-accel-redirect' (nginx) или 'x-sendfile' (Apache, lighttpd) передают
+# отдачу файлов веб-серверу; пустая строка — отдает сам Django.
+MEDIA_ACCEL_REDIRECT = os.getenv('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
@@ -56,10 +66,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -95,13 +106,53 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# SQLite в режиме WAL с очередью на запись (core.db.sqlite3); PRAGMA
+# соединения переопределяются в OPTIONS, например
+# 'OPTIONS': {'PRAGMAS': {'mmap_size': 0}}.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
     }
 }
 
+# Реплики только для чтения: пути к файлам через запятую в переменной
+# окружения DB_REPLICAS. Модели из REPLICA_APPS читаются с реплик, кроме
+# REPLICA_PIN_SECONDS секунд после записи пользователя (core.routers).
+DATABASE_REPLICAS = []
+for number, path in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1
+):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'core.db.sqlite3',
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+# Шарды постов и комментариев (posts.sharding): пути к файлам через
+# запятую в переменной окружения DB_SHARDS. Посты автора лежат в шарде
+# POST_SHARDS[id автора % число шардов]; пользователи, группы и подписки
+# остаются в основной базе, поэтому внешние ключи в шардах выключены.
+POST_SHARDS = []
+for number, path in enumerate(
+    filter(None, os.getenv('DB_SHARDS', '').split(',')), start=1
+):
+    DATABASES[f'shard{number}'] = {
+        'ENGINE': 'core.db.sqlite3',
+        'NAME': path,
+        'OPTIONS': {'PRAGMAS': {'foreign_keys': 'OFF'}},
+    }
+    POST_SHARDS.append(f'shard{number}')
+if POST_SHARDS:
+    POST_SHARDS.insert(0, 'default')
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+REPLICA_APPS = ('posts', 'auth')
+REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -144,17 +195,133 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 
 NUMBER_OF_POSTS = 10
 CHARS_LIMIT = 15
+# Сторона (в пикселях) встраиваемой в страницу заглушки картинки
+PLACEHOLDER_SIZE = 16
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма только ставятся в очередь (core.mail), а воркер run_tasks
+# отправляет их через QUEUED_EMAIL_BACKEND: пачками по EMAIL_BATCH_SIZE
+# через одно соединение, не быстрее EMAIL_RATE писем в секунду.
+# Отправленные и неотправленные письма хранятся EMAIL_KEEP_DAYS дней.
+EMAIL_BACKEND = 'core.mail.QueuedEmailBackend'
+QUEUED_EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+EMAIL_BATCH_SIZE = 50
+EMAIL_RATE = 10
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_DELAY = 60
+EMAIL_LEASE_SECONDS = 60 * 5
+EMAIL_KEEP_DAYS = 7
+
+# Адрес сайта для ссылок в письмах.
+SITE_URL = os.getenv('SITE_URL', 'http://127.0.0.1:8000')
+# Уведомления о комментариях собираются в одно письмо автору поста
+# за каждые столько секунд.
+COMMENT_DIGEST_WINDOW = 60 * 15
+
+# Рейтинг «Популярное» (posts.trending): за сколько часов посты в него
+# попадают, сколько баллов дают комментарий, новый подписчик автора
+# и просмотр, насколько быстро рейтинг падает с возрастом и сколько
+# постов показывать. Пересчитывает его команда refresh_trending.
+TRENDING_WINDOW_HOURS = 72
+TRENDING_COMMENT_WEIGHT = 3
+TRENDING_FOLLOW_WEIGHT = 1
+TRENDING_VIEW_WEIGHT = 0.1
+TRENDING_GRAVITY = 1.8
+TRENDING_SIZE = 50
+
+# Рекомендации подписок (posts.suggestions): сколько хранить на
+# пользователя, сколько показывать и скольких подписчиков автора
+# учитывать при расчете. Пересчитывает их команда suggest_follows.
+SUGGESTIONS_PER_USER = 10
+SUGGESTIONS_SHOWN = 5
+SUGGESTIONS_MAX_FOLLOWERS = 1000
+
+# Под постом: сколько веток комментариев на странице и до какой глубины
+# показывать ответы (глубже — по ссылке на поддерево).
+COMMENT_THREADS_PER_PAGE = 20
+COMMENT_MAX_DEPTH = 3
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Общий для всех процессов кеш в файле SQLite (см. core.cache.sqlite).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
     }
 }
+# Защита кеша от лавинного пересчета (core.cache.stampede): сколько секунд
+# отдавать устаревшее значение, пока его пересчитывают, сколько живет
+# блокировка пересчета и сколько ждать чужого пересчета при пустом кеше.
+STAMPEDE_STALE_TIMEOUT = 60
+STAMPEDE_LOCK_TIMEOUT = 10
+STAMPEDE_WAIT = 0.5
+STAMPEDE_METRICS_INTERVAL = 5
+
+# Двухуровневый кеш (core.cache.tiered): сколько ключей и сколько секунд
+# держать в памяти процесса, как часто сверяться с журналом инвалидаций
+# и сколько его записей хранить.
+TIERED_L1_MAX_ENTRIES = 1000
+TIERED_L1_TIMEOUT = 60
+TIERED_SYNC_INTERVAL = 1
+TIERED_LOG_SIZE = 1000
+TIERED_LOG_TIMEOUT = 300
+STATS_CACHE_TIMEOUT = 60 * 10
+
+# Кеш результатов запросов (core.cache.queryset): время жизни по умолчанию
+# и модели, сохранение и удаление которых инвалидирует их таблицы.
+QUERY_CACHE_TIMEOUT = 60
+QUERY_CACHE_MODELS = [
+    'posts.Post',
+    'posts.Group',
+    'posts.Comment',
+    'posts.Follow',
+    'posts.ArchivedPost',
+    'posts.ArchivedComment',
+    'auth.User',
+]
+
+# Очередь задач (core.tasks): сколько задач воркер забирает за раз, на
+# сколько секунд (аренда), сколько раз и с какой начальной задержкой
+# повторяет упавшую задачу, как часто опрашивает очередь и сколько дней
+# хранит выполненные задачи с их ключами идемпотентности.
+TASKS_BATCH_SIZE = 100
+TASKS_LEASE_SECONDS = 60 * 5
+TASKS_MAX_ATTEMPTS = 5
+TASKS_RETRY_DELAY = 30
+TASKS_POLL_INTERVAL = 1
+TASKS_KEEP_DAYS = 7
+
+# Просмотры и отметки «нравится» копятся в памяти процесса
+# (posts.counters), а фоновый поток пишет их в базу раз в столько секунд.
+COUNTERS_FLUSH_INTERVAL = 5
+
+# Размер пачки для массовых действий модератора в админке.
+MODERATION_BATCH_SIZE = 500
+
+# Посты старше стольких дней команда archive_posts переносит в архив.
+ARCHIVE_AFTER_DAYS = 365
+
+# Реестр групп в памяти процесса (posts.utils.group_registry).
+GROUPS_CACHE_TIMEOUT = 60 * 60
+
+# Записи авторов по username (posts.utils.resolve_author): сколько хранить
+# найденного автора и сколько — отметку о том, что такого нет.
+AUTHOR_CACHE_TIMEOUT = 60 * 10
+AUTHOR_MISSING_TIMEOUT = 30
+
+# Сессии читаются из кеша, а в базу пишутся только при изменении
+# (core.sessions). Истекшие удаляет команда clear_expired_sessions.
+SESSION_ENGINE = 'core.sessions'
+
+# Кеш аутентификации (core.auth): сколько хранить привязку сессии
+# к пользователю и самого пользователя.
+AUTH_SESSION_CACHE_TIMEOUT = 60 * 5
+AUTH_USER_CACHE_TIMEOUT = 60
@@ -0,0 +1,24 @@
+"""Настройки для тестов.
+
+Тесты чистят кеш, поэтому им достается свой файл SQLiteCache во
+временном каталоге, а рабочий cache.sqlite3 остается нетронутым:
+
+    python manage.py test --settings=yatube.settings_test
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+CACHE_DIR = tempfile.mkdtemp(prefix='yatube-cache-')
+atexit.register(shutil.rmtree, CACHE_DIR, ignore_errors=True)
+
+CACHES = {
+    'default': {
+        **CACHES['default'],
+        'LOCATION': os.path.join(CACHE_DIR, 'cache.sqlite3'),
+    }
+}
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Счетчики просмотров и отметок пишет в базу фоновый поток процесса;
+# каждый воркер запускает свой поток при первом учете.
+from posts.counters import enable_flusher  # noqa: E402
+
+enable_flusher()